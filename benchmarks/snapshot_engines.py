@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Compare the throughput and peak memory usage of the engines for
+decoding SDC snapshots, e.g.
+
+    $ python3 benchmarks/snapshot_engines.py snapshot.json.bz2 6000
+    engine        entries    matched    seconds    entries/sec    peak RSS (MB)
+    pydantic         6000          0        2.5         2357.7             65.4
+    msgspec          6000          0        1.1         5388.7             52.8
+
+The optional second argument is the number of entries to read; if you
+leave it out, the script reads the whole snapshot.
+
+Each engine runs in a fresh process, so the peak RSS is only measuring
+that engine.  Each run also looks for Flickr photos in the entries, so
+it includes the cost of decoding the statements, which the "msgspec"
+engine does lazily.
+
+"""
+
+import itertools
+import multiprocessing
+import multiprocessing.queues
+import resource
+import sys
+import time
+import typing
+
+from flickypedia.apis.snapshots import AnySnapshotEntry, Engine, parse_sdc_snapshot
+from flickypedia.extractr.matcher import find_matched_photos
+
+
+class BenchmarkResult(typing.TypedDict):
+    engine: Engine
+    entries: int
+    matched: int
+    seconds: float
+    peak_rss_mb: float
+
+
+def run_engine(
+    path: str,
+    engine: Engine,
+    limit: int | None,
+    results: "multiprocessing.queues.Queue[BenchmarkResult]",
+) -> None:
+    entry_count = 0
+
+    def count_entries(
+        entries: typing.Iterable[AnySnapshotEntry],
+    ) -> typing.Iterator[AnySnapshotEntry]:
+        nonlocal entry_count
+
+        for e in entries:
+            entry_count += 1
+            yield e
+
+    start = time.perf_counter()
+
+    entries = itertools.islice(parse_sdc_snapshot(path, engine=engine), limit)
+    matched = sum(1 for _ in find_matched_photos(count_entries(entries)))
+
+    elapsed = time.perf_counter() - start
+
+    # On Linux, ``ru_maxrss`` is measured in kilobytes.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    results.put(
+        {
+            "engine": engine,
+            "entries": entry_count,
+            "matched": matched,
+            "seconds": elapsed,
+            "peak_rss_mb": peak_rss / 1024,
+        }
+    )
+
+
+if __name__ == "__main__":
+    try:
+        path = sys.argv[1]
+    except IndexError:
+        sys.exit(f"Usage: {__file__} <SNAPSHOT_PATH> [LIMIT]")
+
+    try:
+        limit: int | None = int(sys.argv[2])
+    except IndexError:
+        limit = None
+
+    context = multiprocessing.get_context("spawn")
+
+    print(
+        f"{'engine':<10} {'entries':>10} {'matched':>10} {'seconds':>10} "
+        f"{'entries/sec':>14} {'peak RSS (MB)':>16}"
+    )
+
+    engine: Engine
+    for engine in ("pydantic", "msgspec"):
+        results: "multiprocessing.queues.Queue[BenchmarkResult]" = context.Queue()
+
+        p = context.Process(target=run_engine, args=(path, engine, limit, results))
+        p.start()
+        r = results.get()
+        p.join()
+
+        print(
+            f"{r['engine']:<10} {r['entries']:>10} {r['matched']:>10} "
+            f"{r['seconds']:>10.1f} {r['entries'] / r['seconds']:>14.1f} "
+            f"{r['peak_rss_mb']:>16.1f}"
+        )
@@ -9,6 +9,7 @@ to rely on heuristics rather than explicit machine-readable data.
 """
 
 import collections
+import re
 import typing
 
 import bs4
@@ -165,6 +166,133 @@ def find_flickr_photo_id_from_wikitext(
     return None
 
 
+def get_template_params(wikitext: str, *, template_name: str) -> dict[str, str]:
+    """
+    Find the first use of a template in some Wikitext, and return its
+    named parameters.  For example, in
+
+        {{Information
+         |description=A photo of a cat
+         |source=[https://www.flickr.com/photos/example/1234 Flickr]
+        }}
+
+    the ``source`` parameter is ``[https://www.flickr.com/photos/example/1234 Flickr]``.
+
+    Parameter names are lowercased.  Returns an empty dict if the
+    template isn't used.
+    """
+    start = re.search(
+        r"\{\{\s*" + re.escape(template_name) + r"\s*(?=[|}])",
+        wikitext,
+        flags=re.IGNORECASE,
+    )
+
+    if start is None:
+        return {}
+
+    # Split the body of the template on ``|`` -- but only the ones at
+    # the top level, not inside a nested template or link, e.g.
+    #
+    #     {{Information |source=[[:en:Flickr|Flickr]] |author={{Creator|Bob}}}}
+    #
+    params: list[str] = []
+    current = ""
+    depth = 0
+    i = start.end()
+
+    while i < len(wikitext):
+        pair = wikitext[i : i + 2]
+
+        if pair in {"{{", "[["}:
+            depth += 1
+            current += pair
+            i += 2
+        elif pair in {"}}", "]]"} and depth > 0:
+            depth -= 1
+            current += pair
+            i += 2
+        elif pair == "}}":
+            break
+        elif wikitext[i] == "|" and depth == 0:
+            params.append(current)
+            current = ""
+            i += 1
+        else:
+            current += wikitext[i]
+            i += 1
+
+    params.append(current)
+
+    result: dict[str, str] = {}
+
+    for p in params:
+        name, equals, value = p.partition("=")
+        if equals:
+            result.setdefault(name.strip().lower(), value.strip())
+
+    return result
+
+
+# Matches an external URL in Wikitext, either on its own or inside
+# a link like ``[https://example.com label]``.
+_EXTERNAL_URL_RE = re.compile(r"https?://[^\s\[\]|{}<>\"]+")
+
+
+def find_flickr_photo_id_from_raw_wikitext(wikitext: str) -> FindResult | None:
+    """
+    Look for a Flickr photo URL in the source of a page's Wikitext, as
+    found in the XML dumps of Wikimedia Commons.
+
+    This looks for the same patterns as
+    ``find_flickr_photo_id_from_wikitext()``, which looks at the rendered
+    HTML.  Unlike that function, it can't compare the file to the photo
+    on Flickr, so it only looks at the URLs.
+    """
+    # Look for an Information template, which may link to the Flickr
+    # photo in the "source" parameter.  For example:
+    #
+    #     |source=https://www.flickr.com/photos/stewart/253009/
+    #     |source=[https://www.flickr.com/ Flickr.com] - [https://www.flickr.com/photos/51035573370@N01/869031 image description page]
+    #     |source=[[:en:Flickr|Flickr]]: [https://www.flickr.com/photos/25834786@N03/3598534263 polling station]
+    #
+    # Links to Wikipedia aren't URLs, so we can skip them.
+    information = get_template_params(wikitext, template_name="Information")
+
+    urls = _EXTERNAL_URL_RE.findall(information.get("source", ""))
+
+    if len(urls) == 1:
+        photo_id = get_flickr_photo_id_from_url(urls[0])
+        if photo_id is not None:
+            return {"photo_id": photo_id, "url": urls[0]}
+
+    if len(urls) == 2 and is_flickr_homepage(urls[0]):
+        photo_id = get_flickr_photo_id_from_url(urls[1])
+        if photo_id is not None:
+            return {"photo_id": photo_id, "url": urls[1]}
+
+    # Now look for any links which are explicitly labelled as
+    # "Source: <URL>" in the Wikitext.  For example:
+    #
+    #     * Source: https://www.flickr.com/photos/justinaugust/3731022/
+    #     Source: [https://www.flickr.com/photos/metalphoenix/3874334/ Flickr]
+    #
+    for line_match in re.finditer(
+        r"^[*#:\s]*Source:\s*(.+?)\s*$", wikitext, flags=re.MULTILINE
+    ):
+        value = line_match.group(1)
+
+        url_match = re.fullmatch(r"(https?://\S+)|\[(https?://\S+) Flickr\]", value)
+
+        if url_match is not None:
+            url = url_match.group(1) or url_match.group(2)
+
+            photo_id = get_flickr_photo_id_from_url(url)
+            if photo_id is not None:
+                return {"photo_id": photo_id, "url": url}
+
+    return None
+
+
 def get_qualifiers(statement: ExistingStatement, *, property_id: str) -> list[Snak]:
     """
     A statement can have qualifiers:
@@ -0,0 +1,169 @@
+"""
+A Bloom filter is a compact way to record a set of strings, which can
+tell us if a string is *definitely not* in the set.  It sometimes
+says a string is in the set when it isn't (a "false positive"), but
+it never says a string isn't in the set when it is.
+
+We use it to skip looking up Flickr photo IDs in the duplicates
+databases -- most of the photos we check aren't on Commons, and
+checking the filter is much cheaper than querying SQLite.
+
+See https://en.wikipedia.org/wiki/Bloom_filter
+
+The filter is saved to disk in the format:
+
+    magic (8 bytes)
+    length of the fingerprint (4 bytes)
+    fingerprint
+    number of bits (8 bytes)
+    number of hash functions (4 bytes)
+    bits
+
+The fingerprint is chosen by the caller, and identifies the data the
+filter was built from, so we can tell if the filter is out-of-date.
+"""
+
+from collections.abc import Iterator
+import hashlib
+import math
+import mmap
+import os
+import pathlib
+import struct
+
+
+MAGIC = b"FLKBLOOM"
+
+
+class BloomFilter:
+    def __init__(
+        self,
+        *,
+        bit_count: int,
+        hash_count: int,
+        bits: bytearray | mmap.mmap,
+        offset: int = 0,
+    ) -> None:
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+
+        # The bits start at ``offset``, so we can read a filter straight
+        # from a memory-mapped file without copying the bits.
+        self.bits = bits
+        self.offset = offset
+
+    @classmethod
+    def for_capacity(
+        cls, capacity: int, *, false_positive_rate: float = 0.01
+    ) -> "BloomFilter":
+        """
+        Create an empty filter which can hold ``capacity`` strings
+        with the given false positive rate.
+
+        This uses the standard formulas for the optimal size, e.g.
+        a filter for 30M strings with a 1% false positive rate
+        is about 34MB.
+        """
+        capacity = max(capacity, 1)
+
+        bit_count = math.ceil(
+            -capacity * math.log(false_positive_rate) / (math.log(2) ** 2)
+        )
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+
+        return cls(
+            bit_count=bit_count,
+            hash_count=hash_count,
+            bits=bytearray(math.ceil(bit_count / 8)),
+        )
+
+    def _positions(self, value: str) -> Iterator[int]:
+        """
+        Generate the positions of the bits for this value.
+
+        Rather than using ``hash_count`` different hash functions, we
+        combine two halves of a single hash, which is just as good.
+        See Kirsch and Mitzenmacher, "Less Hashing, Same Performance".
+        """
+        digest = hashlib.blake2b(value.encode("utf8"), digest_size=16).digest()
+
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little")
+
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.bit_count
+
+    def add(self, value: str) -> None:
+        for pos in self._positions(value):
+            self.bits[self.offset + pos // 8] |= 1 << (pos % 8)
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self.bits[self.offset + pos // 8] & (1 << (pos % 8))
+            for pos in self._positions(value)
+        )
+
+    def write(self, path: pathlib.Path | str, *, fingerprint: bytes) -> None:
+        """
+        Save this filter to a file.
+
+        We write to a temporary file and rename it into place, so
+        a reader never sees a half-written filter.
+        """
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, "wb") as out_file:
+            out_file.write(MAGIC)
+            out_file.write(struct.pack("<I", len(fingerprint)))
+            out_file.write(fingerprint)
+            out_file.write(struct.pack("<QI", self.bit_count, self.hash_count))
+            out_file.write(
+                self.bits[self.offset : self.offset + math.ceil(self.bit_count / 8)]
+            )
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def read(cls, path: pathlib.Path | str) -> tuple["BloomFilter", bytes]:
+        """
+        Read a filter from a file, and return the filter and its fingerprint.
+
+        The file is memory-mapped rather than read into memory, so
+        every process which reads the same filter shares one copy.
+        Call ``close()`` when you're done with the filter.
+        """
+        with open(path, "rb") as in_file:
+            bits = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # If we can't read the header, we close the mapping before we
+        # throw -- otherwise it stays open until it's garbage collected.
+        try:
+            if bits[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a Bloom filter")
+
+            offset = len(MAGIC)
+
+            (fingerprint_length,) = struct.unpack_from("<I", bits, offset)
+            offset += 4
+
+            fingerprint = bits[offset : offset + fingerprint_length]
+            offset += fingerprint_length
+
+            bit_count, hash_count = struct.unpack_from("<QI", bits, offset)
+            offset += 12
+
+            if len(bits) < offset + math.ceil(bit_count / 8):
+                raise ValueError(f"{path} is truncated")
+        except BaseException:
+            bits.close()
+            raise
+
+        bloom_filter = cls(
+            bit_count=bit_count, hash_count=hash_count, bits=bits, offset=offset
+        )
+
+        return bloom_filter, fingerprint
+
+    def close(self) -> None:
+        if isinstance(self.bits, mmap.mmap):
+            self.bits.close()
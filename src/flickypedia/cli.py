@@ -40,15 +40,54 @@ def run_dev_server(port: int, host: str, debug: bool) -> None:
 
 
 @main.command(help="Run the background worker for uploads.")
-def run_background_worker() -> None:
+@click.option(
+    "--workers",
+    help="The number of worker processes to run.",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+)
+@click.option(
+    "--max-workers",
+    help="Start extra workers when the queue is busy, up to this many.",
+    type=click.IntRange(min=1),
+)
+def run_background_worker(workers: int, max_workers: int | None) -> None:
     from flickypedia.uploadr import create_app
     from flickypedia.uploadr.uploads import uploads_queue
+    from flickypedia.worker_pool import WorkerPool
+
+    if max_workers is not None and max_workers < workers:
+        sys.exit("--max-workers can't be less than --workers")
 
     app = create_app()
 
     with app.app_context():
         q = uploads_queue()
-        q.process_tasks()
+
+    if workers == 1 and max_workers is None:
+        with app.app_context():
+            q.process_tasks()
+        return
+
+    # Each worker is a forked copy of this process, and runs the
+    # same loop as a single worker.
+    def run_worker() -> None:
+        with app.app_context():
+            q.process_tasks()
+
+    # We count tasks that are in progress as well as waiting, so we
+    # don't retire workers while they're still busy.
+    pool = WorkerPool(
+        run_worker,
+        min_workers=workers,
+        max_workers=max_workers,
+        get_queue_depth=lambda: q.count_tasks("waiting") + q.count_tasks("in_progress"),
+        logger=q.logger,
+    )
+
+    print(f"Supervising background workers in {q.base_dir}...")
+    pool.run()
 
 
 main.add_command(backfillr_cli)
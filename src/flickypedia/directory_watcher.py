@@ -0,0 +1,178 @@
+"""
+Wait for new files to appear in a directory.
+
+On Linux we use inotify [1], so a waiting process wakes up as soon as
+a file is created in (or renamed into) the directory, and uses no CPU
+while it's idle.  There's no inotify library in our dependencies, so
+we call the three functions we need from libc with ``ctypes``.
+
+If inotify isn't available -- e.g. we're on macOS, or we've hit the
+per-user limit on inotify instances -- we fall back to polling the
+modification time of the directory, which changes whenever a file
+is added to it.
+
+[1]: https://man7.org/linux/man-pages/man7/inotify.7.html
+
+"""
+
+import ctypes
+import os
+import pathlib
+import select
+import time
+
+
+# These constants come from <sys/inotify.h>
+IN_CREATE = 0x00000100
+IN_MOVED_TO = 0x00000080
+
+
+# How often we check the directory if we can't use inotify.
+POLL_INTERVAL = 0.1
+
+
+def _create_inotify_watch(path: pathlib.Path) -> int:
+    """
+    Create a non-blocking inotify file descriptor which becomes readable
+    when a file is created in or moved into ``path``.
+
+    Throws an OSError if inotify isn't available.
+    """
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (AttributeError, OSError) as exc:  # pragma: no cover
+        raise OSError(f"inotify is not available: {exc}")
+
+    fd: int = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    if fd < 0:  # pragma: no cover
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    wd = inotify_add_watch(fd, os.fsencode(path), IN_CREATE | IN_MOVED_TO)
+
+    if wd < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, os.strerror(errno), str(path))
+
+    return fd
+
+
+class DirectoryWatcher:
+    """
+    Watches a directory for new files.
+
+    Any files which arrive after the watcher is created will wake up
+    the next call to ``wait()``, so create the watcher *before* you
+    check the directory, or you might miss a file that arrives in
+    between.
+    """
+
+    def __init__(self, path: pathlib.Path, *, use_inotify: bool = True) -> None:
+        self.path = path
+
+        self._inotify_fd: int | None = None
+
+        if use_inotify:
+            try:
+                self._inotify_fd = _create_inotify_watch(path)
+            except OSError:
+                pass
+
+        self._last_mtime = self._get_mtime()
+
+        # A pipe which ``wake()`` writes to, so another thread or a signal
+        # handler can interrupt a call to ``wait()``.
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify_fd is not None
+
+    def _get_mtime(self) -> int | None:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait up to ``timeout`` seconds for a new file to arrive, or for
+        somebody to call ``wake()``.
+
+        Returns True if something may have changed in the directory,
+        False if we timed out.  It can return True when there's nothing
+        new to pick up (e.g. another process got there first), so the
+        caller should always look in the directory to see what's there.
+        """
+        if self._inotify_fd is not None:
+            return self._wait_for_inotify(self._inotify_fd, timeout)
+        else:
+            return self._wait_for_mtime(timeout)
+
+    def wake(self) -> None:
+        """
+        Interrupt the current (or next) call to ``wait()``.
+
+        This is safe to call from a signal handler.
+        """
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:  # pragma: no cover
+            # The pipe is full, so there's already a wakeup pending.
+            pass
+
+    def _select(self, fds: list[int], timeout: float) -> list[int]:
+        """
+        Wait until one of these file descriptors (or the wake pipe) is
+        readable, then drain them and return the ones that were readable.
+
+        The file descriptors are non-blocking, so if another thread
+        drained them first, we get an error rather than hanging here.
+        """
+        readable, _, _ = select.select(fds + [self._wake_r], [], [], timeout)
+
+        for fd in readable:
+            while True:
+                try:
+                    if not os.read(fd, 4096):  # pragma: no cover
+                        break
+                except BlockingIOError:
+                    break
+
+        return readable
+
+    def _wait_for_inotify(self, fd: int, timeout: float) -> bool:
+        # We don't care what the events are, only that something happened.
+        return bool(self._select([fd], timeout))
+
+    def _wait_for_mtime(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+
+        while True:
+            mtime = self._get_mtime()
+
+            if mtime != self._last_mtime:
+                self._last_mtime = mtime
+                return True
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                return False
+
+            if self._select([], timeout=min(POLL_INTERVAL, remaining)):
+                return True
+
+    def close(self) -> None:
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+        os.close(self._wake_r)
+        os.close(self._wake_w)
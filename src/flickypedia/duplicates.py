@@ -2,7 +2,10 @@
 This file implements the duplicate detection logic for Flickypedia.
 
 This tool looks at SQLite databases in DUPLICATE_DATABASE_DIRECTORY.
-These databases should have a table ``flickr_photos_on_wikimedia`` like:
+These databases can use one of two layouts.
+
+The original layout has a single table, which records one file on
+Wikimedia Commons for each Flickr photo:
 
     CREATE TABLE flickr_photos_on_wikimedia (
         flickr_photo_id TEXT PRIMARY KEY,
@@ -10,10 +13,41 @@ These databases should have a table ``flickr_photos_on_wikimedia`` like:
         wikimedia_page_id TEXT NOT NULL
     )
 
+The "multi-valued" layout records every copy of a Flickr photo, and
+stores the IDs as integers rather than strings:
+
+    CREATE TABLE flickr_photos (
+        flickr_photo_id INTEGER PRIMARY KEY,
+        flickr_user_id TEXT
+    )
+
+    CREATE TABLE wikimedia_pages (
+        page_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL
+    )
+
+    CREATE TABLE flickr_photo_pages (
+        flickr_photo_id INTEGER NOT NULL,
+        page_id INTEGER NOT NULL,
+        PRIMARY KEY (flickr_photo_id, page_id)
+    ) WITHOUT ROWID
+
+Here ``page_id`` is the numeric part of the M-ID, e.g. ``29907038``
+for ``M29907038``.  The ``flickr_photo_pages`` table is stored as
+a single B-tree sorted by Flickr photo ID, so all the copies of a photo
+are next to each other, and we can find them with a single lookup.
+
+Files with the extension ``.ids`` aren't SQLite databases, but a
+"sorted ID index" -- a memory-mapped array of Flickr photo IDs, see
+``flickypedia.sorted_id_index``.  These can be created from either
+SQLite layout with ``flickypedia extractr create-sorted-id-index``.
+
 These databases can come from two places:
 
 *   The Wikimedia Commons snapshot.  We create a database from the snapshot
-    using scripts elsewhere in this repo (see ``duplicates_from_sdc``).
+    with ``flickypedia extractr create-duplicates-database-from-sdc``,
+    which uses the multi-valued layout, or the older scripts in
+    ``duplicates_from_sdc``, which use the original layout.
 
     These snapshots are updated weekly by WMC at best, so they may be
     a bit behind the latest uploads.
@@ -22,14 +56,30 @@ These databases can come from two places:
     in a dedicated database.  This acts as a ledger of Flickypedia activity
     and prevents double-uploads by the tool.
 
+If there's a "generation manifest" (``generation.json``) in the
+directory, we only look at the databases it lists, plus the database
+of files uploaded by Flickypedia.  This lets us swap in a new snapshot
+without restarting the app, and without ever looking at both the old
+and new snapshots -- see ``publish_duplicate_databases``.
+
 """
 
+from collections.abc import Iterator
 import contextlib
+import hashlib
+import itertools
+import json
 import os
 import sqlite3
+import struct
+import threading
 import typing
 
 from flask import current_app
+from nitrate.types import read_typed_json
+
+from flickypedia.bloom_filter import BloomFilter
+from flickypedia.sorted_id_index import SortedIdIndex, write_sorted_id_index
 
 
 class DuplicateInfo(typing.TypedDict):
@@ -37,7 +87,427 @@ class DuplicateInfo(typing.TypedDict):
     title: str
 
 
-def find_duplicates(flickr_photo_ids: list[str]) -> dict[str, DuplicateInfo]:
+# Duplicates databases with this extension use the format described
+# in ``flickypedia.sorted_id_index``, rather than SQLite.
+SORTED_ID_INDEX_SUFFIX = ".ids"
+
+
+# The database where Flickypedia records the files it's uploaded.
+UPLOADS_DATABASE = "flickypedia_uploads.db"
+
+GENERATION_MANIFEST = "generation.json"
+
+
+class GenerationManifest(typing.TypedDict):
+    # Goes up by one every time we publish a new set of databases
+    generation: int
+
+    # The names of the databases in this generation, relative to
+    # DUPLICATE_DATABASE_DIRECTORY
+    databases: list[str]
+
+
+def read_generation_manifest(duplicate_dir: str) -> GenerationManifest | None:
+    """
+    Returns the generation manifest for a directory, or None if it
+    doesn't have one.
+
+    Throws a ``ValidationError`` if the manifest is malformed.
+    """
+    try:
+        return read_typed_json(
+            os.path.join(duplicate_dir, GENERATION_MANIFEST), model=GenerationManifest
+        )
+    except FileNotFoundError:
+        return None
+
+
+def publish_duplicate_databases(
+    duplicate_dir: str, names: list[str]
+) -> GenerationManifest:
+    """
+    Start a new generation of duplicates databases, which contains
+    exactly the named databases.
+
+    The manifest is replaced in a single atomic rename, so every lookup
+    sees either the old generation or the new one, never a mixture.
+    Running processes switch to the new generation on their next lookup,
+    and close their connections to the old databases.
+
+    Don't delete the old databases until every process has picked up
+    the new generation -- a lookup which started before the switch may
+    still need to open them, and would fail if they've gone.
+    """
+    for name in names:
+        if os.path.sep in name or not os.path.isfile(os.path.join(duplicate_dir, name)):
+            raise ValueError(f"No database named {name!r} in {duplicate_dir}")
+
+    old_manifest = read_generation_manifest(duplicate_dir)
+
+    manifest: GenerationManifest = {
+        "generation": 1 if old_manifest is None else old_manifest["generation"] + 1,
+        "databases": names,
+    }
+
+    manifest_path = os.path.join(duplicate_dir, GENERATION_MANIFEST)
+    tmp_path = manifest_path + ".tmp"
+
+    with open(tmp_path, "w") as out_file:
+        json.dump(manifest, out_file, indent=2)
+
+    os.replace(tmp_path, manifest_path)
+
+    return manifest
+
+
+def get_duplicate_database_names(duplicate_dir: str) -> list[str]:
+    """
+    Returns the names of the duplicates databases in a directory.
+
+    If there's a generation manifest, this is the databases in the
+    current generation; otherwise it's every database in the directory.
+    """
+    manifest = read_generation_manifest(duplicate_dir)
+
+    if manifest is not None:
+        names = list(manifest["databases"])
+
+        if UPLOADS_DATABASE not in names and os.path.exists(
+            os.path.join(duplicate_dir, UPLOADS_DATABASE)
+        ):
+            names.append(UPLOADS_DATABASE)
+
+        return names
+
+    names = []
+
+    for name in os.listdir(duplicate_dir):
+        if name == ".DS_Store":
+            print(f"Ignoring file {name} which doesn't look like a SQLite database")
+            continue
+
+        if not name.endswith((".db", ".sqlite", SORTED_ID_INDEX_SUFFIX)):
+            continue
+
+        names.append(name)
+
+    return names
+
+
+def get_duplicate_databases(duplicate_dir: str | None = None) -> Iterator[str]:
+    """
+    Generate the path to every duplicates database in a directory,
+    by default DUPLICATE_DATABASE_DIRECTORY.
+    """
+    if duplicate_dir is None:
+        duplicate_dir = current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
+
+    for name in get_duplicate_database_names(duplicate_dir):
+        yield os.path.join(duplicate_dir, name)
+
+
+def get_duplicates_generation() -> str:
+    """
+    Returns a string which changes whenever the answer to
+    ``find_duplicates`` might change -- when a database is added,
+    removed, replaced or written to.
+
+    This is useful for caching the results of ``find_duplicates``.
+    """
+    h = hashlib.sha256()
+
+    for db_path in get_duplicate_databases():
+        h.update(os.path.basename(db_path).encode("utf8"))
+
+        # In WAL mode (as used by the database of Flickypedia uploads),
+        # new writes go to the ``-wal`` file, and don't change the
+        # database file until the next checkpoint.
+        for path in (db_path, db_path + "-wal"):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            h.update(f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+
+    return h.hexdigest()
+
+
+# How much of each database SQLite should read through a memory map,
+# rather than with read() calls.  This is an upper bound; SQLite only
+# maps as much of the file as exists.
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+def get_bloom_filter_path(db_path: str) -> str:
+    """
+    Returns the path to the Bloom filter for a duplicates database.
+    """
+    return db_path + ".bloom"
+
+
+def get_database_fingerprint(db_path: str) -> bytes:
+    """
+    Returns a fingerprint of the contents of a SQLite database, which
+    we store in its Bloom filter, so we can tell if the filter is out
+    of date.
+
+    This is the size of the file and the "file change counter" and
+    "schema cookie" from the database header, which SQLite updates
+    whenever it writes to the database.
+    See https://www.sqlite.org/fileformat.html#the_database_header
+
+    Unlike the inode or modification time, this stays the same if
+    the database is copied or renamed.
+    """
+    with open(db_path, "rb") as in_file:
+        header = in_file.read(100)
+
+    return struct.pack("<Q", os.path.getsize(db_path)) + header[24:28] + header[40:44]
+
+
+def create_bloom_filter(db_path: str) -> int:
+    """
+    Create a Bloom filter of all the Flickr photo IDs in a duplicates
+    database, and save it next to the database.
+
+    Returns the number of IDs in the filter.
+    """
+    uri = f"file:{db_path}?mode=ro"
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as con:
+        if is_multi_valued_database(con):
+            query = "SELECT CAST(flickr_photo_id AS TEXT) FROM flickr_photos"
+        else:
+            query = "SELECT flickr_photo_id FROM flickr_photos_on_wikimedia"
+
+        (count,) = con.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()
+
+        bloom_filter = BloomFilter.for_capacity(count)
+
+        for (flickr_photo_id,) in con.execute(query):
+            bloom_filter.add(flickr_photo_id)
+
+    bloom_filter.write(
+        get_bloom_filter_path(db_path), fingerprint=get_database_fingerprint(db_path)
+    )
+
+    assert isinstance(count, int)
+    return count
+
+
+def create_sorted_id_index(db_path: str) -> tuple[str, int]:
+    """
+    Convert a SQLite duplicates database into a sorted ID index, which
+    is saved next to it with the extension ``.ids``.
+
+    Returns the path to the index, and the number of entries in it.
+    """
+    index_path = os.path.splitext(db_path)[0] + SORTED_ID_INDEX_SUFFIX
+
+    uri = f"file:{db_path}?mode=ro"
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as con:
+        if is_multi_valued_database(con):
+            query = """
+                SELECT p.flickr_photo_id, p.page_id, w.title
+                FROM flickr_photo_pages AS p
+                JOIN wikimedia_pages AS w ON w.page_id = p.page_id
+                ORDER BY p.flickr_photo_id, p.page_id
+            """
+        else:
+            # The IDs are stored as text in the original layout, so we
+            # have to sort them as numbers.
+            query = """
+                SELECT
+                    CAST(flickr_photo_id AS INTEGER),
+                    CAST(SUBSTR(wikimedia_page_id, 2) AS INTEGER),
+                    wikimedia_page_title
+                FROM flickr_photos_on_wikimedia
+                ORDER BY CAST(flickr_photo_id AS INTEGER)
+            """
+
+        count = write_sorted_id_index(index_path, con.execute(query))
+
+    return index_path, count
+
+
+def _load_bloom_filter(db_path: str) -> BloomFilter | None:
+    """
+    Load the Bloom filter for a duplicates database, if there is one
+    and it matches the current contents of the database.
+    """
+    try:
+        bloom_filter, fingerprint = BloomFilter.read(get_bloom_filter_path(db_path))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if fingerprint != get_database_fingerprint(db_path):
+        bloom_filter.close()
+        return None
+
+    return bloom_filter
+
+
+class DuplicateDatabase(typing.NamedTuple):
+    con: sqlite3.Connection
+
+    # A filter of all the Flickr photo IDs in this database, if there
+    # is one.  If an ID isn't in the filter, it isn't in the database,
+    # and we don't need to query SQLite.
+    bloom_filter: BloomFilter | None
+
+
+def _get_signature(path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+class _PooledDatabase(typing.NamedTuple):
+    # The inode and modification time of the database and its Bloom
+    # filter when we opened them -- if either changes, the file has been
+    # replaced or modified, and we open it again.
+    signature: tuple[tuple[int, int] | None, tuple[int, int] | None]
+    database: DuplicateDatabase | SortedIdIndex
+
+
+# Opening a connection means reading the database header and schema,
+# which is a significant part of the cost of looking up a handful of
+# photos.  We keep the connections open between requests instead.
+#
+# The connections are per-thread rather than shared across the process,
+# because a sqlite3 connection can't be used from more than one thread.
+_pool = threading.local()
+
+
+def _get_pool() -> dict[str, _PooledDatabase]:
+    try:
+        pool: dict[str, _PooledDatabase] = _pool.databases
+    except AttributeError:
+        pool = _pool.databases = {}
+
+    return pool
+
+
+def _close_database(database: DuplicateDatabase | SortedIdIndex) -> None:
+    if isinstance(database, SortedIdIndex):
+        database.close()
+        return
+
+    database.con.close()
+
+    if database.bloom_filter is not None:
+        database.bloom_filter.close()
+
+
+def get_pooled_database(db_path: str) -> DuplicateDatabase | SortedIdIndex:
+    """
+    Returns a read-only connection to a duplicates database, and its
+    Bloom filter (if any) -- or if it's a sorted ID index, the index.
+
+    The connection is kept open and reused by later calls, until the
+    database file or its filter is replaced or modified.  Callers
+    shouldn't close it.
+    """
+    signature = (
+        _get_signature(db_path),
+        _get_signature(get_bloom_filter_path(db_path)),
+    )
+
+    if signature[0] is None:
+        raise FileNotFoundError(db_path)
+
+    pool = _get_pool()
+
+    try:
+        pooled = pool[db_path]
+    except KeyError:
+        pass
+    else:
+        if pooled.signature == signature:
+            return pooled.database
+
+        _close_database(pooled.database)
+        del pool[db_path]
+
+    if db_path.endswith(SORTED_ID_INDEX_SUFFIX):
+        index = SortedIdIndex(db_path)
+        pool[db_path] = _PooledDatabase(signature=signature, database=index)
+        return index
+
+    # Open a SQLite database in read-only mode.  We also set ``query_only``,
+    # so we can't write to it even if it's opened without ``mode=ro``.
+    uri = f"file:{db_path}?mode=ro"
+    con = sqlite3.connect(uri, uri=True)
+    con.execute("PRAGMA query_only = ON")
+    con.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+
+    database = DuplicateDatabase(con=con, bloom_filter=_load_bloom_filter(db_path))
+
+    pool[db_path] = _PooledDatabase(signature=signature, database=database)
+
+    return database
+
+
+def close_pooled_databases() -> None:
+    """
+    Close all the pooled connections opened by this thread.
+    """
+    pool = _get_pool()
+
+    for pooled in pool.values():
+        _close_database(pooled.database)
+
+    pool.clear()
+
+
+def get_pooled_databases(
+    duplicate_dir: str | None = None,
+) -> Iterator[DuplicateDatabase | SortedIdIndex]:
+    """
+    Generate a read-only connection to every duplicates database in
+    a directory, by default DUPLICATE_DATABASE_DIRECTORY.
+
+    Once we've looked at every database, we close any pooled connections
+    to databases which have been removed from the directory.
+    """
+    if duplicate_dir is None:
+        duplicate_dir = current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
+
+    db_paths = set()
+
+    for db_path in get_duplicate_databases(duplicate_dir):
+        db_paths.add(db_path)
+        yield get_pooled_database(db_path)
+
+    pool = _get_pool()
+
+    # Note: the directory may be a ``pathlib.Path`` (as it is in the
+    # app config) or a relative path, so we normalise both sides before
+    # comparing -- otherwise we'd never close anything.
+    abs_duplicate_dir = os.path.abspath(duplicate_dir)
+
+    for db_path in set(pool) - db_paths:
+        if os.path.abspath(os.path.dirname(db_path)) == abs_duplicate_dir:
+            _close_database(pool.pop(db_path).database)
+
+
+def is_multi_valued_database(con: sqlite3.Connection) -> bool:
+    """
+    Returns True if this database uses the multi-valued layout.
+    """
+    cur = con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'flickr_photo_pages'"
+    )
+
+    return cur.fetchone() is not None
+
+
+def find_duplicates(
+    flickr_photo_ids: list[str], *, duplicate_dir: str | None = None
+) -> dict[str, DuplicateInfo]:
     """
     Given a list of Flickr photo IDs, return the duplicates files found
     on Wikimedia Commons.
@@ -51,50 +521,193 @@ def find_duplicates(flickr_photo_ids: list[str]) -> dict[str, DuplicateInfo]:
         >>> find_duplicates(flickr_photo_ids=['9999819294'])
         {"9999819294": {"id": "M29907038", "title": "File:Museu da Ciência (9999819294).jpg"}}
 
+    If a photo is on Commons more than once, this returns the first
+    copy -- use ``find_all_duplicates`` to get all of them.
+
+    By default this looks in DUPLICATE_DATABASE_DIRECTORY, but you can
+    pass ``duplicate_dir`` to use it outside the web app.
+    """
+    all_duplicates = find_all_duplicates(flickr_photo_ids, duplicate_dir=duplicate_dir)
+
+    return {photo_id: duplicates[0] for photo_id, duplicates in all_duplicates.items()}
+
+
+# How many IDs we look up in a single query.  There's no hard limit,
+# because the IDs are passed as a single JSON parameter, but this stops
+# a huge batch from building a huge temporary table in SQLite.
+IDS_PER_QUERY = 10000
+
+
+def _find_in_sqlite_database(
+    database: DuplicateDatabase, flickr_photo_ids: list[str]
+) -> list[tuple[str, str, str]]:
+    """
+    Returns the (Flickr photo ID, title, M-ID) of every copy of these
+    photos in a SQLite duplicates database.
+    """
+    con, bloom_filter = database
+
+    # Most of the photos we look up aren't on Commons -- if the
+    # Bloom filter tells us a photo isn't in this database, we
+    # don't need to ask SQLite.
+    if bloom_filter is None:
+        candidate_ids = flickr_photo_ids
+    else:
+        candidate_ids = [
+            photo_id for photo_id in flickr_photo_ids if photo_id in bloom_filter
+        ]
+
+    if not candidate_ids:
+        return []
+
+    # We pass the IDs as a single JSON array, and unpack it with
+    # ``json_each``.  This means the SQL is always the same, so SQLite
+    # only has to parse and plan it once -- the sqlite3 module keeps
+    # a cache of prepared statements on each connection.
+    #
+    # The IDs are stored as integers in the multi-valued layout,
+    # so we convert them back to strings.
+    if is_multi_valued_database(con):
+        query = """
+            SELECT CAST(p.flickr_photo_id AS TEXT),w.title,'M' || w.page_id
+            FROM flickr_photo_pages AS p
+            JOIN wikimedia_pages AS w ON w.page_id = p.page_id
+            WHERE p.flickr_photo_id IN (SELECT value FROM json_each(?))
+            ORDER BY p.flickr_photo_id, p.page_id;
+        """
+    else:
+        query = """
+            SELECT flickr_photo_id,wikimedia_page_title,wikimedia_page_id
+            FROM flickr_photos_on_wikimedia
+            WHERE flickr_photo_id IN (SELECT value FROM json_each(?));
+        """
+
+    rows: list[tuple[str, str, str]] = []
+
+    for batch in itertools.batched(candidate_ids, IDS_PER_QUERY):
+        rows.extend(con.execute(query, (json.dumps(batch),)))
+
+    return rows
+
+
+def _find_in_sorted_id_index(
+    index: SortedIdIndex, flickr_photo_ids: list[str]
+) -> list[tuple[str, str, str]]:
+    """
+    Returns the (Flickr photo ID, title, M-ID) of every copy of these
+    photos in a sorted ID index.
+    """
+    # The index stores the IDs as integers, so we remember how each
+    # ID was written, to return it in the same form.
+    ids_by_number = {
+        int(photo_id): photo_id for photo_id in flickr_photo_ids if photo_id.isdigit()
+    }
+
+    return [
+        (ids_by_number[flickr_photo_id], title, f"M{page_id}")
+        for flickr_photo_id, page_id, title in index.find(ids_by_number)
+    ]
+
+
+def find_all_duplicates(
+    flickr_photo_ids: list[str], *, duplicate_dir: str | None = None
+) -> dict[str, list[DuplicateInfo]]:
+    """
+    Given a list of Flickr photo IDs, return every copy of those photos
+    found on Wikimedia Commons.
+
+        >>> find_all_duplicates(flickr_photo_ids=['9999819294'])
+        {"9999819294": [{"id": "M29907038", "title": "File:Museu da Ciência (9999819294).jpg"}, …]}
+
+    Databases which use the original layout only know about one copy
+    of each photo.
+
+    Large batches are split into smaller queries automatically.
     """
     if not flickr_photo_ids:
         return {}
 
-    duplicate_dir = current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
+    result: dict[str, list[DuplicateInfo]] = {}
 
-    result: dict[str, DuplicateInfo] = {}
+    expected_ids = set(flickr_photo_ids)
 
-    for name in os.listdir(duplicate_dir):
-        if name == ".DS_Store":
-            print(f"Ignoring file {name} which doesn't look like a SQLite database")
-            continue
+    for database in get_pooled_databases(duplicate_dir):
+        if isinstance(database, SortedIdIndex):
+            rows = _find_in_sorted_id_index(database, flickr_photo_ids)
+        else:
+            rows = _find_in_sqlite_database(database, flickr_photo_ids)
 
-        if not name.endswith((".db", ".sqlite")):
-            continue
+        for flickr_photo_id, title, page_id in rows:
+            assert flickr_photo_id in expected_ids
 
-        # Open a SQLite database in read-only mode, and close it when you're done.
-        #
-        # Note that the ``connect()`` context manager doesn't do this --
-        # see https://blog.rtwilson.com/a-python-sqlite3-context-manager-gotcha/
-        uri = f"file:{os.path.join(duplicate_dir, name)}?mode=ro"
-        with contextlib.closing(sqlite3.connect(uri, uri=True)) as con:
-            cur = con.cursor()
+            _add_duplicate(result, flickr_photo_id, title=title, page_id=page_id)
 
-            query = ",".join(flickr_photo_ids)
+    return result
 
-            cur.execute(
-                f"""
-                SELECT flickr_photo_id,wikimedia_page_title,wikimedia_page_id
-                FROM flickr_photos_on_wikimedia
-                WHERE flickr_photo_id IN ({query});
-                """
-            )
 
-            titles = [d[0] for d in cur.description]
+def _add_duplicate(
+    result: dict[str, list[DuplicateInfo]],
+    flickr_photo_id: str,
+    *,
+    title: str,
+    page_id: str,
+) -> None:
+    """
+    Add a copy of a Flickr photo to a set of results, unless we've
+    already seen that file.
+    """
+    duplicates = result.setdefault(flickr_photo_id, [])
+
+    # The same file may be in more than one database, e.g.
+    # if it was uploaded by Flickypedia and then appeared
+    # in the next snapshot.
+    if all(d["id"] != page_id for d in duplicates):
+        duplicates.append({"title": title, "id": page_id})
+
+
+def find_duplicates_for_user(
+    flickr_user_id: str, *, duplicate_dir: str | None = None
+) -> dict[str, list[DuplicateInfo]]:
+    """
+    Given the NSID of a Flickr user, return every copy of their photos
+    which we know is on Wikimedia Commons.
+
+    The result is a dictionary in the same format as ``find_all_duplicates``.
 
-            for row in cur.fetchall():
-                row = dict(zip(titles, row))
+        >>> find_duplicates_for_user(flickr_user_id="44124385307@N01")
+        {"869031": [{"id": "M34511", "title": "File:Kees de Vos.jpg"}, …]}
 
-                assert row["flickr_photo_id"] in flickr_photo_ids
-                result[row["flickr_photo_id"]] = {
-                    "title": row["wikimedia_page_title"],
-                    "id": row["wikimedia_page_id"],
-                }
+    Only databases which use the multi-valued layout are searched --
+    the original layout and sorted ID indexes don't record who took
+    each photo.
+    """
+    result: dict[str, list[DuplicateInfo]] = {}
+
+    for database in get_pooled_databases(duplicate_dir):
+        if isinstance(database, SortedIdIndex):
+            continue
+
+        con = database.con
+
+        if not is_multi_valued_database(con):
+            continue
+
+        # This uses the index on ``flickr_user_id``, so it only
+        # reads the rows for this user.
+        cur = con.execute(
+            """
+            SELECT CAST(f.flickr_photo_id AS TEXT),w.title,'M' || w.page_id
+            FROM flickr_photos AS f
+            JOIN flickr_photo_pages AS p ON p.flickr_photo_id = f.flickr_photo_id
+            JOIN wikimedia_pages AS w ON w.page_id = p.page_id
+            WHERE f.flickr_user_id = ?
+            ORDER BY p.flickr_photo_id, p.page_id;
+            """,
+            (flickr_user_id,),
+        )
+
+        for flickr_photo_id, title, page_id in cur.fetchall():
+            _add_duplicate(result, flickr_photo_id, title=title, page_id=page_id)
 
     return result
 
@@ -130,6 +743,129 @@ def create_link_to_commons(duplicates: list[DuplicateInfo]) -> str:
         return f"https://commons.wikimedia.org/wiki/Special:MediaSearch?type=image&search=pageid:{'|'.join(page_ids)}"
 
 
+# The uploads database is written by the upload workers while the web
+# app reads it, so we keep it in WAL mode -- readers don't block the
+# writer, and the writer doesn't block readers.  With WAL, we only
+# need to fsync at checkpoints, not on every commit.
+#
+# Each thread keeps a long-lived connection for writing, so we don't
+# reconnect and re-check the schema for every upload.
+_ledger = threading.local()
+
+
+class _LedgerConnection(typing.NamedTuple):
+    # The inode and modification time of the database when we opened
+    # it, so we notice if it's deleted or replaced.
+    signature: tuple[int, int] | None
+    con: sqlite3.Connection
+
+
+def _get_ledger_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Returns a connection for writing to the uploads database.
+    """
+    try:
+        connections: dict[str, _LedgerConnection] = _ledger.connections
+    except AttributeError:
+        connections = _ledger.connections = {}
+
+    signature = _get_signature(db_path)
+
+    # In WAL mode, commits don't change the modification time of the
+    # database, so we only compare the inode.
+    try:
+        existing = connections[db_path]
+    except KeyError:
+        pass
+    else:
+        if (
+            existing.signature is not None
+            and signature is not None
+            and existing.signature[0] == signature[0]
+        ):
+            return existing.con
+
+        existing.con.close()
+        del connections[db_path]
+
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flickr_photos_on_wikimedia (
+            flickr_photo_id TEXT PRIMARY KEY,
+            wikimedia_page_title TEXT NOT NULL,
+            wikimedia_page_id TEXT NOT NULL
+        )
+        """
+    )
+    con.commit()
+
+    connections[db_path] = _LedgerConnection(signature=_get_signature(db_path), con=con)
+
+    return con
+
+
+def _write_to_ledger(db_path: str, rows: list[tuple[str, str, str]]) -> None:
+    """
+    Write rows to the uploads database in a single transaction.
+
+    If a photo is already in the database (e.g. if it was uploaded
+    twice), we keep the newest copy.
+    """
+    if not rows:
+        return
+
+    con = _get_ledger_connection(db_path)
+
+    with con:
+        con.executemany(
+            """
+            INSERT INTO flickr_photos_on_wikimedia VALUES(?, ?, ?)
+            ON CONFLICT (flickr_photo_id) DO UPDATE SET
+                wikimedia_page_title = excluded.wikimedia_page_title,
+                wikimedia_page_id = excluded.wikimedia_page_id
+            """,
+            rows,
+        )
+
+
+@contextlib.contextmanager
+def batch_uploads_ledger_writes(*, max_rows: int = 100) -> Iterator[None]:
+    """
+    Within this block, ``record_file_created_by_flickypedia`` saves up
+    its writes, and commits them in one transaction once it has
+    ``max_rows`` rows, and at the end of the block -- even if there's
+    an exception.
+
+    Use this around a bulk import, so it doesn't take the write lock
+    for every row.  Note that the files aren't visible to ``find_duplicates``
+    until they're committed, and they're lost if the process dies before
+    then -- so don't use this around real uploads, where we need to know
+    about every file as soon as it's created.
+    """
+    # If we're already in a batch, the outer batch will write these rows.
+    if hasattr(_ledger, "pending"):
+        yield
+        return
+
+    duplicate_dir = current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
+    db_path = os.path.join(duplicate_dir, UPLOADS_DATABASE)
+
+    pending: list[tuple[str, str, str]] = []
+    _ledger.pending = pending
+    _ledger.max_pending_rows = max_rows
+
+    try:
+        yield
+    finally:
+        del _ledger.pending
+        del _ledger.max_pending_rows
+        _write_to_ledger(db_path, pending)
+
+
 def record_file_created_by_flickypedia(
     flickr_photo_id: str, wikimedia_page_title: str, wikimedia_page_id: str
 ) -> None:
@@ -139,28 +875,24 @@ def record_file_created_by_flickypedia(
 
     This will prevent a user accidentally uploading the same file twice
     in quick succession.
+
+    If this is called inside ``batch_uploads_ledger_writes()``, the entry
+    is written with the rest of the batch; otherwise it's written immediately.
     """
     assert wikimedia_page_title.startswith("File:")
 
     duplicate_dir = current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
-    db_path = os.path.join(duplicate_dir, "flickypedia_uploads.db")
+    db_path = os.path.join(duplicate_dir, UPLOADS_DATABASE)
 
-    with contextlib.closing(sqlite3.connect(db_path)) as con:
-        cur = con.cursor()
+    row = (flickr_photo_id, wikimedia_page_title, wikimedia_page_id)
 
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS flickr_photos_on_wikimedia (
-                flickr_photo_id TEXT PRIMARY KEY,
-                wikimedia_page_title TEXT NOT NULL,
-                wikimedia_page_id TEXT NOT NULL
-            )
-            """
-        )
-
-        cur.execute(
-            "INSERT INTO flickr_photos_on_wikimedia VALUES(?, ?, ?)",
-            (flickr_photo_id, wikimedia_page_title, wikimedia_page_id),
-        )
+    try:
+        pending: list[tuple[str, str, str]] = _ledger.pending
+    except AttributeError:
+        _write_to_ledger(db_path, [row])
+    else:
+        pending.append(row)
 
-        con.commit()
+        if len(pending) >= _ledger.max_pending_rows:
+            _write_to_ledger(db_path, pending)
+            pending.clear()
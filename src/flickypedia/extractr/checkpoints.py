@@ -0,0 +1,49 @@
+"""
+Reading a snapshot takes many hours, so extractr commands periodically
+record how far they've got in a checkpoint file.  If the command crashes,
+it can resume from the last checkpoint rather than starting over.
+"""
+
+import json
+import os
+import pathlib
+import typing
+
+from nitrate.types import read_typed_json
+
+
+class Checkpoint(typing.TypedDict):
+    # The position in the compressed snapshot where we should resume
+    # reading.  This is always the start of a bz2 stream.
+    offset: int
+
+    # How many entries we'd read before this position.
+    entries: int
+
+    # The size of the output file when we wrote the checkpoint.
+    # Anything after this position was written after the checkpoint,
+    # and will be written again when we resume.
+    output_position: int
+
+
+def read_checkpoint(path: pathlib.Path | str) -> Checkpoint:
+    """
+    Read a checkpoint from disk.
+    """
+    return read_typed_json(path, model=Checkpoint)
+
+
+def write_checkpoint(path: pathlib.Path | str, checkpoint: Checkpoint) -> None:
+    """
+    Write a checkpoint to disk.
+
+    We write to a temporary file and then rename it, so there's always
+    a complete checkpoint on disk, even if we crash halfway through
+    writing a new one.
+    """
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w") as out_file:
+        out_file.write(json.dumps(checkpoint))
+
+    os.replace(tmp_path, path)
@@ -1,35 +1,546 @@
+from collections.abc import Iterable, Iterator
 import csv
+import json
+import os
+import pathlib
 import re
+import sys
 
 import click
 import tqdm
 
-from flickypedia.apis.snapshots import parse_sdc_snapshot
-from .matcher import find_matched_photos
+from flickypedia.apis.snapshots import (
+    AnySnapshotEntry,
+    Engine,
+    ShardCompression,
+    create_snapshot_index,
+    create_snapshot_shards,
+    get_snapshot_entry,
+    get_snapshot_index_path,
+    is_sharded_snapshot,
+    iter_bz2_ranges,
+    might_mention_flickr,
+    parse_sdc_snapshot,
+    parse_sdc_snapshot_range,
+    read_snapshot_lines,
+)
+from flickypedia.duplicates import (
+    UPLOADS_DATABASE,
+    create_bloom_filter,
+    create_sorted_id_index as create_sorted_id_index_from_database,
+    get_bloom_filter_path,
+    get_duplicate_database_names,
+    publish_duplicate_databases,
+    read_generation_manifest,
+)
+from .checkpoints import Checkpoint, read_checkpoint, write_checkpoint
+from .diff import find_changed_photos
+from .duplicates_database import create_duplicates_database
+from .extractors import EXTRACTORS, Extractor, run_extractors
+from .matcher import find_matched_photos, find_matched_photos_with_owners
+from .pipeline import format_pipeline_stats, run_matching_pipeline
+from .wikitext_dump import find_matched_photos_in_wikitext, parse_wikitext_dump
 
 
-@click.group(help="Get information about Flickr photos on WMC")
-def extractr() -> None:
-    pass
+# How often we write a checkpoint, measured in bytes of the compressed
+# snapshot.  We can only resume at the start of a bz2 stream, so this
+# is a lower bound -- if the streams are bigger than this, we write
+# a checkpoint at the end of every stream.
+CHECKPOINT_INTERVAL = 256 * 1024 * 1024
 
 
-@extractr.command(help="Get a list of Flickr photos on Commons.")
-@click.argument("SNAPSHOT_PATH")
-def get_photos_from_sdc(snapshot_path: str) -> None:
+def get_output_path(
+    snapshot_path: str, *, suffix: str, prefix: str = "flickr_ids_from_sdc"
+) -> str:
+    """
+    Choose the name of a file we create from a snapshot.
+    """
     # The name of the snapshot is something like:
     #
     #     commons-20231009-mediainfo.json.bz2
     #
-    # If we can, extract the data and use it to label the spreadsheet we
+    # If we can, extract the data and use it to label the file we
     # generate
     date_match = re.search(r"\-(\d+)\-", snapshot_path)
     if date_match is None:
-        csv_path = "flickr_ids_from_sdc.csv"
+        return f"{prefix}.{suffix}"
     else:
-        csv_path = f"flickr_ids_from_sdc.{date_match.group(1)}.csv"
+        return f"{prefix}.{date_match.group(1)}.{suffix}"
+
+
+# These options are shared by all the commands that read a snapshot.
+processes_option = click.option(
+    "--processes",
+    help="How many processes to use for decoding the snapshot.",
+    default=1,
+    type=int,
+    show_default=True,
+)
+
+prefilter_option = click.option(
+    "--prefilter",
+    help="Skip lines which don't mention Flickr without decoding them.",
+    is_flag=True,
+)
+
+engine_option = click.option(
+    "--engine",
+    help="How to decode entries in the snapshot.",
+    default="pydantic",
+    type=click.Choice(["pydantic", "msgspec"]),
+    show_default=True,
+)
+
+
+@click.group(help="Get information about Flickr photos on WMC")
+def extractr() -> None:
+    pass
+
+
+@extractr.command(help="Get a list of Flickr photos on Commons.")
+@click.argument("SNAPSHOT_PATH")
+@processes_option
+@prefilter_option
+@engine_option
+@click.option(
+    "--resume",
+    help="Resume a previous run from its last checkpoint. Checkpoints are only written when using a single process.",
+    is_flag=True,
+)
+@click.option(
+    "--pipeline",
+    help="Read, match and write in separate stages which run at the same time, using --processes matchers.",
+    is_flag=True,
+)
+def get_photos_from_sdc(
+    snapshot_path: str,
+    processes: int,
+    prefilter: bool,
+    engine: Engine,
+    resume: bool,
+    pipeline: bool,
+) -> None:
+    csv_path = get_output_path(snapshot_path, suffix="csv")
+
+    checkpoint_path = pathlib.Path(f"{csv_path}.checkpoint")
+
+    # Checkpoints are only written when we read the original snapshot
+    # one range at a time.
+    use_checkpoints = (
+        processes == 1 and not pipeline and not is_sharded_snapshot(snapshot_path)
+    )
+
+    if resume and processes > 1:
+        raise click.UsageError("--resume can only be used with a single process")
+
+    if resume and pipeline:
+        raise click.UsageError("--resume can't be used with --pipeline")
+
+    if resume and not use_checkpoints:
+        raise click.UsageError("--resume can't be used with a sharded snapshot")
 
     # Note: this snapshot takes a long time to rebuild, so we open it in mode `x`.
     # This means the CLI will refuse to overwrite an already-created spreadsheet.
+    #
+    # If we're resuming, we throw away anything that was written after
+    # the last checkpoint, then append to the spreadsheet.
+    checkpoint: Checkpoint
+
+    if resume:
+        try:
+            checkpoint = read_checkpoint(checkpoint_path)
+        except FileNotFoundError:
+            raise click.UsageError(
+                f"Unable to resume: no checkpoint at {checkpoint_path}"
+            )
+
+        os.truncate(csv_path, checkpoint["output_position"])
+        mode = "a"
+    else:
+        checkpoint = {"offset": 0, "entries": 0, "output_position": 0}
+        mode = "x"
+
+    with open(csv_path, mode) as out_file:
+        writer = csv.DictWriter(
+            out_file,
+            fieldnames=["flickr_photo_id", "wikimedia_page_id", "wikimedia_page_title"],
+        )
+
+        if not resume:
+            writer.writeheader()
+
+        if pipeline:
+            stats = run_matching_pipeline(
+                tqdm.tqdm(read_snapshot_lines(snapshot_path), unit=" lines"),
+                write=writer.writerow,
+                processes=processes,
+                prefilter=might_mention_flickr if prefilter else None,
+                engine=engine,
+            )
+
+            print(format_pipeline_stats(stats), file=sys.stderr)
+        elif not use_checkpoints:
+            entries = parse_sdc_snapshot(
+                snapshot_path,
+                processes=processes,
+                prefilter=might_mention_flickr if prefilter else None,
+                engine=engine,
+            )
+
+            for m in find_matched_photos(tqdm.tqdm(entries)):
+                writer.writerow(m)
+        else:
+            progress = tqdm.tqdm(initial=checkpoint["entries"])
+
+            def track_progress(
+                entries: Iterable[AnySnapshotEntry],
+            ) -> Iterator[AnySnapshotEntry]:
+                for e in entries:
+                    progress.update()
+                    yield e
+
+            # Read the snapshot one range at a time, and write a checkpoint
+            # at the start of each range.  We flush the spreadsheet to disk
+            # first, so every row before the checkpoint is safely written.
+            ranges = iter_bz2_ranges(
+                snapshot_path,
+                start=checkpoint["offset"],
+                range_size=CHECKPOINT_INTERVAL,
+            )
+
+            for start, end in ranges:
+                out_file.flush()
+                os.fsync(out_file.fileno())
+
+                checkpoint = {
+                    "offset": start,
+                    "entries": progress.n,
+                    "output_position": out_file.tell(),
+                }
+                write_checkpoint(checkpoint_path, checkpoint)
+
+                entries = parse_sdc_snapshot_range(
+                    snapshot_path,
+                    start=start,
+                    end=end,
+                    prefilter=might_mention_flickr if prefilter else None,
+                    engine=engine,
+                )
+
+                for m in find_matched_photos(track_progress(entries)):
+                    writer.writerow(m)
+
+            progress.close()
+
+    checkpoint_path.unlink(missing_ok=True)
+
+    print(csv_path)
+
+
+@extractr.command(
+    help="Get the Flickr photos on Commons which changed since the last snapshot."
+)
+@click.argument("SNAPSHOT_PATH")
+@click.option(
+    "--previous",
+    "previous_revisions",
+    help="The revisions database created from the previous snapshot. If omitted, every photo is new.",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@processes_option
+@engine_option
+def get_photo_changes_from_sdc(
+    snapshot_path: str,
+    previous_revisions: str | None,
+    processes: int,
+    engine: Engine,
+) -> None:
+    csv_path = get_output_path(snapshot_path, suffix="changes.csv")
+    revisions_path = get_output_path(snapshot_path, suffix="revisions.sqlite")
+
+    # Note: we create both files in mode `x`, so we don't overwrite
+    # the output of a previous run.
+    if os.path.exists(revisions_path):
+        raise click.UsageError(f"Revisions database {revisions_path} already exists")
+
+    with open(csv_path, "x") as out_file:
+        writer = csv.DictWriter(
+            out_file,
+            fieldnames=[
+                "change",
+                "flickr_photo_id",
+                "wikimedia_page_id",
+                "wikimedia_page_title",
+            ],
+        )
+        writer.writeheader()
+
+        entries = parse_sdc_snapshot(snapshot_path, processes=processes, engine=engine)
+
+        changes = find_changed_photos(
+            tqdm.tqdm(entries),
+            previous_revisions=previous_revisions,
+            current_revisions=revisions_path,
+        )
+
+        for c in changes:
+            writer.writerow(c)
+
+    print(csv_path)
+    print(revisions_path)
+
+
+@extractr.command(
+    help="Create a database of Flickr photos on Commons, for finding duplicates."
+)
+@click.argument("SNAPSHOT_PATH")
+@click.argument(
+    "DUPLICATE_DATABASE_DIRECTORY",
+    type=click.Path(exists=True, file_okay=False),
+)
+@processes_option
+@prefilter_option
+@engine_option
+def create_duplicates_database_from_sdc(
+    snapshot_path: str,
+    duplicate_database_directory: str,
+    processes: int,
+    prefilter: bool,
+    engine: Engine,
+) -> None:
+    db_path = os.path.join(
+        duplicate_database_directory, get_output_path(snapshot_path, suffix="sqlite")
+    )
+
+    # Note: this database takes a long time to build, so we refuse to
+    # overwrite an existing database.
+    if os.path.exists(db_path):
+        raise click.UsageError(f"Database {db_path} already exists")
+
+    # We build the database under a temporary name, then rename it
+    # into place when it's complete.  The web app ignores files which
+    # don't end in .db or .sqlite, so it will never see a half-built
+    # database -- and ``os.rename()`` is atomic, so it sees the complete
+    # database as soon as it exists.
+    tmp_path = db_path + ".tmp"
+
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+
+    entries = parse_sdc_snapshot(
+        snapshot_path,
+        processes=processes,
+        prefilter=might_mention_flickr if prefilter else None,
+        engine=engine,
+    )
+
+    row_count = create_duplicates_database(
+        tmp_path, matched_photos=find_matched_photos_with_owners(tqdm.tqdm(entries))
+    )
+
+    # If the directory doesn't have a generation manifest yet, we create
+    # one which pins the databases that are there now -- otherwise
+    # Flickypedia would start looking at the new database alongside the
+    # old ones as soon as we rename it into place.
+    if read_generation_manifest(duplicate_database_directory) is None:
+        publish_duplicate_databases(
+            duplicate_database_directory,
+            names=[
+                name
+                for name in get_duplicate_database_names(duplicate_database_directory)
+                if name != UPLOADS_DATABASE
+            ],
+        )
+
+    os.rename(tmp_path, db_path)
+
+    print(f"Wrote {row_count} photos to {db_path}")
+
+    create_bloom_filter(db_path)
+
+    print(f"Wrote Bloom filter to {get_bloom_filter_path(db_path)}")
+
+    # Now swap the new database in for the old ones.
+    manifest = publish_duplicate_databases(
+        duplicate_database_directory, names=[os.path.basename(db_path)]
+    )
+
+    print(
+        f"Published generation {manifest['generation']}; "
+        "you can delete the old databases once the web app has picked it up"
+    )
+
+
+@extractr.command(
+    help="Choose which databases Flickypedia uses to find duplicates, "
+    "replacing the current set in a single atomic step."
+)
+@click.argument(
+    "DUPLICATE_DATABASE_DIRECTORY",
+    type=click.Path(exists=True, file_okay=False),
+)
+@click.argument("NAMES", nargs=-1, required=True)
+def publish_duplicates_databases(
+    duplicate_database_directory: str, names: tuple[str, ...]
+) -> None:
+    try:
+        manifest = publish_duplicate_databases(
+            duplicate_database_directory, names=list(names)
+        )
+    except ValueError as err:
+        raise click.UsageError(str(err))
+
+    print(f"Published generation {manifest['generation']}: {', '.join(names)}")
+
+
+@extractr.command(
+    help="Create a Bloom filter for an existing duplicates database, "
+    "so Flickypedia can skip looking up photos which aren't in it."
+)
+@click.argument("DATABASE_PATH", type=click.Path(exists=True, dir_okay=False))
+def create_duplicates_filter(database_path: str) -> None:
+    count = create_bloom_filter(database_path)
+
+    print(
+        f"Wrote Bloom filter for {count} photos to "
+        f"{get_bloom_filter_path(database_path)}"
+    )
+
+
+@extractr.command(
+    help="Convert a duplicates database into a sorted ID index, "
+    "which Flickypedia can search without SQLite."
+)
+@click.argument("DATABASE_PATH", type=click.Path(exists=True, dir_okay=False))
+def create_sorted_id_index(database_path: str) -> None:
+    index_path, count = create_sorted_id_index_from_database(database_path)
+
+    print(f"Wrote {count} photos to {index_path}")
+
+
+@extractr.command(help="Create an index for looking up entries in a snapshot.")
+@click.argument("SNAPSHOT_PATH")
+def index_snapshot(snapshot_path: str) -> None:
+    index_path = get_snapshot_index_path(snapshot_path)
+
+    if os.path.exists(index_path):
+        raise click.UsageError(f"Index {index_path} already exists")
+
+    row_count = create_snapshot_index(snapshot_path)
+
+    print(f"Indexed {row_count} entries in {index_path}")
+
+
+@extractr.command(
+    help="Print a single entry from a snapshot. KEY can be an M-ID, a title or a page ID."
+)
+@click.argument("SNAPSHOT_PATH")
+@click.argument("KEY")
+def get_entry_from_sdc(snapshot_path: str, key: str) -> None:
+    try:
+        entry = get_snapshot_entry(
+            snapshot_path, key=int(key) if key.isdigit() else key
+        )
+    except FileNotFoundError:
+        raise click.UsageError(
+            f"No index for {snapshot_path}; create one with `index-snapshot`"
+        )
+    except KeyError:
+        raise click.UsageError(f"No entry {key} in {snapshot_path}")
+
+    print(json.dumps(entry, indent=2))
+
+
+@extractr.command(help="Create several reports from a snapshot in a single pass.")
+@click.argument("SNAPSHOT_PATH")
+@click.option(
+    "--extractor",
+    "extractor_names",
+    help="Which report to create. Can be passed multiple times; defaults to every report.",
+    type=click.Choice(sorted(EXTRACTORS)),
+    multiple=True,
+)
+@processes_option
+@engine_option
+def extract_from_sdc(
+    snapshot_path: str,
+    extractor_names: tuple[str, ...],
+    processes: int,
+    engine: Engine,
+) -> None:
+    extractor_classes = [
+        EXTRACTORS[name] for name in extractor_names or sorted(EXTRACTORS)
+    ]
+
+    output_paths = [
+        get_output_path(
+            snapshot_path, prefix=cls.output_prefix, suffix=cls.output_suffix
+        )
+        for cls in extractor_classes
+    ]
+
+    # We check all the outputs before we create any of them, so we
+    # don't leave behind half the reports if one of them already exists.
+    for path in output_paths:
+        if os.path.exists(path):
+            raise click.UsageError(f"Output {path} already exists")
+
+    extractors: list[Extractor] = [
+        cls(path) for cls, path in zip(extractor_classes, output_paths)
+    ]
+
+    entries = parse_sdc_snapshot(snapshot_path, processes=processes, engine=engine)
+
+    run_extractors(tqdm.tqdm(entries), extractors)
+
+    for ex in extractors:
+        print(ex.output_path)
+
+
+@extractr.command(help="Convert a snapshot into shards which are faster to read.")
+@click.argument("SNAPSHOT_PATH")
+@click.option(
+    "--shards",
+    help="How many shards to create.",
+    default=16,
+    type=int,
+    show_default=True,
+)
+@click.option(
+    "--compression",
+    help="How to compress the shards.",
+    default="gzip",
+    type=click.Choice(["gzip", "none"]),
+    show_default=True,
+)
+def shard_snapshot(
+    snapshot_path: str, shards: int, compression: ShardCompression
+) -> None:
+    # e.g. commons-20231009-mediainfo.json.bz2
+    #   -> commons-20231009-mediainfo.shards
+    name = os.path.basename(snapshot_path).removesuffix(".bz2").removesuffix(".json")
+    out_dir = f"{name}.shards"
+
+    if os.path.exists(out_dir):
+        raise click.UsageError(f"Shard directory {out_dir} already exists")
+
+    manifest = create_snapshot_shards(
+        snapshot_path, out_dir, shards=shards, compression=compression
+    )
+
+    entries = sum(shard["entries"] for shard in manifest["shards"])
+    print(f"Wrote {entries} entries to {len(manifest['shards'])} shards in {out_dir}")
+
+
+@extractr.command(help="Get a list of Flickr photos on Commons from a Wikitext dump.")
+@click.argument("DUMP_PATH")
+def get_photos_from_wikitext(dump_path: str) -> None:
+    csv_path = get_output_path(
+        dump_path, prefix="flickr_ids_from_wikitext", suffix="csv"
+    )
+
+    # Note: this dump takes a long time to process, so we open it in mode `x`.
+    # This means the CLI will refuse to overwrite an already-created spreadsheet.
     with open(csv_path, "x") as out_file:
         writer = csv.DictWriter(
             out_file,
@@ -37,9 +548,9 @@ def get_photos_from_sdc(snapshot_path: str) -> None:
         )
         writer.writeheader()
 
-        entries = tqdm.tqdm(parse_sdc_snapshot(snapshot_path))
+        pages = parse_wikitext_dump(dump_path)
 
-        for m in find_matched_photos(entries):  # type: ignore
+        for m in find_matched_photos_in_wikitext(tqdm.tqdm(pages)):
             writer.writerow(m)
 
     print(csv_path)
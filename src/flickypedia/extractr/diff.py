@@ -0,0 +1,161 @@
+"""
+Find the Flickr photos that have changed between two snapshots.
+
+Most entries don't change from one snapshot to the next.  When we
+process a snapshot, we write a compact "revisions" database which
+records the ``lastrevid`` of every entry, and the Flickr photo it
+matched (if any):
+
+    CREATE TABLE revisions (
+        page_id INTEGER PRIMARY KEY,
+        lastrevid INTEGER NOT NULL,
+        flickr_photo_id TEXT
+    )
+
+When we process the next snapshot, we compare every entry to the
+previous revisions database.  If the ``lastrevid`` hasn't changed,
+the entry hasn't changed, and we can skip it -- we don't need to
+look at its statements again.
+
+"""
+
+from collections.abc import Iterable, Iterator
+import contextlib
+import pathlib
+import sqlite3
+import typing
+
+from flickypedia.apis.snapshots import AnySnapshotEntry
+from .matcher import MatchedPhoto, match_entry
+
+
+class PhotoChange(MatchedPhoto):
+    change: typing.Literal["added", "changed", "removed"]
+
+
+def create_revisions_database(path: pathlib.Path | str) -> sqlite3.Connection:
+    """
+    Create a new, empty revisions database.
+    """
+    con = sqlite3.connect(path)
+
+    # We can always rebuild this database from the snapshot, so we
+    # turn off the journal -- this makes inserts much faster.
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+
+    con.execute(
+        """
+        CREATE TABLE revisions (
+            page_id INTEGER PRIMARY KEY,
+            lastrevid INTEGER NOT NULL,
+            flickr_photo_id TEXT
+        )
+        """
+    )
+
+    return con
+
+
+def find_changed_photos(
+    entries: Iterable[AnySnapshotEntry],
+    *,
+    previous_revisions: pathlib.Path | str | None,
+    current_revisions: pathlib.Path | str,
+) -> Iterator[PhotoChange]:
+    """
+    Given the entries in a snapshot, find every Flickr photo that was
+    added, changed or removed since the previous snapshot.
+
+    This writes a new revisions database to ``current_revisions``,
+    which can be used as the ``previous_revisions`` for the next snapshot.
+    If ``previous_revisions`` is None, every Flickr photo is "added".
+    """
+    with contextlib.ExitStack() as stack:
+        current = stack.enter_context(
+            contextlib.closing(create_revisions_database(current_revisions))
+        )
+
+        if previous_revisions is not None:
+            uri = f"file:{previous_revisions}?mode=ro"
+            previous = stack.enter_context(
+                contextlib.closing(sqlite3.connect(uri, uri=True))
+            )
+        else:
+            previous = None
+
+        pending: list[tuple[int, int, str | None]] = []
+
+        for entry in entries:
+            if previous is not None:
+                prior = previous.execute(
+                    "SELECT lastrevid, flickr_photo_id FROM revisions WHERE page_id = ?",
+                    (entry["pageid"],),
+                ).fetchone()
+            else:
+                prior = None
+
+            # If the entry hasn't been edited since the previous snapshot,
+            # we already know what Flickr photo it matches.
+            if prior is not None and prior[0] == entry["lastrevid"]:
+                flickr_photo_id = prior[1]
+            else:
+                prior_photo_id = prior[1] if prior is not None else None
+                matched_photo = match_entry(entry)
+
+                if matched_photo is not None:
+                    flickr_photo_id = matched_photo["flickr_photo_id"]
+                else:
+                    flickr_photo_id = None
+
+                # If the entry used to match a different Flickr photo,
+                # that photo is no longer on this page -- we report it,
+                # so anybody applying these changes drops the old match.
+                if prior_photo_id is not None and prior_photo_id != flickr_photo_id:
+                    yield {
+                        "change": "removed",
+                        "flickr_photo_id": prior_photo_id,
+                        "wikimedia_page_id": entry["id"],
+                        "wikimedia_page_title": entry["title"],
+                    }
+
+                if matched_photo is not None:
+                    yield {
+                        "change": "added" if prior_photo_id is None else "changed",
+                        **matched_photo,
+                    }
+
+            pending.append((entry["pageid"], entry["lastrevid"], flickr_photo_id))
+
+            if len(pending) == 10000:
+                current.executemany("INSERT INTO revisions VALUES(?, ?, ?)", pending)
+                pending = []
+
+        current.executemany("INSERT INTO revisions VALUES(?, ?, ?)", pending)
+        current.commit()
+
+        # Finally, look for Flickr photos whose file isn't in the current
+        # snapshot at all -- for example, because it was deleted.
+        #
+        # We don't know the title of these files, so we leave it blank.
+        if previous_revisions is not None:
+            current.execute("ATTACH DATABASE ? AS previous", (str(previous_revisions),))
+
+            cursor = current.execute(
+                """
+                SELECT page_id, flickr_photo_id
+                FROM previous.revisions AS p
+                WHERE flickr_photo_id IS NOT NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM main.revisions AS c WHERE c.page_id = p.page_id
+                )
+                """
+            )
+
+            for page_id, flickr_photo_id in cursor:
+                yield {
+                    "change": "removed",
+                    "flickr_photo_id": flickr_photo_id,
+                    "wikimedia_page_id": f"M{page_id}",
+                    "wikimedia_page_title": "",
+                }
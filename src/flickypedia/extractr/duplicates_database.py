@@ -0,0 +1,146 @@
+"""
+Create a database of duplicates for Flickypedia, in the format read
+by ``flickypedia.duplicates.find_duplicates()``.
+
+This is much faster than writing a spreadsheet and converting it to
+SQLite afterwards (as in ``duplicates_from_sdc/csv_to_sqlite.py``),
+because we only write the data once, and we use settings which are
+tuned for loading lots of data into a brand new database.
+"""
+
+from collections.abc import Iterable
+import contextlib
+import pathlib
+import sqlite3
+
+from .matcher import MatchedPhotoWithOwner
+
+
+def create_duplicates_database(
+    path: pathlib.Path | str, matched_photos: Iterable[MatchedPhotoWithOwner]
+) -> int:
+    """
+    Create a new SQLite database in the "multi-valued" layout described
+    in ``flickypedia.duplicates``, and return the number of Flickr photos
+    in the database.
+
+    We record every copy of a Flickr photo.  If the copies have different
+    Flickr users, we record the first one.
+    """
+    with contextlib.closing(sqlite3.connect(path)) as con:
+        # If the load fails, we'll delete the database and start again,
+        # so we don't need the journal, and we don't need to wait for
+        # data to be flushed to disk.  A big page cache means we don't
+        # have to go back to disk as often when we build the index.
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute("PRAGMA cache_size = -1048576")  # 1 GiB
+
+        # First we load the photos into a temporary table with no index,
+        # which is as fast as an insert can be.  Temporary tables live
+        # in a separate file, so it doesn't take up space in the
+        # final database.
+        #
+        # The IDs are stored as integers; SQLite converts them from
+        # strings because of the INTEGER column type.
+        con.execute(
+            """
+            CREATE TEMP TABLE unsorted_photos (
+                flickr_photo_id INTEGER NOT NULL,
+                page_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                flickr_user_id TEXT
+            )
+            """
+        )
+
+        con.executemany(
+            "INSERT INTO unsorted_photos VALUES(?, ?, ?, ?)",
+            (
+                (
+                    photo["flickr_photo_id"],
+                    photo["wikimedia_page_id"].removeprefix("M"),
+                    photo["wikimedia_page_title"],
+                    photo["flickr_user_id"],
+                )
+                for photo in matched_photos
+            ),
+        )
+
+        # Then we create the real tables, and copy the rows across
+        # in primary key order.  Inserting in sorted order means SQLite
+        # only ever appends to the end of the index, rather than
+        # rebalancing the tree on every insert.
+        con.execute(
+            """
+            CREATE TABLE flickr_photos (
+                flickr_photo_id INTEGER PRIMARY KEY,
+                flickr_user_id TEXT
+            )
+            """
+        )
+
+        con.execute(
+            """
+            CREATE TABLE wikimedia_pages (
+                page_id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL
+            )
+            """
+        )
+
+        con.execute(
+            """
+            CREATE TABLE flickr_photo_pages (
+                flickr_photo_id INTEGER NOT NULL,
+                page_id INTEGER NOT NULL,
+                PRIMARY KEY (flickr_photo_id, page_id)
+            ) WITHOUT ROWID
+            """
+        )
+
+        # Sorting by ``rowid`` means we keep the first Flickr user we
+        # saw for each photo -- but we prefer a copy which has a user.
+        con.execute(
+            """
+            INSERT OR IGNORE INTO flickr_photos
+            SELECT flickr_photo_id, flickr_user_id
+            FROM unsorted_photos
+            ORDER BY flickr_photo_id, flickr_user_id IS NULL, rowid
+            """
+        )
+
+        con.execute(
+            """
+            INSERT OR IGNORE INTO wikimedia_pages
+            SELECT page_id, title
+            FROM unsorted_photos
+            ORDER BY page_id
+            """
+        )
+
+        con.execute(
+            """
+            INSERT OR IGNORE INTO flickr_photo_pages
+            SELECT flickr_photo_id, page_id
+            FROM unsorted_photos
+            ORDER BY flickr_photo_id, page_id
+            """
+        )
+
+        # We create the secondary index after the table is full, which
+        # is faster than updating it on every insert.
+        con.execute(
+            """
+            CREATE INDEX flickr_photos_by_user_id
+            ON flickr_photos(flickr_user_id)
+            """
+        )
+
+        con.execute("DROP TABLE unsorted_photos")
+        con.commit()
+
+        (row_count,) = con.execute("SELECT COUNT(*) FROM flickr_photos").fetchone()
+
+    assert isinstance(row_count, int)
+    return row_count
@@ -0,0 +1,251 @@
+"""
+Build several reports from a snapshot in a single pass.
+
+Most of the time spent processing a snapshot goes on decompressing
+and decoding it, not on the reports themselves.  Rather than reading
+the snapshot once per report, we read it once and hand every entry
+to a list of "extractors".  Each extractor looks at the entries it
+cares about, and writes its own output file.
+
+To add a new report, subclass ``Extractor`` (or ``CountingExtractor``
+if you just want to count things), and add it to ``EXTRACTORS``.
+"""
+
+import abc
+from collections import Counter
+from collections.abc import Iterable
+import csv
+import json
+import os
+import pathlib
+import sqlite3
+import typing
+
+from flickypedia.apis.snapshots import AnySnapshotEntry
+from flickypedia.structured_data import WikidataProperties
+from .matcher import find_flickr_user_ids, match_entry
+
+
+class Extractor(abc.ABC):
+    """
+    Something which builds a report from the entries in a snapshot.
+
+    Subclasses should open their output in ``__init__``, update it
+    in ``process_entry()``, and finish writing it in ``close()``.
+    If we can't read the whole snapshot, we call ``abort()`` instead,
+    which should throw away the partial output.
+    """
+
+    # The name of the extractor, as used on the command line.
+    name: typing.ClassVar[str]
+
+    # Used to choose the name of the output file, e.g. a report with
+    # prefix ``licenses`` and suffix ``json`` for the 20231009 snapshot
+    # is written to ``licenses.20231009.json``.
+    output_prefix: typing.ClassVar[str]
+    output_suffix: typing.ClassVar[str]
+
+    def __init__(self, output_path: pathlib.Path | str) -> None:
+        self.output_path = output_path
+
+    @abc.abstractmethod
+    def process_entry(self, entry: AnySnapshotEntry) -> None:
+        """
+        Look at a single entry from the snapshot.
+        """
+        pass
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """
+        Finish writing the output, after we've seen every entry.
+        """
+        pass
+
+    @abc.abstractmethod
+    def abort(self) -> None:
+        """
+        Close the output without finishing it, and delete it -- so
+        a failed run doesn't leave behind a report that looks complete.
+        """
+        pass
+
+
+class FlickrPhotosExtractor(Extractor):
+    """
+    Find the Flickr photos on Commons, and write them to a spreadsheet
+    in the same format as ``get-photos-from-sdc``.
+    """
+
+    name = "flickr_photos"
+    output_prefix = "flickr_ids_from_sdc"
+    output_suffix = "csv"
+
+    def __init__(self, output_path: pathlib.Path | str) -> None:
+        super().__init__(output_path)
+
+        self.out_file = open(output_path, "x")
+        self.writer = csv.DictWriter(
+            self.out_file,
+            fieldnames=["flickr_photo_id", "wikimedia_page_id", "wikimedia_page_title"],
+        )
+        self.writer.writeheader()
+
+    def process_entry(self, entry: AnySnapshotEntry) -> None:
+        matched_photo = match_entry(entry)
+
+        if matched_photo is not None:
+            self.writer.writerow(matched_photo)
+
+    def close(self) -> None:
+        self.out_file.close()
+
+    def abort(self) -> None:
+        self.out_file.close()
+        os.unlink(self.output_path)
+
+
+class CreatorNsidsExtractor(Extractor):
+    """
+    Record the Flickr user ID (NSID) in the "creator" statements
+    on every file, in a SQLite database with a single table:
+
+        CREATE TABLE creators (
+            wikimedia_page_id TEXT NOT NULL,
+            flickr_user_id TEXT NOT NULL
+        )
+
+    """
+
+    name = "creator_nsids"
+    output_prefix = "creator_nsids"
+    output_suffix = "sqlite"
+
+    def __init__(self, output_path: pathlib.Path | str) -> None:
+        super().__init__(output_path)
+
+        self.con = sqlite3.connect(output_path)
+
+        # We can always rebuild this database from the snapshot, so we
+        # turn off the journal -- this makes inserts much faster.
+        self.con.execute("PRAGMA journal_mode = OFF")
+        self.con.execute("PRAGMA synchronous = OFF")
+
+        self.con.execute(
+            """
+            CREATE TABLE creators (
+                wikimedia_page_id TEXT NOT NULL,
+                flickr_user_id TEXT NOT NULL
+            )
+            """
+        )
+
+    def process_entry(self, entry: AnySnapshotEntry) -> None:
+        for user_id in find_flickr_user_ids(entry["statements"]):
+            self.con.execute(
+                "INSERT INTO creators VALUES(?, ?)", (entry["id"], user_id)
+            )
+
+    def close(self) -> None:
+        self.con.execute("CREATE INDEX creators_by_nsid ON creators(flickr_user_id)")
+        self.con.commit()
+        self.con.close()
+
+    def abort(self) -> None:
+        self.con.close()
+        os.unlink(self.output_path)
+
+
+class CountingExtractor(Extractor):
+    """
+    Count how often some values appear in the snapshot, and write
+    the totals to a JSON file, most common first.
+    """
+
+    output_suffix = "json"
+
+    def __init__(self, output_path: pathlib.Path | str) -> None:
+        super().__init__(output_path)
+
+        # Open the file now, so we find out straight away if it
+        # already exists, rather than after reading the whole snapshot.
+        self.out_file = open(output_path, "x")
+        self.counter: Counter[str] = Counter()
+
+    @abc.abstractmethod
+    def get_values(self, entry: AnySnapshotEntry) -> Iterable[str]:
+        """
+        Returns the values to count in a single entry.
+        """
+        pass
+
+    def process_entry(self, entry: AnySnapshotEntry) -> None:
+        self.counter.update(self.get_values(entry))
+
+    def close(self) -> None:
+        json.dump(dict(self.counter.most_common()), self.out_file, indent=2)
+        self.out_file.close()
+
+    def abort(self) -> None:
+        self.out_file.close()
+        os.unlink(self.output_path)
+
+
+class CaptionLanguagesExtractor(CountingExtractor):
+    """
+    Count the languages of the captions (labels) on every file.
+    """
+
+    name = "caption_languages"
+    output_prefix = "caption_languages"
+
+    def get_values(self, entry: AnySnapshotEntry) -> Iterable[str]:
+        return entry["labels"].keys()
+
+
+class LicensesExtractor(CountingExtractor):
+    """
+    Count the copyright licenses on every file, by their Wikidata ID.
+    """
+
+    name = "licenses"
+    output_prefix = "licenses"
+
+    def get_values(self, entry: AnySnapshotEntry) -> Iterable[str]:
+        statements = entry["statements"]
+
+        for statement in statements.get(WikidataProperties.CopyrightLicense, []):
+            datavalue = statement["mainsnak"].get("datavalue")
+
+            if datavalue is not None and datavalue["type"] == "wikibase-entityid":
+                yield datavalue["value"]["id"]
+
+
+EXTRACTORS: dict[str, type[Extractor]] = {
+    FlickrPhotosExtractor.name: FlickrPhotosExtractor,
+    CreatorNsidsExtractor.name: CreatorNsidsExtractor,
+    CaptionLanguagesExtractor.name: CaptionLanguagesExtractor,
+    LicensesExtractor.name: LicensesExtractor,
+}
+
+
+def run_extractors(
+    entries: Iterable[AnySnapshotEntry], extractors: list[Extractor]
+) -> None:
+    """
+    Pass every entry to every extractor, then close the extractors.
+
+    If something goes wrong, we abort every extractor, so we don't
+    leave behind reports built from part of the snapshot.
+    """
+    try:
+        for entry in entries:
+            for ex in extractors:
+                ex.process_entry(entry)
+    except BaseException:
+        for ex in extractors:
+            ex.abort()
+        raise
+
+    for ex in extractors:
+        ex.close()
@@ -1,4 +1,4 @@
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 import sys
 import typing
 
@@ -6,7 +6,8 @@ from flickypedia.backfillr.flickr_matcher import (
     AmbiguousStructuredData,
     find_flickr_photo_id_from_sdc,
 )
-from flickypedia.apis.snapshots import SnapshotEntry
+from flickypedia.apis.snapshots import AnySnapshotEntry
+from flickypedia.structured_data import ExistingClaims, WikidataProperties
 
 
 class MatchedPhoto(typing.TypedDict):
@@ -15,27 +16,96 @@ class MatchedPhoto(typing.TypedDict):
     wikimedia_page_title: str
 
 
-def find_matched_photos(entries: Iterator[SnapshotEntry]) -> Iterator[MatchedPhoto]:
+class MatchedPhotoWithOwner(MatchedPhoto):
+    # The NSID of the Flickr user who took the photo, if it's
+    # recorded in the structured data, e.g. "44124385307@N01"
+    flickr_user_id: str | None
+
+
+def find_matched_photos(
+    entries: Iterable[AnySnapshotEntry],
+) -> Iterator[MatchedPhoto]:
     """
     Given the SDC for an existing set of files on Wikimedia Commons,
     try to find whether there's a matching photo.
     """
     for entry in entries:
-        try:
-            photo_id = find_flickr_photo_id_from_sdc(sdc=entry["statements"])
-            if photo_id is not None:
-                yield {
-                    "flickr_photo_id": photo_id["photo_id"],
-                    "wikimedia_page_id": entry["id"],
-                    "wikimedia_page_title": entry["title"],
-                }
-        except AmbiguousStructuredData as exc:
-            print(
-                f'Ambiguity in https://commons.wikimedia.org/?curid={entry["pageid"]}: {exc}',
-                file=sys.stderr,
-            )
-        except Exception as exc:
-            print(
-                f'Unable to find photo ID in https://commons.wikimedia.org/?curid={entry["pageid"]}: {exc}',
-                file=sys.stderr,
-            )
+        matched_photo = match_entry(entry)
+
+        if matched_photo is not None:
+            yield matched_photo
+
+
+def match_entry(entry: AnySnapshotEntry) -> MatchedPhoto | None:
+    """
+    Given the SDC for a single file on Wikimedia Commons, try to find
+    whether there's a matching photo.
+    """
+    # Note: we read the statements outside the ``try`` block, because
+    # the "msgspec" engine only validates them when we read them --
+    # if they don't match our model, we want to stop, not carry on.
+    statements = entry["statements"]
+
+    try:
+        photo_id = find_flickr_photo_id_from_sdc(sdc=statements)
+        if photo_id is not None:
+            return {
+                "flickr_photo_id": photo_id["photo_id"],
+                "wikimedia_page_id": entry["id"],
+                "wikimedia_page_title": entry["title"],
+            }
+    except AmbiguousStructuredData as exc:
+        print(
+            f'Ambiguity in https://commons.wikimedia.org/?curid={entry["pageid"]}: {exc}',
+            file=sys.stderr,
+        )
+    except Exception as exc:
+        print(
+            f'Unable to find photo ID in https://commons.wikimedia.org/?curid={entry["pageid"]}: {exc}',
+            file=sys.stderr,
+        )
+
+    return None
+
+
+def find_flickr_user_ids(statements: ExistingClaims) -> list[str]:
+    """
+    Return the Flickr user IDs (NSIDs) in the "creator" statements.
+
+    When Flickypedia creates a "creator" statement for a Flickr user,
+    it records their NSID in a "Flickr user ID" qualifier.
+    """
+    user_ids = []
+
+    for statement in statements.get(WikidataProperties.Creator, []):
+        for snak in statement.get("qualifiers", {}).get(
+            WikidataProperties.FlickrUserId, []
+        ):
+            datavalue = snak.get("datavalue")
+
+            if datavalue is not None and datavalue["type"] == "string":
+                user_ids.append(datavalue["value"])
+
+    return user_ids
+
+
+def find_matched_photos_with_owners(
+    entries: Iterable[AnySnapshotEntry],
+) -> Iterator[MatchedPhotoWithOwner]:
+    """
+    Like ``find_matched_photos()``, but also record the Flickr user
+    who took each photo.
+
+    If there's more than one Flickr user in the "creator" statements,
+    we use the first one.
+    """
+    for entry in entries:
+        matched_photo = match_entry(entry)
+
+        if matched_photo is not None:
+            user_ids = find_flickr_user_ids(entry["statements"])
+
+            yield {
+                **matched_photo,
+                "flickr_user_id": user_ids[0] if user_ids else None,
+            }
@@ -0,0 +1,290 @@
+"""
+Find the Flickr photos in a snapshot using a pipeline of stages
+which run at the same time:
+
+    reader ──▶ matchers ──▶ writer
+    (thread)   (processes)  (thread)
+
+*   The reader decompresses the snapshot, and groups the raw lines
+    into batches.  Decompression releases the GIL, so this can run
+    in a thread alongside the rest of the pipeline.
+*   The matchers decode the lines and look for Flickr photos.  This
+    is the most expensive stage, so it runs on a pool of processes.
+*   The writer saves the matched photos, e.g. to a spreadsheet.
+
+The stages are connected by bounded queues, and there are only ever
+a fixed number of batches being matched, so memory usage stays flat
+no matter how big the snapshot is.  If one stage is slower than the
+others, the stages before it wait for it to catch up.
+
+We record how long each stage spends working and how long it spends
+waiting for the other stages, so we can see which one is the bottleneck.
+"""
+
+from collections.abc import Callable, Iterable
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import typing
+
+from flickypedia.apis.snapshots import (
+    Engine,
+    Prefilter,
+    parse_snapshot_lines,
+)
+from .matcher import MatchedPhoto, find_matched_photos
+
+
+class StageStats(typing.TypedDict):
+    # How many items this stage processed, e.g. lines or photos
+    items: int
+
+    # How long this stage spent doing its own work.  For the matchers,
+    # this is the total across all the processes.
+    busy_seconds: float
+
+    # How long this stage spent waiting for the stages on either
+    # side of it.  The slowest stage will spend the least time waiting.
+    waiting_seconds: float
+
+
+class PipelineStats(typing.TypedDict):
+    reader: StageStats
+    matchers: StageStats
+    writer: StageStats
+
+
+T = typing.TypeVar("T")
+
+
+def _put_unless_stopped(q: "queue.Queue[T]", item: T, stop: threading.Event) -> bool:
+    """
+    Put an item on a queue, waiting if it's full -- unless another
+    stage has failed, in which case we give up and return False.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+
+def _match_lines(
+    lines: list[bytes], prefilter: Prefilter | None, engine: Engine
+) -> tuple[list[MatchedPhoto], float]:  # pragma: no cover
+    """
+    Find the Flickr photos in a batch of lines, and return the photos
+    and how long it took.
+
+    This runs in a worker process, so it isn't seen by coverage.
+    """
+    start = time.perf_counter()
+
+    entries = parse_snapshot_lines(lines, prefilter=prefilter, engine=engine)
+    matched_photos = list(find_matched_photos(entries))
+
+    return matched_photos, time.perf_counter() - start
+
+
+def run_matching_pipeline(
+    lines: Iterable[bytes],
+    *,
+    write: Callable[[MatchedPhoto], None],
+    processes: int,
+    prefilter: Prefilter | None = None,
+    engine: Engine = "pydantic",
+    batch_size: int = 1000,
+) -> PipelineStats:
+    """
+    Find the Flickr photos in the raw lines of a snapshot, and call
+    ``write()`` for each of them.
+
+    The photos are written in the same order as they appear in
+    the snapshot.  Returns statistics about each stage.
+    """
+    stats: PipelineStats = {
+        "reader": {"items": 0, "busy_seconds": 0, "waiting_seconds": 0},
+        "matchers": {"items": 0, "busy_seconds": 0, "waiting_seconds": 0},
+        "writer": {"items": 0, "busy_seconds": 0, "waiting_seconds": 0},
+    }
+
+    # Each queue holds a couple of batches for every matcher, so
+    # there's always work ready when a matcher finishes.
+    max_batches = processes * 2
+
+    line_batches: "queue.Queue[list[bytes] | None]" = queue.Queue(maxsize=max_batches)
+    photo_batches: "queue.Queue[list[MatchedPhoto] | None]" = queue.Queue(
+        maxsize=max_batches
+    )
+
+    # If any stage fails, it records the error and sets ``stop``,
+    # which tells the other stages to give up.
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def read() -> None:
+        reader = stats["reader"]
+
+        try:
+            lines_iter = iter(lines)
+
+            while True:
+                start = time.perf_counter()
+                batch = list(itertools.islice(lines_iter, batch_size))
+                reader["busy_seconds"] += time.perf_counter() - start
+                reader["items"] += len(batch)
+
+                if not batch:
+                    break
+
+                start = time.perf_counter()
+                if not _put_unless_stopped(line_batches, batch, stop):
+                    return
+                reader["waiting_seconds"] += time.perf_counter() - start
+
+        # Note: we catch BaseException, not just Exception, so the other
+        # stages always hear about it if this thread stops unexpectedly.
+        except BaseException as exc:
+            errors.append(exc)
+            stop.set()
+
+        _put_unless_stopped(line_batches, None, stop)
+
+    def write_photos() -> None:
+        writer = stats["writer"]
+
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = photo_batches.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            finally:
+                writer["waiting_seconds"] += time.perf_counter() - start
+
+            if batch is None:
+                return
+
+            start = time.perf_counter()
+            try:
+                for photo in batch:
+                    write(photo)
+            except BaseException as exc:
+                errors.append(exc)
+                stop.set()
+                return
+            writer["busy_seconds"] += time.perf_counter() - start
+            writer["items"] += len(batch)
+
+    reader_thread = threading.Thread(target=read, name="pipeline-reader")
+    writer_thread = threading.Thread(target=write_photos, name="pipeline-writer")
+
+    # We use "spawn" rather than "fork" because we've already started
+    # threads, and forking a multi-threaded process isn't safe.
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+    )
+
+    reader_thread.start()
+    writer_thread.start()
+
+    matchers = stats["matchers"]
+
+    # Batches which are being matched, oldest first.  We always wait for
+    # the oldest batch, so the photos are written in snapshot order.
+    in_flight: collections.deque[
+        tuple[int, concurrent.futures.Future[tuple[list[MatchedPhoto], float]]]
+    ] = collections.deque()
+
+    def send_oldest_batch_to_writer() -> bool:
+        line_count, future = in_flight.popleft()
+
+        matched_photos, elapsed = future.result()
+
+        matchers["busy_seconds"] += elapsed
+        matchers["items"] += line_count
+
+        start = time.perf_counter()
+        is_sent = _put_unless_stopped(photo_batches, matched_photos, stop)
+        matchers["waiting_seconds"] += time.perf_counter() - start
+
+        return is_sent
+
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                lines_batch = line_batches.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            finally:
+                matchers["waiting_seconds"] += time.perf_counter() - start
+
+            if lines_batch is None:
+                break
+
+            future = executor.submit(_match_lines, lines_batch, prefilter, engine)
+            in_flight.append((len(lines_batch), future))
+
+            if len(in_flight) >= max_batches and not send_oldest_batch_to_writer():
+                break
+
+        while in_flight and not stop.is_set():
+            send_oldest_batch_to_writer()
+
+        _put_unless_stopped(photo_batches, None, stop)
+    except Exception as exc:
+        errors.append(exc)
+        stop.set()
+    finally:
+        # If we're leaving because of an exception we didn't catch, e.g.
+        # a KeyboardInterrupt, we still have to tell the other stages to
+        # stop, or the reader would wait forever for us to take its next
+        # batch, and we'd wait forever for the reader.
+        stop.set()
+
+        executor.shutdown(cancel_futures=True)
+        reader_thread.join()
+        writer_thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return stats
+
+
+def format_pipeline_stats(stats: PipelineStats) -> str:
+    """
+    Create a human-readable summary of the pipeline statistics, e.g.
+    (the rate for the matchers is per process)
+
+        reader:    4000000 lines in  601.2s busy,   12.1s waiting (6653/sec)
+        matchers:  4000000 lines in 2404.0s busy,  580.3s waiting (1663/sec)
+        writer:     400000 rows  in    2.3s busy,  598.8s waiting (173913/sec)
+
+    """
+    lines = []
+
+    for name, s, unit in [
+        ("reader", stats["reader"], "lines"),
+        ("matchers", stats["matchers"], "lines"),
+        ("writer", stats["writer"], "rows"),
+    ]:
+        rate = s["items"] / s["busy_seconds"] if s["busy_seconds"] else 0
+
+        lines.append(
+            f"{name + ':':<10}{s['items']:>8} {unit:<5} in "
+            f"{s['busy_seconds']:>6.1f}s busy, "
+            f"{s['waiting_seconds']:>6.1f}s waiting ({rate:.0f}/sec)"
+        )
+
+    return "\n".join(lines)
@@ -0,0 +1,126 @@
+"""
+Find Flickr photos in the XML dumps of Wikimedia Commons, as
+downloaded from https://dumps.wikimedia.org/commonswiki/
+
+Some older files only link to Flickr in their Wikitext, not in their
+structured data, so they don't show up in the SDC snapshots.
+
+The dump is a single XML document with one <page> per page on Commons:
+
+    <mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" …>
+      <siteinfo>…</siteinfo>
+      <page>
+        <title>File:Example.jpg</title>
+        <ns>6</ns>
+        <id>1234</id>
+        <revision>
+          …
+          <text bytes="…" xml:space="preserve">{{Information …}}</text>
+        </revision>
+      </page>
+      …
+    </mediawiki>
+
+The uncompressed dump is hundreds of gigabytes, so we parse it
+incrementally, and throw away each page once we've looked at it.
+"""
+
+import bz2
+from collections.abc import Iterable, Iterator
+import pathlib
+import typing
+from xml.etree import ElementTree as ET
+
+from flickypedia.backfillr.flickr_matcher import (
+    find_flickr_photo_id_from_raw_wikitext,
+)
+from .matcher import MatchedPhoto
+
+
+class WikitextPage(typing.TypedDict):
+    id: int
+    title: str
+    wikitext: str
+
+
+# The namespace for files on Wikimedia Commons, see
+# https://commons.wikimedia.org/wiki/Help:Namespaces
+FILE_NAMESPACE = "6"
+
+
+def _local_name(tag: str) -> str:
+    """
+    Remove the namespace from an XML tag, e.g.
+
+        {http://www.mediawiki.org/xml/export-0.11/}page ~> page
+
+    The namespace includes the version of the export format, so we
+    ignore it rather than hard-coding a particular version.
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_wikitext_dump(path: pathlib.Path | str) -> Iterator[WikitextPage]:
+    """
+    Generate the ID, title and Wikitext of every file in an XML dump.
+
+    The dump can be uncompressed or bz2-compressed.
+    """
+    in_file: typing.IO[bytes]
+
+    if str(path).endswith(".bz2"):
+        in_file = bz2.open(path)
+    else:
+        in_file = open(path, "rb")
+
+    with in_file:
+        events = ET.iterparse(in_file, events=("start", "end"))
+
+        # We need a reference to the root element, so we can remove
+        # each page from it after we've looked at it -- otherwise the
+        # whole document builds up in memory.
+        _, root = next(events)
+
+        for event, elem in events:
+            if event != "end" or _local_name(elem.tag) != "page":
+                continue
+
+            fields = {_local_name(child.tag): child for child in elem}
+
+            if fields["ns"].text == FILE_NAMESPACE:
+                # The text is inside <revision>; there's only one
+                # revision in a "pages-articles" dump.
+                text = next(
+                    (
+                        e.text or ""
+                        for e in fields["revision"]
+                        if _local_name(e.tag) == "text"
+                    ),
+                    "",
+                )
+
+                yield {
+                    "id": int(fields["id"].text or ""),
+                    "title": fields["title"].text or "",
+                    "wikitext": text,
+                }
+
+            root.clear()
+
+
+def find_matched_photos_in_wikitext(
+    pages: Iterable[WikitextPage],
+) -> Iterator[MatchedPhoto]:
+    """
+    Given the Wikitext for a set of files on Wikimedia Commons,
+    try to find whether there's a matching photo.
+    """
+    for page in pages:
+        photo_id = find_flickr_photo_id_from_raw_wikitext(page["wikitext"])
+
+        if photo_id is not None:
+            yield {
+                "flickr_photo_id": photo_id["photo_id"],
+                "wikimedia_page_id": f"M{page['id']}",
+                "wikimedia_page_title": page["title"],
+            }
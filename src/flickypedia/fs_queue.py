@@ -18,12 +18,16 @@ the filesystem.  See the comments in ``process_single_task()``.
 
 # Check this isn't a ecurity gap!
 
+from collections.abc import Iterator
 import abc
 import datetime
 import json
 import logging
 import os
 import pathlib
+import re
+import signal
+import threading
 import time
 import typing
 import uuid
@@ -31,6 +35,8 @@ import uuid
 from nitrate.json import DatetimeDecoder, DatetimeEncoder
 from nitrate.types import validate_type
 
+from flickypedia.directory_watcher import DirectoryWatcher
+
 
 In = typing.TypeVar("In")
 Out = typing.TypeVar("Out")
@@ -39,6 +45,9 @@ Out = typing.TypeVar("Out")
 State = typing.Literal["waiting", "in_progress", "failed", "completed"]
 
 
+WAITING_FILENAME_RE = re.compile(r"(?P<sequence_number>\d{20})-(?P<task_id>.+)")
+
+
 class TaskEvent(typing.TypedDict):
     time: datetime.datetime
     description: str
@@ -52,6 +61,41 @@ class Task(typing.TypedDict, typing.Generic[In, Out]):
     task_output: Out
 
 
+class TaskState(typing.TypedDict, typing.Generic[Out]):
+    """
+    The state and output of a task, without its input or events.
+    """
+
+    state: State
+    task_output: Out
+
+
+class TaskLocation(typing.NamedTuple):
+    """
+    Where a task is stored on disk, and how much of it we've written.
+
+    ``events_size`` is the committed size of the event log, or None
+    if the task is saved as a single JSON file.
+    """
+
+    path: pathlib.Path
+    state: State
+    event_count: int
+    events_size: int | None
+
+
+# The files in each task directory -- see ``write_task()``.
+INPUT_FILENAME = "input.json"
+STATE_FILENAME = "state.json"
+EVENTS_FILENAME = "events.jsonl"
+
+
+def _encode_events(events: list[TaskEvent]) -> bytes:
+    return b"".join(
+        json.dumps(ev, cls=DatetimeEncoder).encode("utf8") + b"\n" for ev in events
+    )
+
+
 class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
     """
     A basic task queue based on the file system.
@@ -76,7 +120,7 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
         | completed |     |  failed  |
         +-----------+     +----------+
 
-    Each task is stored in a single file.  Each of these states
+    Each task is stored in a single directory.  Each of these states
     represents a single folder.  The state of a task is the folder
     that it's in.
 
@@ -84,8 +128,17 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
     folder.  When the task is being worked on, it moves to "in progress".
     Finally, it moves to "completed/failed" depending on its final state.
 
+    Tasks in the "waiting" folder have a sequence number in their
+    filename, so we can find the oldest task by sorting the filenames.
+    The "waiting_index" folder has a symlink for each waiting task,
+    named with the task ID, so we can find a task without listing
+    the whole "waiting" folder.
+
     This class writes logs to ``queue.log`` inside the base directory.
 
+    When the queue is empty, workers watch the "waiting" folder and
+    wake up as soon as a new task arrives -- see ``DirectoryWatcher``.
+
     """
 
     def __init__(self, *, base_dir: pathlib.Path) -> None:
@@ -94,6 +147,20 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
         for dirname in self.directories:
             os.makedirs(dirname, exist_ok=True)
 
+        self._watcher: DirectoryWatcher | None = None
+        self._watcher_pid: int | None = None
+        self._watcher_lock = threading.Lock()
+
+        self._stop_requested = False
+
+        # The tasks this process is working on, and where they are.
+        # We own these tasks, so we can update them without reading
+        # them from disk first.
+        self._task_locations: dict[str, TaskLocation] = {}
+
+        self._last_sequence_number = 0
+        self._sequence_lock = threading.Lock()
+
         self.logger = logging.getLogger(name=str(base_dir))
         self.configure_logger()
 
@@ -104,11 +171,13 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
     def configure_logger(self) -> None:
         self.logger.setLevel(level=logging.DEBUG)
 
-        pid = os.getpid()
-
+        # We log the PID of the process that wrote each line, because
+        # there may be several workers writing to the same log.
         handler = logging.FileHandler(filename=self.logfile_path)
         handler.setFormatter(
-            fmt=logging.Formatter(f"%(asctime)s - {pid} - %(levelname)s - %(message)s")
+            fmt=logging.Formatter(
+                "%(asctime)s - %(process)d - %(levelname)s - %(message)s"
+            )
         )
 
         self.logger.addHandler(handler)
@@ -121,6 +190,7 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
             self.failed_dir,
             self.completed_dir,
             self.tmp_dir,
+            self.waiting_index_dir,
         }
 
     @property
@@ -143,67 +213,401 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
     def tmp_dir(self) -> pathlib.Path:
         return self.base_dir / "tmp"
 
-    def write_task(self, task: Task[In, Out]) -> None:
+    @property
+    def waiting_index_dir(self) -> pathlib.Path:
+        return self.base_dir / "waiting_index"
+
+    def _waiting_filename(self, task_id: str) -> str:
         """
-        Persist information about a task to disk.
+        Returns a filename for a task in the "waiting" folder.
+
+        Waiting tasks are named ``{sequence number}-{task ID}``, where
+        the sequence number is a zero-padded timestamp in nanoseconds.
+        This means the oldest task is the first filename in sorted
+        order, and we can find it without looking inside every file.
+        """
+        with self._sequence_lock:
+            self._last_sequence_number = max(
+                time.time_ns(), self._last_sequence_number + 1
+            )
+
+            return f"{self._last_sequence_number:020d}-{task_id}"
+
+    @staticmethod
+    def _parse_waiting_filename(filename: str) -> tuple[int, str]:
+        """
+        Returns the sequence number and task ID of a task in the
+        "waiting" folder.
+
+        Older versions of this queue named waiting tasks with just the
+        task ID; we give them sequence number 0 so they go first.
+        """
+        m = WAITING_FILENAME_RE.fullmatch(filename)
+
+        if m is None:
+            return 0, filename
+        else:
+            return int(m.group("sequence_number")), m.group("task_id")
+
+    def _find_waiting_path(self, task_id: str) -> pathlib.Path | None:
+        """
+        Returns the path to a task in the "waiting" folder, if it has
+        an entry in the waiting index.
+
+        The path may not exist -- if the task has just been claimed by
+        a worker, the worker may not have removed the entry yet.
+        """
+        try:
+            target = os.readlink(self.waiting_index_dir / task_id)
+        except FileNotFoundError:
+            return None
+
+        return self.waiting_dir / os.path.basename(target)
+
+    def _add_to_waiting_index(self, task_id: str, path: pathlib.Path) -> None:
+        """
+        Record the path of a task in the "waiting" folder.
+
+        We use a relative symlink, so the index still works if the
+        whole queue is moved somewhere else.
+        """
+        os.symlink(
+            os.path.join("..", self.waiting_dir.name, path.name),
+            self.waiting_index_dir / task_id,
+        )
+
+    def _remove_from_waiting_index(self, task_id: str) -> None:
+        """
+        Remove a task from the waiting index, once it's left "waiting".
+        """
+        try:
+            os.unlink(self.waiting_index_dir / task_id)
+        except FileNotFoundError:
+            pass
+
+    def _read_task_directory(
+        self, path: pathlib.Path, *, validate: bool = True
+    ) -> tuple[Task[In, Out], int | None]:
+        """
+        Read a task from disk, and return the task and the size of the
+        committed part of its event log.
+
+        Older versions of this queue saved each task as a single JSON file
+        rather than a directory; we can still read those, and we return
+        ``None`` for the event log size.
+        """
+        if not path.is_dir():
+            with open(path) as in_file:
+                t = json.load(in_file, cls=DatetimeDecoder)
+                return self._validate_task(t, validate=validate), None
+
+        with open(path / STATE_FILENAME) as in_file:
+            record = json.load(in_file, cls=DatetimeDecoder)
+
+        with open(path / INPUT_FILENAME) as in_file:
+            task_input = json.load(in_file, cls=DatetimeDecoder)
+
+        # Anything after ``events_size`` was written by an update that
+        # didn't finish, so we ignore it.
+        with open(path / EVENTS_FILENAME, "rb") as in_file:
+            events_log = in_file.read(record["events_size"])
+
+        t = {
+            "id": record["id"],
+            "events": [
+                json.loads(line, cls=DatetimeDecoder)
+                for line in events_log.splitlines()
+            ],
+            "state": record["state"],
+            "task_input": task_input,
+            "task_output": record["task_output"],
+        }
+
+        return self._validate_task(t, validate=validate), record["events_size"]
+
+    def _validate_task(self, t: typing.Any, *, validate: bool) -> Task[In, Out]:
+        if validate:
+            return validate_type(t, model=Task[In, Out])
+        else:
+            return typing.cast(Task[In, Out], t)
+
+    def _candidate_paths(self, task_id: str) -> Iterator[pathlib.Path]:
+        """
+        Generate the paths where this task might be stored.
+        """
+        # A task can only move forward through the states, so we look
+        # in the later folders, then "waiting", then the later folders
+        # again -- if the task moves while we're looking, we'll find it
+        # the second time round.
+        #
+        # We find waiting tasks through the waiting index, so we never
+        # have to list the "waiting" folder.
+        later_paths = [
+            self.in_progress_dir / task_id,
+            self.failed_dir / task_id,
+            self.completed_dir / task_id,
+        ]
+
+        yield from later_paths
+
+        waiting_path = self._find_waiting_path(task_id)
+
+        if waiting_path is not None:
+            yield waiting_path
+
+        # Older versions of this queue named waiting tasks with just
+        # the task ID, and didn't add them to the index.
+        yield self.waiting_dir / task_id
+
+        yield from later_paths
+
+    def _find_task(self, task_id: str, *, validate: bool = True) -> Task[In, Out]:
+        """
+        Find a task on disk, and return its contents.
+        """
+        for path in self._candidate_paths(task_id):
+            try:
+                task, _ = self._read_task_directory(path, validate=validate)
+                return task
+            except FileNotFoundError:
+                pass
+
+        raise ValueError(f"Could not find task with ID {task_id}")
+
+    def _find_state_record(
+        self, task_id: str
+    ) -> tuple[pathlib.Path, dict[str, typing.Any]]:
+        """
+        Find a task on disk, and return where it is and its state record.
+
+        This only reads ``state.json``, not the whole task.  If the task
+        is saved as a single JSON file, we read the file and return an
+        equivalent record, with ``events_size`` set to None.
+        """
+        for path in self._candidate_paths(task_id):
+            try:
+                if path.is_dir():
+                    with open(path / STATE_FILENAME) as in_file:
+                        return path, json.load(in_file, cls=DatetimeDecoder)
+                else:
+                    task, _ = self._read_task_directory(path, validate=False)
+
+                    return path, {
+                        "id": task["id"],
+                        "state": task["state"],
+                        "task_output": task["task_output"],
+                        "event_count": len(task["events"]),
+                        "events_size": None,
+                    }
+            except FileNotFoundError:
+                pass
+
+        raise ValueError(f"Could not find task with ID {task_id}")
+
+    def _locate_task(self, task_id: str) -> TaskLocation:
+        """
+        Find a task on disk, and return where it is.
+        """
+        path, record = self._find_state_record(task_id)
+
+        return TaskLocation(
+            path=path,
+            state=record["state"],
+            event_count=record["event_count"],
+            events_size=record["events_size"],
+        )
+
+    def _new_task_path(self, task: Task[In, Out]) -> pathlib.Path:
+        """
+        Returns the path where we should store a task which is moving
+        into a new state.
+        """
+        if task["state"] == "waiting":
+            return self.waiting_dir / self._waiting_filename(task["id"])
+        else:
+            return self.base_dir / task["state"] / task["id"]
 
-        Tasks are saved as JSON files.  We write and rename the files
-        atomically, which means there's always a single, valid file
-        describing the task on disk.
+    def _write_state_record(
+        self, task: Task[In, Out], *, task_dir: pathlib.Path, events_size: int
+    ) -> None:
         """
-        filename = task["id"]
+        Write the state record for a task.
 
-        tmp_path = self.tmp_dir / filename
-        out_path = self.base_dir / task["state"] / filename
+        This is the commit point for an update -- we write it to a temporary
+        file, then rename it into place, so readers always see either the
+        old record or the new one.
+        """
+        record = {
+            "id": task["id"],
+            "state": task["state"],
+            "task_output": task["task_output"],
+            "event_count": len(task["events"]),
+            "events_size": events_size,
+        }
+
+        tmp_path = self.tmp_dir / f"{task['id']}.{STATE_FILENAME}"
 
         # The use of exclusive file mode "x" means we'll throw if this
         # tmp file already exists -- this seems unlikely, but might
-        # indicate another process is working on this file.
+        # indicate another process is working on this task.
+        with open(tmp_path, "x") as tmp_file:
+            tmp_file.write(json.dumps(record, cls=DatetimeEncoder))
+
+        os.rename(tmp_path, task_dir / STATE_FILENAME)
+
+    def _create_task_directory(self, task: Task[In, Out]) -> None:
+        """
+        Save a new task to disk.
+
+        We create the task directory in the temporary folder, then
+        rename it into place, so the task appears all at once.
+        """
+        tmp_dir = self.tmp_dir / task["id"]
+
+        # This throws if the directory already exists, which might
+        # indicate another process is working on this task.
+        os.mkdir(tmp_dir)
+
+        with open(tmp_dir / INPUT_FILENAME, "x") as out_file:
+            out_file.write(json.dumps(task["task_input"], cls=DatetimeEncoder))
+
+        with open(tmp_dir / EVENTS_FILENAME, "xb") as events_file:
+            events_file.write(_encode_events(task["events"]))
+            events_size = events_file.tell()
+
+        self._write_state_record(task, task_dir=tmp_dir, events_size=events_size)
+
+        self._move_task(task, src=tmp_dir, prior_state=None)
+
+    def _move_task(
+        self, task: Task[In, Out], *, src: pathlib.Path, prior_state: State | None
+    ) -> pathlib.Path:
+        """
+        Move a task into the folder for its new state, and keep the
+        waiting index up-to-date.  Returns the new path.
+        """
+        path = self._new_task_path(task)
+
+        # We add a task to the index before it arrives in "waiting",
+        # so any worker or reader who can see the task can find it.
+        if task["state"] == "waiting":
+            self._add_to_waiting_index(task["id"], path)
+
+        os.rename(src, path)
+
+        if prior_state == "waiting":
+            self._remove_from_waiting_index(task["id"])
+
+        return path
+
+    def _write_legacy_task(self, task: Task[In, Out], *, path: pathlib.Path) -> None:
+        """
+        Update a task which was saved as a single JSON file by an older
+        version of this queue.
+
+        We keep it in the same format, rather than converting it to a
+        directory, because there's no way to swap a file for a directory
+        atomically -- the task would briefly disappear.
+        """
+        tmp_path = self.tmp_dir / task["id"]
+
         with open(tmp_path, "x") as tmp_file:
             tmp_file.write(json.dumps(task, cls=DatetimeEncoder))
 
-        # If the task is changing state, we need to make sure we remove
-        # the task in the previous folder.
+        os.rename(tmp_path, path)
+
+    def write_task(self, task: Task[In, Out]) -> None:
+        """
+        Persist information about a task to disk.
+
+        Each task is a directory with three files:
+
+        *   ``input.json`` has the task input, which we write once when
+            the task is created
+        *   ``events.jsonl`` is a log of the task events, which we only
+            ever append to
+        *   ``state.json`` has the state and output of the task, and the
+            number of events and size of the event log
+
+        This means an update only writes the new events and the (small)
+        state record, rather than the entire task.  The events on the
+        ``task`` should only ever be appended to -- we write any events
+        which aren't already on disk.
+        """
+        # If this is a task we're working on, we already know where it
+        # is and how much we've written.  Otherwise, we have to look.
+        try:
+            prior = self._task_locations[task["id"]]
+        except KeyError:
+            try:
+                prior = self._locate_task(task_id=task["id"])
+            except ValueError:
+                self._create_task_directory(task)
+                return
+
+        events_size: int | None
+
+        if prior.events_size is None:
+            self._write_legacy_task(task, path=prior.path)
+            events_size = None
+        else:
+            # Append any new events to the log.  If a previous update didn't
+            # finish, there may be events after the committed size -- we
+            # throw those away before appending.
+            new_events = task["events"][prior.event_count :]
+
+            with open(prior.path / EVENTS_FILENAME, "r+b") as events_file:
+                events_file.seek(prior.events_size)
+                events_file.truncate()
+                events_file.write(_encode_events(new_events))
+                events_size = events_file.tell()
+
+            self._write_state_record(task, task_dir=prior.path, events_size=events_size)
+
+        # If the task is changing state, we need to move it out of the
+        # previous folder.
         #
         # e.g. if the task is going from 'waiting' to 'in progress',
-        # we first update the file in 'waiting', then we move that file
+        # we first update the task in 'waiting', then we move it
         # into 'in progress'.
         #
-        # If the task isn't changing state, we just update the file
-        # in the current folder.
-        #
         # Note that ``os.rename()`` is atomic, which is how we get
-        # atomic-like file writes.
-        try:
-            prior_task = self.read_task(task_id=task["id"])
-        except ValueError:
-            prior_task = None
-
-        if prior_task is not None and prior_task["state"] != task["state"]:
-            prior_path = self.base_dir / prior_task["state"] / filename
-            os.rename(tmp_path, prior_path)
-            os.rename(prior_path, out_path)
+        # atomic-like updates.
+        if prior.state != task["state"]:
+            path = self._move_task(task, src=prior.path, prior_state=prior.state)
         else:
-            os.rename(tmp_path, out_path)
+            path = prior.path
+
+        if task["id"] in self._task_locations:
+            self._task_locations[task["id"]] = TaskLocation(
+                path=path,
+                state=task["state"],
+                event_count=len(task["events"]),
+                events_size=events_size,
+            )
 
-    def read_task(self, task_id: str) -> Task[In, Out]:
+    def read_task(self, task_id: str, *, validate: bool = True) -> Task[In, Out]:
         """
         Return the state of a currently running task.
+
+        If ``validate`` is False, we skip checking the task matches
+        the expected types -- this is much faster for big tasks, and
+        it's safe if you only need a few fields.
         """
-        for dirname in [
-            self.waiting_dir,
-            self.in_progress_dir,
-            self.failed_dir,
-            self.completed_dir,
-        ]:
-            try:
-                with open(dirname / task_id) as in_file:
-                    t = json.load(in_file, cls=DatetimeDecoder)
-                    return validate_type(t, model=Task[In, Out])
-            except FileNotFoundError:
-                pass
+        return self._find_task(task_id, validate=validate)
 
-        raise ValueError(f"Could not find task with ID {task_id}")
+    def read_task_state(self, task_id: str) -> TaskState[Out]:
+        """
+        Return the state and output of a task.
+
+        This only reads the task's state record, not its input or
+        events, so it's much cheaper than ``read_task()`` -- use it if
+        you're polling a task to see how it's getting on.  Note that
+        we don't validate the output.
+        """
+        _, record = self._find_state_record(task_id)
+
+        return {"state": record["state"], "task_output": record["task_output"]}
 
     def start_task(
         self,
@@ -218,7 +622,7 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
 
         self.logger.info("Creating task %s", task_id)
 
-        self.write_task(
+        self._create_task_directory(
             task={
                 "id": task_id,
                 "events": [
@@ -247,42 +651,65 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
 
         self.write_task(task)
 
-    def _next_available_task(self) -> str | None:
+    def _get_watcher(self) -> DirectoryWatcher:
         """
-        Returns the ID of the next available task (if any).
+        Returns a watcher for the "waiting" folder.
+
+        We create the watcher lazily, and create a new one if we've
+        been forked -- a child process shouldn't share the parent's
+        inotify file descriptor, or they'd steal each other's events.
         """
-        # A list of tuples (filename, modified time)
-        candidates = []
+        with self._watcher_lock:
+            if self._watcher is None or self._watcher_pid != os.getpid():
+                if self._watcher is not None:
+                    self._watcher.close()
 
-        for filename in os.listdir(self.waiting_dir):
-            try:
-                candidates.append(
-                    (filename, os.path.getmtime(self.waiting_dir / filename))
-                )
-            except FileNotFoundError:
-                pass
+                self._watcher = DirectoryWatcher(self.waiting_dir)
+                self._watcher_pid = os.getpid()
+
+            return self._watcher
 
+    def _next_available_task(self) -> str | None:
+        """
+        Returns the filename of the next available task (if any).
+
+        The filenames sort in the order the tasks were created, so
+        this is a single directory listing -- we don't need to look
+        at the individual files.
+        """
         try:
-            filename, _ = min(candidates, key=lambda fm: fm[1])
-            return filename
+            return min(os.listdir(self.waiting_dir), key=self._parse_waiting_filename)
         except ValueError:
             return None
 
-    def process_single_task(self) -> str | None:
+    def process_single_task(self, *, timeout: float = 1) -> str | None:
         """
         Process the next available task.
 
+        If there aren't any tasks, wait up to ``timeout`` seconds
+        for one to arrive.
+
         Returns the ID of the task that was processed, if any.
         """
-        this_task_id = self._next_available_task()
+        # Note: we have to start watching the "waiting" folder before
+        # we look in it, or we could miss a task that arrives in the
+        # gap between looking and starting to wait.
+        watcher = self._get_watcher()
+
+        waiting_filename = self._next_available_task()
 
         # If there wasn't a next task, we assume the queue is empty
-        # and wait for 1 second before looking again.
-        if this_task_id is None:
-            self.logger.debug("No tasks found, sleeping for 1 second...")
-            time.sleep(1)
+        # and wait for a new task to arrive.
+        if waiting_filename is None:
+            self.logger.debug("No tasks found, waiting for %s seconds...", timeout)
+            if watcher.wait(timeout):
+                waiting_filename = self._next_available_task()
+
+        if waiting_filename is None or self._stop_requested:
             return None
 
+        _, this_task_id = self._parse_waiting_filename(waiting_filename)
+
         # Atomically move the task from "waiting" to "in progress".
         # This will make the task unavailable for other processes
         # and only available to this process.
@@ -301,7 +728,7 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
 
         try:
             os.rename(
-                src=self.waiting_dir / this_task_id,
+                src=self.waiting_dir / waiting_filename,
                 dst=self.in_progress_dir / this_task_id,
             )
         except FileNotFoundError:
@@ -311,41 +738,86 @@ class AbstractFilesystemTaskQueue(abc.ABC, typing.Generic[In, Out]):
             )
             return None
 
-        # Now actually start working on the task.
-        task = self.read_task(task_id=this_task_id)
+        self._remove_from_waiting_index(this_task_id)
+
+        # Now actually start working on the task.  We've just claimed it,
+        # so we know where it is -- and we remember that, so we don't have
+        # to find it again every time we update it.
+        in_progress_path = self.in_progress_dir / this_task_id
 
-        self.record_task_event(task, state="in_progress", event="Task started")
+        task, events_size = self._read_task_directory(in_progress_path)
+
+        self._task_locations[this_task_id] = TaskLocation(
+            path=in_progress_path,
+            state="in_progress",
+            event_count=len(task["events"]),
+            events_size=events_size,
+        )
 
         try:
-            self.process_individual_task(task)
-        except Exception as exc:
-            self.logger.error(
-                "Task %s: task failed with exception %r", this_task_id, exc
-            )
+            self.record_task_event(task, state="in_progress", event="Task started")
 
-            self.record_task_event(
-                task, state="failed", event=f"Task failed with an exception: {exc}"
-            )
-        else:
-            self.logger.info("Task %s: task completed without exception", this_task_id)
+            try:
+                self.process_individual_task(task)
+            except Exception as exc:
+                self.logger.error(
+                    "Task %s: task failed with exception %r", this_task_id, exc
+                )
 
-            self.record_task_event(
-                task, state="completed", event="Task completed without exception"
-            )
+                self.record_task_event(
+                    task, state="failed", event=f"Task failed with an exception: {exc}"
+                )
+            else:
+                self.logger.info(
+                    "Task %s: task completed without exception", this_task_id
+                )
+
+                self.record_task_event(
+                    task, state="completed", event="Task completed without exception"
+                )
+        finally:
+            del self._task_locations[this_task_id]
 
         return task["id"]
 
+    def count_tasks(self, state: State) -> int:
+        """
+        Returns the number of tasks in the given state.
+        """
+        return len(os.listdir(self.base_dir / state))
+
+    def request_stop(self) -> None:
+        """
+        Ask ``process_tasks()`` to stop.
+
+        If we're working on a task, we finish it before stopping; if
+        we're waiting for a task, we stop immediately.  This is safe
+        to call from a signal handler.
+        """
+        self._stop_requested = True
+
+        if self._watcher is not None and self._watcher_pid == os.getpid():
+            self._watcher.wake()
+
     def process_tasks(self) -> None:  # pragma: no cover
         """
         Keep looking for new tasks, and when found, start working on them.
+
+        This runs until we get a SIGTERM, or somebody calls ``request_stop()``.
         """
         print(f"Looking for tasks in {self.base_dir}...")
         print(f"Follow the log at {self.logfile_path}")
 
         self.logger.info("Starting looking for tasks in the queue...")
 
-        while True:
-            self.process_single_task()
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.request_stop())
+
+        # We wake up as soon as a task arrives, so we can wait a long
+        # time between checks when the queue is idle.
+        while not self._stop_requested:
+            self.process_single_task(timeout=60)
+
+        self.logger.info("Stopped looking for tasks in the queue")
 
     @abc.abstractmethod
     def process_individual_task(self, t: Task[In, Out]) -> None:
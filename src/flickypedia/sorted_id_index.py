@@ -0,0 +1,171 @@
+"""
+A read-only file format for looking up the Flickr photos which are
+on Wikimedia Commons, as an alternative to SQLite.
+
+The file is a sorted array of Flickr photo IDs, and parallel arrays
+which describe the file on Commons for each ID:
+
+    magic (8 bytes)
+    number of entries N (8 bytes)
+    Flickr photo IDs, sorted         (N × 64-bit integers)
+    Commons page IDs                 (N × 64-bit integers)
+    offsets into the title table     ((N + 1) × 64-bit integers)
+    title table                      (UTF-8 titles, one after another)
+
+The title for entry ``i`` is ``titles[offsets[i]:offsets[i + 1]]``.
+All the integers are unsigned and little-endian.
+
+If a photo is on Commons more than once, its ID appears once for
+each copy, and the copies are next to each other.
+
+We memory-map the file, so looking up an ID is a binary search in
+memory that's shared by every process which has the file open --
+there's no connection to open or query to parse.
+"""
+
+from collections.abc import Iterable, Iterator
+import bisect
+import mmap
+import os
+import pathlib
+import shutil
+import struct
+import tempfile
+
+
+MAGIC = b"FLKIDIDX"
+
+HEADER = struct.Struct("<8sQ")
+
+# The 64-bit integer type for ``memoryview.cast()`` and ``struct``.
+# It's only little-endian on little-endian machines, but that's
+# all we run on.
+UINT64 = "Q"
+
+
+class SortedIdIndex:
+    def __init__(self, path: pathlib.Path | str) -> None:
+        with open(path, "rb") as in_file:
+            self._mmap = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, self.count = HEADER.unpack_from(self._mmap)
+        except struct.error:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a sorted ID index")
+
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a sorted ID index")
+
+        n = self.count
+        ids_start = HEADER.size
+        page_ids_start = ids_start + n * 8
+        offsets_start = page_ids_start + n * 8
+        self._titles_start = offsets_start + (n + 1) * 8
+
+        if len(self._mmap) < self._titles_start:
+            self._mmap.close()
+            raise ValueError(f"{path} is truncated")
+
+        # These are views into the memory-mapped file, so they don't
+        # copy any data, and ``bisect`` can search them directly.
+        view = memoryview(self._mmap)
+        self._view = view
+        self.flickr_photo_ids = view[ids_start:page_ids_start].cast(UINT64)
+        self.page_ids = view[page_ids_start:offsets_start].cast(UINT64)
+        self.offsets = view[offsets_start : self._titles_start].cast(UINT64)
+
+        if len(self._mmap) < self._titles_start + self.offsets[n]:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+    def get_title(self, i: int) -> str:
+        start = self._titles_start + self.offsets[i]
+        end = self._titles_start + self.offsets[i + 1]
+
+        return self._mmap[start:end].decode("utf8")
+
+    def find(self, flickr_photo_ids: Iterable[int]) -> Iterator[tuple[int, int, str]]:
+        """
+        Generate the (Flickr photo ID, page ID, title) of every copy of
+        these photos, sorted by Flickr photo ID.
+
+        We look up the IDs in sorted order, and start each search where
+        the last one finished, so a batch of IDs only needs one pass
+        over the array.
+        """
+        lo = 0
+
+        for photo_id in sorted(set(flickr_photo_ids)):
+            lo = bisect.bisect_left(self.flickr_photo_ids, photo_id, lo=lo)
+
+            while lo < self.count and self.flickr_photo_ids[lo] == photo_id:
+                yield photo_id, self.page_ids[lo], self.get_title(lo)
+                lo += 1
+
+    def close(self) -> None:
+        # We have to release the views before we can close the mmap.
+        self.flickr_photo_ids.release()
+        self.page_ids.release()
+        self.offsets.release()
+        self._view.release()
+        self._mmap.close()
+
+
+def write_sorted_id_index(
+    path: pathlib.Path | str, entries: Iterable[tuple[int, int, str]]
+) -> int:
+    """
+    Create a sorted ID index from a list of (Flickr photo ID, page ID,
+    title), which must already be sorted by Flickr photo ID.
+
+    Returns the number of entries written.
+
+    We don't know how many entries there are until we've seen them all,
+    so we write each section to a temporary file and join them at the end.
+    This means we never hold the entries in memory.
+    """
+    with (
+        tempfile.TemporaryFile() as ids_file,
+        tempfile.TemporaryFile() as page_ids_file,
+        tempfile.TemporaryFile() as offsets_file,
+        tempfile.TemporaryFile() as titles_file,
+    ):
+        pack_uint64 = struct.Struct("<" + UINT64).pack
+
+        count = 0
+        offset = 0
+        previous_id = -1
+
+        for flickr_photo_id, page_id, title in entries:
+            if flickr_photo_id < previous_id:
+                raise ValueError(
+                    f"Entries are not sorted: {flickr_photo_id} after {previous_id}"
+                )
+            previous_id = flickr_photo_id
+
+            encoded_title = title.encode("utf8")
+
+            ids_file.write(pack_uint64(flickr_photo_id))
+            page_ids_file.write(pack_uint64(page_id))
+            offsets_file.write(pack_uint64(offset))
+            titles_file.write(encoded_title)
+
+            offset += len(encoded_title)
+            count += 1
+
+        offsets_file.write(pack_uint64(offset))
+
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, "wb") as out_file:
+            out_file.write(HEADER.pack(MAGIC, count))
+
+            for section in (ids_file, page_ids_file, offsets_file, titles_file):
+                section.seek(0)
+                shutil.copyfileobj(section, out_file)
+
+        os.replace(tmp_path, path)
+
+    return count
@@ -34,6 +34,7 @@ from .views import (
     about,
     bookmarklet,
     faqs,
+    find_duplicates_api,
     find_matching_categories_api,
     find_matching_languages_api,
     get_photos,
@@ -106,6 +107,9 @@ def create_app(
     app.add_url_rule("/faqs/", view_func=faqs)
 
     app.add_url_rule("/api/validate_title", view_func=validate_title_api)
+    app.add_url_rule(
+        "/api/find_duplicates", view_func=find_duplicates_api, methods=["GET", "POST"]
+    )
     app.add_url_rule(
         "/api/find_matching_categories", view_func=find_matching_categories_api
     )
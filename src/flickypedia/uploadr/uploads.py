@@ -55,6 +55,11 @@ class PhotoUploadQueue(AbstractFilesystemTaskQueue[UploadBatch, UploadBatchResul
         api = WikimediaApi(client=client)
 
         # Now go through the upload requests one-by-one.
+        #
+        # Note: each photo is recorded in the duplicates database as soon
+        # as it's uploaded, not at the end of the task -- so if this worker
+        # dies part-way through, we still know about the photos it's
+        # uploaded, and other workers can see them straight away.
         for upload_request in task["task_input"]["requests"]:
             photo_id = upload_request["photo"]["id"]
 
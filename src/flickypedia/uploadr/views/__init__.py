@@ -1,6 +1,7 @@
 from flask import Flask, render_template
 
 from .api import (
+    find_duplicates_api,
     find_matching_categories_api,
     find_matching_languages_api,
     validate_title_api,
@@ -42,6 +43,7 @@ __all__ = [
     "bookmarklet",
     "buddy_icon",
     "faqs",
+    "find_duplicates_api",
     "find_matching_categories_api",
     "find_matching_languages_api",
     "get_photos",
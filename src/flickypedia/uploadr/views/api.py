@@ -1,9 +1,16 @@
 import functools
+import hashlib
+import re
 
-from flask import abort, jsonify, request
+from flask import abort, jsonify, make_response, request
 from flask_login import current_user, login_required
 
 from flickypedia.apis.wikimedia import top_n_languages, LanguageMatch
+from flickypedia.duplicates import (
+    DuplicateInfo,
+    find_all_duplicates,
+    get_duplicates_generation,
+)
 from flickypedia.types.views import ViewResponse
 
 
@@ -88,3 +95,98 @@ def find_matching_languages_api() -> ViewResponse:
     result = find_matching_languages(query)
 
     return jsonify(result)
+
+
+# The most Flickr photo IDs we'll look up in a single request.
+MAX_IDS_PER_REQUEST = 10000
+
+FLICKR_PHOTO_ID_RE = re.compile(r"[1-9][0-9]*")
+
+
+@functools.lru_cache(maxsize=128)
+def find_cached_duplicates(
+    generation: str, flickr_photo_ids: tuple[str, ...]
+) -> dict[str, list[DuplicateInfo]]:
+    """
+    Find the duplicates for a large batch of Flickr photo IDs.
+
+    The ``generation`` isn't used in the lookup, but it's part of the
+    cache key -- so if the duplicates databases change, we look up the
+    IDs again rather than returning an out-of-date result.
+    """
+    return find_all_duplicates(list(flickr_photo_ids))
+
+
+def find_duplicates_api() -> ViewResponse:
+    """
+    An API for checking whether Flickr photos are already on Commons,
+    which can be used by other tools.
+
+    You can pass the IDs in the query string:
+
+        GET /api/find_duplicates?flickr_photo_ids=9999819294,9999868886
+
+    or for large batches, in a JSON body:
+
+        POST /api/find_duplicates
+        {"flickr_photo_ids": ["9999819294", "9999868886"]}
+
+    The response includes every file on Commons for each photo:
+
+        {"duplicates": {"9999819294": [{"id": "M29907038", "title": "File:…"}]}}
+
+    The ETag only changes when the duplicates databases change, so
+    clients can send ``If-None-Match`` to skip re-downloading a result
+    they've already seen.
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+
+        if not isinstance(body, dict):
+            abort(400)
+
+        flickr_photo_ids = body.get("flickr_photo_ids")
+    else:
+        try:
+            flickr_photo_ids = request.args["flickr_photo_ids"].split(",")
+        except KeyError:
+            abort(400)
+
+    # Flickr photo IDs are always positive integers, so anything else
+    # is a mistake.  We only accept the canonical form -- e.g. "0123"
+    # would match photo 123, and come back under a different ID.
+    if (
+        not isinstance(flickr_photo_ids, list)
+        or len(flickr_photo_ids) > MAX_IDS_PER_REQUEST
+        or not all(
+            isinstance(photo_id, str) and FLICKR_PHOTO_ID_RE.fullmatch(photo_id)
+            for photo_id in flickr_photo_ids
+        )
+    ):
+        abort(400)
+
+    # Sorting the IDs means we get the same ETag and cache entry for
+    # the same IDs, whatever order they're sent in.
+    sorted_ids = tuple(sorted(set(flickr_photo_ids)))
+
+    generation = get_duplicates_generation()
+
+    etag = hashlib.sha256(
+        f"{generation}\n{','.join(sorted_ids)}".encode("utf8")
+    ).hexdigest()
+
+    # For GET requests, we can tell the client their copy is still
+    # up-to-date without looking up the IDs.  (HTTP doesn't allow
+    # a "304 Not Modified" response to a POST request.)
+    if request.method == "GET" and request.if_none_match.contains(etag):
+        resp = make_response("", 304)
+    else:
+        resp = jsonify({"duplicates": find_cached_duplicates(generation, sorted_ids)})
+
+    resp.set_etag(etag)
+
+    # Allow clients and proxies to cache the response, but they have
+    # to check with us that it's still up-to-date before reusing it.
+    resp.cache_control.no_cache = True
+
+    return resp
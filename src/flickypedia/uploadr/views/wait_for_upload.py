@@ -70,7 +70,11 @@ def wait_for_upload(task_id: str) -> ViewResponse:
 @login_required
 def get_upload_status(task_id: str) -> ViewResponse:
     q = uploads_queue()
-    task = q.read_task(task_id)
+
+    # This is polled while the upload is running, and we only need
+    # the state and output, so we don't read the (large) input or
+    # the event log.
+    task = q.read_task_state(task_id)
 
     return jsonify(
         {
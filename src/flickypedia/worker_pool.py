@@ -0,0 +1,207 @@
+"""
+Run several copies of a worker in separate processes, and keep
+them running.
+
+This is how we scale the background worker beyond a single process,
+without an external process manager.  Each worker is a forked copy
+of this process, and they coordinate through the task queue -- only
+one worker can claim a task, see ``fs_queue``.
+
+The supervisor:
+
+*   restarts workers which exit unexpectedly
+*   sends SIGTERM to every worker when it gets a SIGTERM or SIGINT,
+    then waits for them to finish their current task and exit
+*   can add and remove workers as the queue grows and shrinks
+
+"""
+
+from collections.abc import Callable
+import logging
+import os
+import signal
+import sys
+import time
+import traceback
+import types
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        target: Callable[[], None],
+        *,
+        min_workers: int,
+        max_workers: int | None = None,
+        get_queue_depth: Callable[[], int] | None = None,
+        logger: logging.Logger,
+        check_interval: float = 1,
+        restart_delay: float = 1,
+    ) -> None:
+        """
+        Create a pool which runs ``target`` in each worker.
+
+        The pool runs ``min_workers`` workers.  If you pass ``max_workers``
+        and ``get_queue_depth``, it runs one worker for each task in the
+        queue, somewhere between ``min_workers`` and ``max_workers``.
+
+        If a worker exits unexpectedly, we wait ``restart_delay`` seconds
+        before replacing it, so a worker which crashes on startup doesn't
+        put us in a tight loop.
+        """
+        if min_workers < 1:
+            raise ValueError(f"Need at least one worker, got {min_workers}")
+
+        if max_workers is not None and max_workers < min_workers:
+            raise ValueError(
+                f"Maximum workers ({max_workers}) is less than minimum ({min_workers})"
+            )
+
+        self.target = target
+        self.min_workers = min_workers
+        self.max_workers = max_workers or min_workers
+        self.get_queue_depth = get_queue_depth
+        self.logger = logger
+        self.check_interval = check_interval
+        self.restart_delay = restart_delay
+
+        # The running workers, as a map (pid) -> (start time).  We
+        # iterate in start order, so we retire the newest workers first.
+        self.workers: dict[int, float] = {}
+
+        # Workers we've asked to stop, which haven't exited yet.
+        self.retiring: set[int] = set()
+
+        self.is_stopping = False
+        self.next_start_time = 0.0
+
+    def desired_worker_count(self) -> int:
+        """
+        Returns the number of workers we should be running.
+        """
+        if self.get_queue_depth is None or self.max_workers == self.min_workers:
+            return self.min_workers
+
+        return max(self.min_workers, min(self.max_workers, self.get_queue_depth()))
+
+    def _start_worker(self) -> None:
+        pid = os.fork()
+
+        if pid == 0:  # pragma: no cover
+            # This is the worker process.  It should never return from
+            # this function, or it'll start running the supervisor loop.
+            #
+            # We restore the default SIGTERM handler so the target can
+            # install its own, and we ignore SIGINT -- if somebody presses
+            # Ctrl-C in the terminal, the supervisor gets it and tells
+            # the workers to stop gracefully.
+            exit_code = 1
+
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+                self.target()
+                exit_code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+
+        self.logger.info("Started worker %d", pid)
+        self.workers[pid] = time.monotonic()
+
+    def _retire_worker(self, pid: int) -> None:
+        self.logger.info("Asking worker %d to stop", pid)
+        self.retiring.add(pid)
+
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:  # pragma: no cover
+            pass
+
+    def _reap_workers(self) -> None:
+        """
+        Clean up any workers which have exited.
+        """
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+
+            if pid == 0:
+                break
+
+            exit_code = os.waitstatus_to_exitcode(status)
+            del self.workers[pid]
+
+            if pid in self.retiring:
+                self.retiring.remove(pid)
+                self.logger.info("Worker %d stopped", pid)
+            elif not self.is_stopping:
+                self.logger.warning(
+                    "Worker %d exited unexpectedly with exit code %d, restarting",
+                    pid,
+                    exit_code,
+                )
+                self.next_start_time = time.monotonic() + self.restart_delay
+
+    def _scale_workers(self) -> None:
+        """
+        Start or stop workers until we're running the right number.
+        """
+        running = [pid for pid in self.workers if pid not in self.retiring]
+        desired = self.desired_worker_count()
+
+        if len(running) < desired and time.monotonic() >= self.next_start_time:
+            for _ in range(desired - len(running)):
+                self._start_worker()
+        elif len(running) > desired:
+            for pid in running[desired:]:
+                self._retire_worker(pid)
+
+    def _retire_all_workers(self) -> None:
+        for pid in list(self.workers):
+            if pid not in self.retiring:
+                self._retire_worker(pid)
+
+    def stop(self) -> None:
+        """
+        Ask every worker to stop, and stop starting new ones.
+
+        ``run()`` returns once all the workers have exited.  This is
+        safe to call from a signal handler.
+        """
+        self.is_stopping = True
+        self._retire_all_workers()
+
+    def _handle_signal(self, signum: int, frame: types.FrameType | None) -> None:
+        self.logger.info("Got signal %d, stopping workers", signum)
+        self.stop()
+
+    def run(self) -> None:
+        """
+        Start the workers, and supervise them until we're stopped.
+        """
+        previous_handlers = {
+            signum: signal.signal(signum, self._handle_signal)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+
+        try:
+            while not self.is_stopping or self.workers:
+                self._reap_workers()
+
+                # Note: we retire workers on every loop when stopping, in
+                # case we got the signal while we were starting a worker.
+                if self.is_stopping:
+                    self._retire_all_workers()
+                else:
+                    self._scale_workers()
+
+                time.sleep(self.check_interval)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        self.logger.info("All workers stopped")
@@ -1,11 +1,28 @@
 import bz2
+import json
 import pathlib
+import typing
 
 from nitrate.types import validate_type
 from pydantic import ValidationError
 import pytest
 
-from flickypedia.apis.snapshots import parse_sdc_snapshot, SnapshotEntry
+from flickypedia.apis.snapshots import (
+    CompactSnapshotEntry,
+    create_snapshot_index,
+    create_snapshot_shards,
+    get_snapshot_entry,
+    is_sharded_snapshot,
+    might_mention_flickr,
+    parse_sdc_snapshot,
+    read_lines_in_range,
+    read_snapshot_lines,
+    read_shard_manifest,
+    ShardCompression,
+    split_bz2_file,
+    SnapshotEntry,
+)
+from utils import create_snapshot, create_snapshot_entry, get_existing_claims_fixture
 
 
 def test_parse_sdc_snapshot() -> None:
@@ -34,6 +51,439 @@ def test_parse_busted_sdc_snapshot_is_error(tmp_path: pathlib.Path) -> None:
         list(parse_sdc_snapshot(snapshot_path))
 
 
+class TestMsgspecEngine:
+    def test_decodes_entries(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        statements = get_existing_claims_fixture("M138765382_P12120.json")
+        entry = create_snapshot_entry(pageid=138765382, statements=statements)
+        create_snapshot(snapshot_path, entries=[entry])
+
+        (actual,) = parse_sdc_snapshot(snapshot_path, engine="msgspec")
+
+        assert isinstance(actual, CompactSnapshotEntry)
+        assert actual.id == "M138765382"
+        assert actual["title"] == "File:Example 138765382.jpg"
+        assert actual["pageid"] == 138765382
+        assert actual["statements"] == statements
+
+    def test_statements_are_only_decoded_once(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        statements = get_existing_claims_fixture("M138765382_P12120.json")
+        entry = create_snapshot_entry(pageid=138765382, statements=statements)
+        create_snapshot(snapshot_path, entries=[entry])
+
+        (actual,) = parse_sdc_snapshot(snapshot_path, engine="msgspec")
+
+        assert actual["statements"] is actual["statements"]
+        assert actual.statements is actual["statements"]
+
+    def test_matches_the_pydantic_engine(self) -> None:
+        snapshot_path = pathlib.Path(
+            "tests/fixtures/commons-20231207-mediainfo.slice.json.bz2"
+        )
+
+        pydantic_entries = list(parse_sdc_snapshot(snapshot_path))
+        msgspec_entries = list(parse_sdc_snapshot(snapshot_path, engine="msgspec"))
+
+        assert len(msgspec_entries) == len(pydantic_entries) == 2
+
+        for p_entry, m_entry in zip(pydantic_entries, msgspec_entries):
+            for key in ("id", "title", "pageid", "lastrevid", "modified"):
+                assert p_entry[key] == m_entry[key]  # type: ignore
+
+            assert p_entry["labels"] == m_entry["labels"]
+            assert p_entry["descriptions"] == m_entry["descriptions"]
+            assert p_entry["statements"] == m_entry["statements"]
+
+    def test_works_with_multiple_processes(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 11)]
+        create_snapshot(snapshot_path, entries, streams=3)
+
+        actual = parse_sdc_snapshot(snapshot_path, processes=2, engine="msgspec")
+
+        assert sorted(e.pageid for e in actual) == list(range(1, 11))
+
+    def test_busted_entry_is_pydantic_error(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+
+        with bz2.open(snapshot_path, "xb") as out_file:
+            out_file.write(b"""[\n{"data in": "the wrong format"}\n]""")
+
+        with pytest.raises(ValidationError):
+            list(parse_sdc_snapshot(snapshot_path, engine="msgspec"))
+
+    def test_unknown_field_is_pydantic_error(self, tmp_path: pathlib.Path) -> None:
+        """
+        pydantic rejects entries with fields we don't know about, so
+        the msgspec engine does too.
+        """
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entry = create_snapshot_entry(pageid=1)
+        entry["unknown_field"] = "surprise!"  # type: ignore
+        create_snapshot(snapshot_path, entries=[entry])
+
+        with pytest.raises(ValidationError):
+            list(parse_sdc_snapshot(snapshot_path, engine="msgspec"))
+
+    def test_busted_statements_are_error_when_read(
+        self, tmp_path: pathlib.Path
+    ) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entry = create_snapshot_entry(pageid=1)
+        entry["statements"] = {"P180": [{"the wrong": "format"}]}  # type: ignore
+        create_snapshot(snapshot_path, entries=[entry])
+
+        (actual,) = parse_sdc_snapshot(snapshot_path, engine="msgspec")
+
+        with pytest.raises(ValidationError):
+            actual.statements
+
+    @pytest.mark.parametrize(
+        "field, value",
+        [
+            ("labels", {"en": {"language": "en", "value": "A", "extra": "!"}}),
+            ("descriptions", {"en": {"language": "en", "value": "A", "extra": "!"}}),
+            (
+                "statements",
+                {
+                    "P180": [
+                        {
+                            "id": "M1$1",
+                            "mainsnak": {
+                                "property": "P180",
+                                "snaktype": "somevalue",
+                                "extra": "!",
+                            },
+                            "rank": "normal",
+                            "type": "statement",
+                        }
+                    ]
+                },
+            ),
+            (
+                "statements",
+                {
+                    "P12120": [
+                        {
+                            "id": "M1$1",
+                            "mainsnak": {
+                                "datavalue": {
+                                    "type": "string",
+                                    "value": "53253175319",
+                                    "extra": "!",
+                                },
+                                "property": "P12120",
+                                "snaktype": "value",
+                            },
+                            "rank": "normal",
+                            "type": "statement",
+                        }
+                    ]
+                },
+            ),
+        ],
+    )
+    def test_unknown_nested_field_is_pydantic_error(
+        self, tmp_path: pathlib.Path, field: str, value: typing.Any
+    ) -> None:
+        """
+        pydantic rejects unknown fields anywhere in an entry, so the
+        msgspec engine does too -- when the field is read.
+        """
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entry = create_snapshot_entry(pageid=1)
+        entry[field] = value  # type: ignore
+        create_snapshot(snapshot_path, entries=[entry])
+
+        with pytest.raises(ValidationError):
+            list(parse_sdc_snapshot(snapshot_path))
+
+        (actual,) = parse_sdc_snapshot(snapshot_path, engine="msgspec")
+
+        with pytest.raises(ValidationError):
+            actual[field]  # type: ignore
+
+    def test_decodes_labels_and_descriptions(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entry = create_snapshot_entry(pageid=1)
+        entry["labels"] = {"en": {"language": "en", "value": "A photo"}}
+        entry["descriptions"] = {"de": {"language": "de", "value": "Ein Foto"}}
+        create_snapshot(snapshot_path, entries=[entry])
+
+        (actual,) = parse_sdc_snapshot(snapshot_path, engine="msgspec")
+
+        assert actual["labels"] == entry["labels"]
+        assert actual["descriptions"] == entry["descriptions"]
+
+
+class TestPrefilter:
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_skips_lines_that_dont_match(
+        self, tmp_path: pathlib.Path, processes: int
+    ) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        flickr_entry = create_snapshot_entry(
+            pageid=138765382,
+            statements=get_existing_claims_fixture("M138765382_P12120.json"),
+        )
+        create_snapshot(
+            snapshot_path,
+            entries=[
+                create_snapshot_entry(pageid=1),
+                flickr_entry,
+                create_snapshot_entry(pageid=2),
+            ],
+            streams=2,
+        )
+
+        actual = parse_sdc_snapshot(
+            snapshot_path, processes=processes, prefilter=might_mention_flickr
+        )
+
+        assert list(actual) == [flickr_entry]
+
+    def test_lines_that_dont_match_are_not_decoded(
+        self, tmp_path: pathlib.Path
+    ) -> None:
+        """
+        A line that doesn't match the prefilter is skipped before
+        we try to decode it, so it doesn't matter if it's invalid.
+        """
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+
+        with bz2.open(snapshot_path, "xb") as out_file:
+            out_file.write(b"[\n{not valid JSON},\n]")
+
+        assert (
+            list(parse_sdc_snapshot(snapshot_path, prefilter=might_mention_flickr))
+            == []
+        )
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            b'{"statements":{"P7482":[]}}',
+            b'{"statements":{"P12120":[]}}',
+            b'{"value":"https://www.flickr.com/photos/example/12345"}',
+        ],
+    )
+    def test_might_mention_flickr(self, line: bytes) -> None:
+        assert might_mention_flickr(line)
+
+    def test_doesnt_mention_flickr(self) -> None:
+        assert not might_mention_flickr(b'{"statements":{"P180":[]}}')
+
+
+class TestParallelParsing:
+    def test_parses_every_entry_in_a_multistream_snapshot(
+        self, tmp_path: pathlib.Path
+    ) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 101)]
+        create_snapshot(snapshot_path, entries, streams=7)
+
+        actual = parse_sdc_snapshot(snapshot_path, processes=3)
+
+        assert sorted(actual, key=lambda e: e["pageid"]) == entries
+
+    def test_single_stream_snapshot_is_one_range(self) -> None:
+        snapshot_path = pathlib.Path(
+            "tests/fixtures/commons-20231207-mediainfo.slice.json.bz2"
+        )
+
+        assert len(split_bz2_file(snapshot_path, parts=4)) == 1
+        assert len(list(parse_sdc_snapshot(snapshot_path, processes=4))) == 2
+
+    @pytest.mark.parametrize("streams", [1, 2, 5, 13, 40])
+    @pytest.mark.parametrize("parts", [1, 2, 3, 8])
+    def test_every_line_is_read_exactly_once(
+        self, tmp_path: pathlib.Path, streams: int, parts: int
+    ) -> None:
+        """
+        However we split a file, every line is read exactly once,
+        even if it spans multiple streams.
+        """
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 21)]
+        create_snapshot(snapshot_path, entries, streams=streams)
+
+        with bz2.open(snapshot_path) as in_file:
+            expected = list(in_file)
+
+        actual = [
+            line
+            for start, end in split_bz2_file(snapshot_path, parts=parts)
+            for line in read_lines_in_range(snapshot_path, start=start, end=end)
+        ]
+
+        assert actual == expected
+
+    def test_parse_busted_sdc_snapshot_is_error(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+
+        with open(snapshot_path, "xb") as out_file:
+            out_file.write(bz2.compress(b"[\n"))
+            out_file.write(bz2.compress(b'{"data in": "the wrong format"}\n]'))
+
+        with pytest.raises(ValidationError):
+            list(parse_sdc_snapshot(snapshot_path, processes=2))
+
+
+class TestSnapshotIndex:
+    @pytest.mark.parametrize("streams", [1, 3, 40])
+    def test_can_find_every_entry(self, tmp_path: pathlib.Path, streams: int) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 21)]
+        create_snapshot(snapshot_path, entries, streams=streams)
+
+        assert create_snapshot_index(snapshot_path) == 20
+
+        for e in entries:
+            assert get_snapshot_entry(snapshot_path, key=e["id"]) == e
+            assert get_snapshot_entry(snapshot_path, key=e["title"]) == e
+            assert get_snapshot_entry(snapshot_path, key=e["pageid"]) == e
+
+    def test_can_use_index_in_another_place(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        index_path = tmp_path / "index.sqlite"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 5)]
+        create_snapshot(snapshot_path, entries, streams=2)
+
+        create_snapshot_index(snapshot_path, index_path=index_path)
+
+        actual = get_snapshot_entry(snapshot_path, key="M3", index_path=index_path)
+        assert actual == entries[2]
+
+    def test_missing_entry_is_error(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        create_snapshot(snapshot_path, [create_snapshot_entry(pageid=1)])
+        create_snapshot_index(snapshot_path)
+
+        with pytest.raises(KeyError):
+            get_snapshot_entry(snapshot_path, key="M2")
+
+        with pytest.raises(KeyError):
+            get_snapshot_entry(snapshot_path, key=2)
+
+    def test_missing_index_is_error(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        create_snapshot(snapshot_path, [create_snapshot_entry(pageid=1)])
+
+        with pytest.raises(FileNotFoundError):
+            get_snapshot_entry(snapshot_path, key="M1")
+
+        # We didn't create an empty index as a side effect
+        assert list(tmp_path.iterdir()) == [snapshot_path]
+
+    def test_interrupted_build_doesnt_leave_an_index(
+        self, tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 5)]
+        create_snapshot(snapshot_path, entries, streams=2)
+
+        def read_lines_in_range(*args: object, **kwargs: object) -> None:
+            raise OSError("BOOM!")
+
+        with monkeypatch.context() as m:
+            m.setattr(
+                "flickypedia.apis.snapshots.read_lines_in_range", read_lines_in_range
+            )
+
+            with pytest.raises(OSError, match="BOOM!"):
+                create_snapshot_index(snapshot_path)
+
+        with pytest.raises(FileNotFoundError):
+            get_snapshot_entry(snapshot_path, key="M1")
+
+        # If we try again, we replace the leftovers of the failed build
+        assert create_snapshot_index(snapshot_path) == 4
+        assert get_snapshot_entry(snapshot_path, key="M1") == entries[0]
+
+    def test_index_for_different_snapshot_is_error(
+        self, tmp_path: pathlib.Path
+    ) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        create_snapshot(snapshot_path, [create_snapshot_entry(pageid=1)])
+        create_snapshot_index(snapshot_path)
+
+        snapshot_path.unlink()
+        create_snapshot(
+            snapshot_path, [create_snapshot_entry(pageid=i) for i in range(1, 5)]
+        )
+
+        with pytest.raises(ValueError, match="different snapshot"):
+            get_snapshot_entry(snapshot_path, key="M1")
+
+
+class TestShards:
+    @pytest.mark.parametrize("compression", ["gzip", "none"])
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_can_read_shards(
+        self,
+        tmp_path: pathlib.Path,
+        compression: ShardCompression,
+        processes: int,
+    ) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 21)]
+        create_snapshot(snapshot_path, entries, streams=3)
+
+        shard_dir = tmp_path / "snapshot.shards"
+        manifest = create_snapshot_shards(
+            snapshot_path, shard_dir, shards=5, compression=compression
+        )
+
+        assert manifest["snapshot"] == "snapshot.json.bz2"
+        assert [s["entries"] for s in manifest["shards"]] == [4, 4, 4, 4, 4]
+        assert read_shard_manifest(shard_dir) == manifest
+
+        # There are more shards than processes, so this checks we
+        # start new workers as the first ones finish.
+        actual = parse_sdc_snapshot(shard_dir, processes=processes)
+
+        assert sorted(actual, key=lambda e: e["pageid"]) == entries
+
+    def test_shards_are_jsonl(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 4)]
+        create_snapshot(snapshot_path, entries)
+
+        shard_dir = tmp_path / "snapshot.shards"
+        create_snapshot_shards(snapshot_path, shard_dir, shards=1, compression="none")
+
+        with open(shard_dir / "shard-000.jsonl") as in_file:
+            assert [json.loads(line) for line in in_file] == entries
+
+    def test_can_read_raw_lines_from_shards(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        entries = [create_snapshot_entry(pageid=i) for i in range(1, 5)]
+        create_snapshot(snapshot_path, entries)
+
+        shard_dir = tmp_path / "snapshot.shards"
+        create_snapshot_shards(snapshot_path, shard_dir, shards=2)
+
+        lines = read_snapshot_lines(shard_dir)
+
+        assert sorted(json.loads(line)["pageid"] for line in lines) == [1, 2, 3, 4]
+
+    def test_directory_without_manifest_is_not_sharded(
+        self, tmp_path: pathlib.Path
+    ) -> None:
+        assert not is_sharded_snapshot(tmp_path)
+
+    def test_wont_overwrite_existing_shards(self, tmp_path: pathlib.Path) -> None:
+        snapshot_path = tmp_path / "snapshot.json.bz2"
+        create_snapshot(snapshot_path, [create_snapshot_entry(pageid=1)])
+
+        shard_dir = tmp_path / "snapshot.shards"
+        shard_dir.mkdir()
+
+        with pytest.raises(FileExistsError):
+            create_snapshot_shards(snapshot_path, shard_dir, shards=2)
+
+
 class TestSnapshotEntryType:
     def test_handles_labels(self) -> None:
         entry = {
@@ -4,8 +4,10 @@ from flickypedia.apis import WikimediaApi
 from flickypedia.backfillr.flickr_matcher import (
     AmbiguousStructuredData,
     FindResult,
+    find_flickr_photo_id_from_raw_wikitext,
     find_flickr_photo_id_from_sdc,
     find_flickr_photo_id_from_wikitext,
+    get_template_params,
 )
 from utils import get_existing_claims_fixture
 
@@ -204,6 +206,108 @@ def test_find_flickr_photo_id_from_static_wikitext(
     )
 
 
+@pytest.mark.parametrize(
+    ["wikitext", "photo_id"],
+    [
+        pytest.param("", None, id="empty"),
+        pytest.param(
+            "{{Information\n|description=A cat\n|source=https://www.flickr.com/photos/stewart/253009/\n|author=Stewart\n}}",
+            {
+                "photo_id": "253009",
+                "url": "https://www.flickr.com/photos/stewart/253009/",
+            },
+            id="bare_url_in_information",
+        ),
+        pytest.param(
+            "{{information|Source=[https://www.flickr.com/photos/stewart/253009/ A cat]|Author={{Creator|Stewart}}}}",
+            {
+                "photo_id": "253009",
+                "url": "https://www.flickr.com/photos/stewart/253009/",
+            },
+            id="link_in_information",
+        ),
+        pytest.param(
+            "{{Information\n|source=[https://www.flickr.com/ Flickr.com] - [https://www.flickr.com/photos/51035573370@N01/869031 image description page]\n}}",
+            {
+                "photo_id": "869031",
+                "url": "https://www.flickr.com/photos/51035573370@N01/869031",
+            },
+            id="flickr_homepage_then_photo",
+        ),
+        pytest.param(
+            "{{Information\n|source=[https://www.flickr.com/ Flickr.com] / [https://en.wikipedia.org/wiki/Flickr Flickr]\n}}",
+            None,
+            id="flickr_homepage_then_wikipedia",
+        ),
+        pytest.param(
+            "{{Information\n|source=[[:en:Flickr|Flickr]]: [https://www.flickr.com/photos/25834786@N03/3598534263 polling station]\n}}",
+            {
+                "photo_id": "3598534263",
+                "url": "https://www.flickr.com/photos/25834786@N03/3598534263",
+            },
+            id="wikipedia_link_then_photo",
+        ),
+        pytest.param(
+            "{{Information\n|source=[https://www.flickr.com/photos/25834786@N03 a link to a user]\n}}",
+            None,
+            id="link_to_user",
+        ),
+        pytest.param(
+            "== Summary ==\n* Source: https://www.flickr.com/photos/justinaugust/3731022/\n",
+            {
+                "photo_id": "3731022",
+                "url": "https://www.flickr.com/photos/justinaugust/3731022/",
+            },
+            id="source_line",
+        ),
+        pytest.param(
+            "Source: [https://www.flickr.com/photos/metalphoenix/3874334/ Flickr]",
+            {
+                "photo_id": "3874334",
+                "url": "https://www.flickr.com/photos/metalphoenix/3874334/",
+            },
+            id="source_line_with_flickr_label",
+        ),
+        pytest.param(
+            "Source: https://www.flickr.com/photos/metalphoenix/",
+            None,
+            id="source_line_with_user",
+        ),
+        pytest.param(
+            "Source: my own camera",
+            None,
+            id="source_line_without_url",
+        ),
+    ],
+)
+def test_find_flickr_photo_id_from_raw_wikitext(
+    wikitext: str, photo_id: FindResult | None
+) -> None:
+    assert find_flickr_photo_id_from_raw_wikitext(wikitext) == photo_id
+
+
+def test_get_template_params() -> None:
+    wikitext = """
+    Some text before the template {{Other|source=ignored}}
+    {{Information
+     |description={{en|1=A cat on a [[Mat|mat]]}}
+     |source=[[:en:Flickr|Flickr]]
+     |Source=a duplicate
+     |author
+    }}
+    {{Information|source=a second template}}
+    """
+
+    assert get_template_params(wikitext, template_name="Information") == {
+        "description": "{{en|1=A cat on a [[Mat|mat]]}}",
+        "source": "[[:en:Flickr|Flickr]]",
+    }
+
+
+def test_get_template_params_for_missing_template() -> None:
+    assert get_template_params("{{Informational}}", template_name="Information") == {}
+
+
 @pytest.mark.parametrize(
     ["filename", "expected_flickr_photo_id"],
     [
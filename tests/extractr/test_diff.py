@@ -0,0 +1,152 @@
+import pathlib
+import sqlite3
+
+import pytest
+
+from flickypedia.apis.snapshots import SnapshotEntry
+from flickypedia.extractr import diff
+from flickypedia.extractr.diff import find_changed_photos
+from flickypedia.extractr.matcher import MatchedPhoto, match_entry
+from utils import create_snapshot_entry, get_existing_claims_fixture
+
+
+def flickr_entry(pageid: int, lastrevid: int) -> SnapshotEntry:
+    entry = create_snapshot_entry(
+        pageid=pageid,
+        statements=get_existing_claims_fixture("M138765382_P12120.json"),
+    )
+    entry["lastrevid"] = lastrevid
+    return entry
+
+
+def other_entry(pageid: int, lastrevid: int) -> SnapshotEntry:
+    entry = create_snapshot_entry(pageid=pageid)
+    entry["lastrevid"] = lastrevid
+    return entry
+
+
+def test_everything_is_added_if_no_previous_revisions(
+    tmp_path: pathlib.Path,
+) -> None:
+    changes = find_changed_photos(
+        [flickr_entry(pageid=1, lastrevid=10), other_entry(pageid=2, lastrevid=20)],
+        previous_revisions=None,
+        current_revisions=tmp_path / "revisions.sqlite",
+    )
+
+    assert list(changes) == [
+        {
+            "change": "added",
+            "flickr_photo_id": "53253175319",
+            "wikimedia_page_id": "M1",
+            "wikimedia_page_title": "File:Example 1.jpg",
+        }
+    ]
+
+    con = sqlite3.connect(tmp_path / "revisions.sqlite")
+    assert con.execute("SELECT * FROM revisions ORDER BY page_id").fetchall() == [
+        (1, 10, "53253175319"),
+        (2, 20, None),
+    ]
+
+
+def test_finds_changes_since_previous_revisions(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    previous = [
+        flickr_entry(pageid=1, lastrevid=10),  # unchanged
+        flickr_entry(pageid=2, lastrevid=20),  # edited, still Flickr
+        flickr_entry(pageid=3, lastrevid=30),  # edited, no longer Flickr
+        other_entry(pageid=4, lastrevid=40),  # edited, now Flickr
+        flickr_entry(pageid=5, lastrevid=50),  # deleted
+        other_entry(pageid=6, lastrevid=60),  # deleted, never Flickr
+    ]
+
+    current = [
+        flickr_entry(pageid=1, lastrevid=10),
+        flickr_entry(pageid=2, lastrevid=21),
+        other_entry(pageid=3, lastrevid=31),
+        flickr_entry(pageid=4, lastrevid=41),
+        flickr_entry(pageid=7, lastrevid=70),  # new
+    ]
+
+    list(
+        find_changed_photos(
+            previous,
+            previous_revisions=None,
+            current_revisions=tmp_path / "previous.sqlite",
+        )
+    )
+
+    # Record which entries we try to match, so we can check we skip
+    # the entries which haven't changed.
+    matched_page_ids = []
+
+    def tracking_match_entry(entry: SnapshotEntry) -> MatchedPhoto | None:
+        matched_page_ids.append(entry["pageid"])
+        return match_entry(entry)
+
+    monkeypatch.setattr(diff, "match_entry", tracking_match_entry)
+
+    changes = find_changed_photos(
+        current,
+        previous_revisions=tmp_path / "previous.sqlite",
+        current_revisions=tmp_path / "current.sqlite",
+    )
+
+    assert [(c["change"], c["wikimedia_page_id"]) for c in changes] == [
+        ("changed", "M2"),
+        ("removed", "M3"),
+        ("added", "M4"),
+        ("added", "M7"),
+        ("removed", "M5"),
+    ]
+
+    assert matched_page_ids == [2, 3, 4, 7]
+
+    con = sqlite3.connect(tmp_path / "current.sqlite")
+    assert con.execute("SELECT * FROM revisions ORDER BY page_id").fetchall() == [
+        (1, 10, "53253175319"),
+        (2, 21, "53253175319"),
+        (3, 31, None),
+        (4, 41, "53253175319"),
+        (7, 70, "53253175319"),
+    ]
+
+
+def test_reports_prior_photo_as_removed_if_match_changes(
+    tmp_path: pathlib.Path,
+) -> None:
+    list(
+        find_changed_photos(
+            [flickr_entry(pageid=1, lastrevid=10)],
+            previous_revisions=None,
+            current_revisions=tmp_path / "previous.sqlite",
+        )
+    )
+
+    # Edit the entry so it points to a different Flickr photo
+    entry = flickr_entry(pageid=1, lastrevid=11)
+    (statement,) = entry["statements"]["P12120"]
+    statement["mainsnak"]["datavalue"] = {"type": "string", "value": "12345"}
+
+    changes = find_changed_photos(
+        [entry],
+        previous_revisions=tmp_path / "previous.sqlite",
+        current_revisions=tmp_path / "current.sqlite",
+    )
+
+    assert list(changes) == [
+        {
+            "change": "removed",
+            "flickr_photo_id": "53253175319",
+            "wikimedia_page_id": "M1",
+            "wikimedia_page_title": "File:Example 1.jpg",
+        },
+        {
+            "change": "changed",
+            "flickr_photo_id": "12345",
+            "wikimedia_page_id": "M1",
+            "wikimedia_page_title": "File:Example 1.jpg",
+        },
+    ]
@@ -0,0 +1,116 @@
+import pathlib
+import sqlite3
+
+from flask import Flask
+
+from flickypedia.duplicates import (
+    find_all_duplicates,
+    find_duplicates,
+    find_duplicates_for_user,
+    record_file_created_by_flickypedia,
+)
+from flickypedia.extractr.duplicates_database import create_duplicates_database
+
+
+def test_create_duplicates_database(tmp_path: pathlib.Path) -> None:
+    db_path = tmp_path / "duplicates.sqlite"
+
+    row_count = create_duplicates_database(
+        db_path,
+        matched_photos=[
+            {
+                "flickr_photo_id": "3",
+                "wikimedia_page_id": "M31",
+                "wikimedia_page_title": "File:Three (copy).jpg",
+                "flickr_user_id": None,
+            },
+            {
+                "flickr_photo_id": "1",
+                "wikimedia_page_id": "M10",
+                "wikimedia_page_title": "File:One.jpg",
+                "flickr_user_id": None,
+            },
+            {
+                "flickr_photo_id": "3",
+                "wikimedia_page_id": "M30",
+                "wikimedia_page_title": "File:Three.jpg",
+                "flickr_user_id": "33@N03",
+            },
+        ],
+    )
+
+    assert row_count == 2
+
+    # We keep every copy of each photo, the IDs are stored as integers,
+    # and the temporary table used to load the data is gone.
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT * FROM flickr_photos").fetchall() == [
+        (1, None),
+        (3, "33@N03"),
+    ]
+    assert con.execute("SELECT * FROM wikimedia_pages").fetchall() == [
+        (10, "File:One.jpg"),
+        (30, "File:Three.jpg"),
+        (31, "File:Three (copy).jpg"),
+    ]
+    assert con.execute("SELECT * FROM flickr_photo_pages").fetchall() == [
+        (1, 10),
+        (3, 30),
+        (3, 31),
+    ]
+    assert con.execute("SELECT name FROM sqlite_master").fetchall() == [
+        ("flickr_photos",),
+        ("wikimedia_pages",),
+        ("flickr_photo_pages",),
+        ("flickr_photos_by_user_id",),
+    ]
+
+
+def test_database_can_be_used_to_find_duplicates(app: Flask) -> None:
+    duplicate_dir = pathlib.Path(app.config["DUPLICATE_DATABASE_DIRECTORY"])
+
+    create_duplicates_database(
+        duplicate_dir / "flickr_ids_from_sdc.20231207.sqlite",
+        matched_photos=[
+            {
+                "flickr_photo_id": "53253175319",
+                "wikimedia_page_id": "M138765383",
+                "wikimedia_page_title": "File:Example (copy).jpg",
+                "flickr_user_id": "199246608@N02",
+            },
+            {
+                "flickr_photo_id": "53253175319",
+                "wikimedia_page_id": "M138765382",
+                "wikimedia_page_title": "File:Example.jpg",
+                "flickr_user_id": "199246608@N02",
+            },
+        ],
+    )
+
+    # This file is also in the database of uploads by Flickypedia,
+    # but we only return it once.
+    record_file_created_by_flickypedia(
+        flickr_photo_id="53253175319",
+        wikimedia_page_title="File:Example.jpg",
+        wikimedia_page_id="M138765382",
+    )
+
+    assert find_all_duplicates(flickr_photo_ids=["53253175319", "1234"]) == {
+        "53253175319": [
+            {"id": "M138765382", "title": "File:Example.jpg"},
+            {"id": "M138765383", "title": "File:Example (copy).jpg"},
+        ]
+    }
+
+    assert find_duplicates(flickr_photo_ids=["53253175319"]) == {
+        "53253175319": {"id": "M138765382", "title": "File:Example.jpg"}
+    }
+
+    assert find_duplicates_for_user(flickr_user_id="199246608@N02") == {
+        "53253175319": [
+            {"id": "M138765382", "title": "File:Example.jpg"},
+            {"id": "M138765383", "title": "File:Example (copy).jpg"},
+        ]
+    }
+
+    assert find_duplicates_for_user(flickr_user_id="12345678@N01") == {}
@@ -0,0 +1,193 @@
+from collections.abc import Iterator
+import csv
+import json
+import pathlib
+import sqlite3
+import typing
+
+from nitrate.types import validate_type
+import pytest
+
+from flickypedia.apis.snapshots import (
+    SnapshotEntry,
+    _statements_checker,
+    parse_sdc_snapshot,
+)
+from flickypedia.extractr.extractors import (
+    CaptionLanguagesExtractor,
+    CreatorNsidsExtractor,
+    Extractor,
+    FlickrPhotosExtractor,
+    LicensesExtractor,
+    run_extractors,
+)
+from flickypedia.structured_data import ExistingClaims
+from utils import create_snapshot, create_snapshot_entry, get_existing_claims_fixture
+
+
+@pytest.fixture
+def entries() -> list[SnapshotEntry]:
+    with open("tests/fixtures/structured_data/existing/M34511_P170.json") as f:
+        creator_statement = json.load(f)
+
+    license_statement = {
+        "id": "M3$1",
+        "type": "statement",
+        "rank": "normal",
+        "mainsnak": {
+            "property": "P275",
+            "snaktype": "value",
+            "datavalue": {
+                "type": "wikibase-entityid",
+                "value": {"entity-type": "item", "id": "Q20007257", "numeric-id": 1},
+            },
+        },
+    }
+
+    photo = create_snapshot_entry(
+        pageid=138765382,
+        statements=get_existing_claims_fixture("M138765382_P12120.json"),
+    )
+    photo["labels"] = {"en": {"language": "en", "value": "A photo"}}
+
+    creator = create_snapshot_entry(
+        pageid=34511,
+        statements=validate_type({"P170": [creator_statement]}, model=ExistingClaims),
+    )
+    creator["labels"] = {
+        "en": {"language": "en", "value": "A photo"},
+        "de": {"language": "de", "value": "Ein Foto"},
+    }
+
+    licensed = create_snapshot_entry(
+        pageid=3,
+        statements=validate_type({"P275": [license_statement]}, model=ExistingClaims),
+    )
+
+    return [photo, creator, licensed]
+
+
+def test_run_extractors(tmp_path: pathlib.Path, entries: list[SnapshotEntry]) -> None:
+    extractors: list[Extractor] = [
+        FlickrPhotosExtractor(tmp_path / "photos.csv"),
+        CreatorNsidsExtractor(tmp_path / "creators.sqlite"),
+        CaptionLanguagesExtractor(tmp_path / "languages.json"),
+        LicensesExtractor(tmp_path / "licenses.json"),
+    ]
+
+    run_extractors(entries, extractors)
+
+    with open(tmp_path / "photos.csv") as in_file:
+        assert list(csv.DictReader(in_file)) == [
+            {
+                "flickr_photo_id": "53253175319",
+                "wikimedia_page_id": "M138765382",
+                "wikimedia_page_title": "File:Example 138765382.jpg",
+            }
+        ]
+
+    con = sqlite3.connect(tmp_path / "creators.sqlite")
+    assert con.execute("SELECT * FROM creators").fetchall() == [
+        ("M34511", "44124385307@N01")
+    ]
+
+    with open(tmp_path / "languages.json") as in_file:
+        assert json.load(in_file) == {"en": 2, "de": 1}
+
+    with open(tmp_path / "licenses.json") as in_file:
+        assert json.load(in_file) == {"Q20007257": 1}
+
+
+def test_statements_are_decoded_once_per_entry(
+    tmp_path: pathlib.Path,
+    entries: list[SnapshotEntry],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    With the "msgspec" engine, the statements are decoded when they're
+    first read -- and only then, however many extractors read them.
+    """
+    snapshot_path = tmp_path / "snapshot.json.bz2"
+    create_snapshot(snapshot_path, entries)
+
+    decoded = []
+
+    class CountingChecker:
+        def decode(self, raw: bytes) -> typing.Any:
+            decoded.append(raw)
+            return _statements_checker.decode(raw)
+
+    monkeypatch.setattr(
+        "flickypedia.apis.snapshots._statements_checker", CountingChecker()
+    )
+
+    run_extractors(
+        parse_sdc_snapshot(snapshot_path, engine="msgspec"),
+        [
+            FlickrPhotosExtractor(tmp_path / "photos.csv"),
+            CreatorNsidsExtractor(tmp_path / "creators.sqlite"),
+            CaptionLanguagesExtractor(tmp_path / "languages.json"),
+            LicensesExtractor(tmp_path / "licenses.json"),
+        ],
+    )
+
+    assert len(decoded) == len(entries)
+
+
+def test_deletes_partial_output_if_theres_an_error(
+    tmp_path: pathlib.Path, entries: list[SnapshotEntry]
+) -> None:
+    def get_entries() -> Iterator[SnapshotEntry]:
+        yield from entries
+        raise OSError("BOOM!")
+
+    extractors: list[Extractor] = [
+        FlickrPhotosExtractor(tmp_path / "photos.csv"),
+        CreatorNsidsExtractor(tmp_path / "creators.sqlite"),
+        CaptionLanguagesExtractor(tmp_path / "languages.json"),
+    ]
+
+    with pytest.raises(OSError, match="BOOM!"):
+        run_extractors(get_entries(), extractors)
+
+    assert list(tmp_path.iterdir()) == []
+
+    # We can run the extractors again, because there aren't any
+    # reports in the way.
+    run_extractors(
+        entries,
+        [
+            FlickrPhotosExtractor(tmp_path / "photos.csv"),
+            CreatorNsidsExtractor(tmp_path / "creators.sqlite"),
+            CaptionLanguagesExtractor(tmp_path / "languages.json"),
+        ],
+    )
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "creators.sqlite",
+        "languages.json",
+        "photos.csv",
+    ]
+
+
+def test_closes_extractors_if_theres_an_error(
+    tmp_path: pathlib.Path, entries: list[SnapshotEntry]
+) -> None:
+    class BrokenExtractor(CaptionLanguagesExtractor):
+        def process_entry(self, entry: SnapshotEntry) -> None:  # type: ignore[override]
+            raise ValueError("BOOM!")
+
+    extractor = BrokenExtractor(tmp_path / "languages.json")
+
+    with pytest.raises(ValueError, match="BOOM!"):
+        run_extractors(entries, [extractor])
+
+    assert extractor.out_file.closed
+    assert not (tmp_path / "languages.json").exists()
+
+
+def test_wont_overwrite_existing_output(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "licenses.json").write_text("{}")
+
+    with pytest.raises(FileExistsError):
+        LicensesExtractor(tmp_path / "licenses.json")
@@ -0,0 +1,557 @@
+from collections.abc import Iterable, Iterator
+import csv
+import itertools
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+
+from click.testing import CliRunner
+import pytest
+
+from flickypedia.apis.snapshots import AnySnapshotEntry
+from flickypedia.bloom_filter import BloomFilter
+from flickypedia.cli import main as cli_main
+from flickypedia.extractr import cli as extractr_module
+from flickypedia.extractr.matcher import find_matched_photos, MatchedPhoto
+from flickypedia.sorted_id_index import SortedIdIndex
+from utils import create_snapshot, create_snapshot_entry, get_existing_claims_fixture
+
+
+@pytest.fixture
+def snapshot_path(tmp_path: pathlib.Path) -> pathlib.Path:
+    """
+    Create a snapshot with a mix of Flickr and non-Flickr files.
+    """
+    path = tmp_path / "commons-20231207-mediainfo.json.bz2"
+
+    create_snapshot(
+        path,
+        entries=[
+            create_snapshot_entry(pageid=1),
+            create_snapshot_entry(
+                pageid=138765382,
+                statements=get_existing_claims_fixture("M138765382_P12120.json"),
+            ),
+            create_snapshot_entry(pageid=2),
+        ],
+        streams=3,
+    )
+
+    return path
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        [],
+        ["--processes", "2"],
+        ["--prefilter"],
+        ["--processes", "2", "--prefilter"],
+        ["--pipeline"],
+        ["--pipeline", "--processes", "2", "--prefilter"],
+    ],
+)
+def test_get_photos_from_sdc(snapshot_path: pathlib.Path, args: list[str]) -> None:
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            cli_main, ["extractr", "get-photos-from-sdc", str(snapshot_path)] + args
+        )
+
+        assert result.exit_code == 0, result.output
+        assert result.stdout.strip().endswith("flickr_ids_from_sdc.20231207.csv")
+
+        with open("flickr_ids_from_sdc.20231207.csv") as in_file:
+            rows = list(csv.DictReader(in_file))
+
+    assert rows == [
+        {
+            "flickr_photo_id": "53253175319",
+            "wikimedia_page_id": "M138765382",
+            "wikimedia_page_title": "File:Example 138765382.jpg",
+        }
+    ]
+
+
+class TestResume:
+    @pytest.fixture
+    def flickr_snapshot_path(self, tmp_path: pathlib.Path) -> pathlib.Path:
+        """
+        Create a snapshot where every entry is a Flickr photo, and
+        every entry is in a separate bz2 stream.
+        """
+        path = tmp_path / "commons-20231207-mediainfo.json.bz2"
+
+        statements = get_existing_claims_fixture("M138765382_P12120.json")
+
+        create_snapshot(
+            path,
+            entries=[
+                create_snapshot_entry(pageid=i, statements=statements)
+                for i in range(1, 7)
+            ],
+            streams=6,
+        )
+
+        return path
+
+    def test_can_resume_after_a_crash(
+        self, flickr_snapshot_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(extractr_module, "CHECKPOINT_INTERVAL", 1)
+
+        # Simulate a crash partway through the snapshot.
+        matched_count = itertools.count()
+
+        def crash_after_three_matches(
+            entries: Iterable[AnySnapshotEntry],
+        ) -> Iterator[MatchedPhoto]:
+            for m in find_matched_photos(entries):
+                if next(matched_count) == 3:
+                    raise RuntimeError("BOOM!")
+
+                yield m
+
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            cmd = ["extractr", "get-photos-from-sdc", str(flickr_snapshot_path)]
+
+            with monkeypatch.context() as m:
+                m.setattr(
+                    extractr_module, "find_matched_photos", crash_after_three_matches
+                )
+                result = runner.invoke(cli_main, cmd)
+
+            assert isinstance(result.exception, RuntimeError)
+            assert os.path.exists("flickr_ids_from_sdc.20231207.csv.checkpoint")
+
+            result = runner.invoke(cli_main, cmd + ["--resume"])
+            assert result.exit_code == 0, result.output
+
+            assert not os.path.exists("flickr_ids_from_sdc.20231207.csv.checkpoint")
+
+            with open("flickr_ids_from_sdc.20231207.csv") as in_file:
+                rows = list(csv.DictReader(in_file))
+
+        assert [r["wikimedia_page_id"] for r in rows] == [
+            "M1",
+            "M2",
+            "M3",
+            "M4",
+            "M5",
+            "M6",
+        ]
+
+    def test_cant_resume_without_a_checkpoint(
+        self, flickr_snapshot_path: pathlib.Path
+    ) -> None:
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli_main,
+                [
+                    "extractr",
+                    "get-photos-from-sdc",
+                    str(flickr_snapshot_path),
+                    "--resume",
+                ],
+            )
+
+        assert result.exit_code == 2
+        assert "Unable to resume: no checkpoint" in result.output
+
+    def test_cant_resume_with_multiple_processes(
+        self, flickr_snapshot_path: pathlib.Path
+    ) -> None:
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli_main,
+                [
+                    "extractr",
+                    "get-photos-from-sdc",
+                    str(flickr_snapshot_path),
+                    "--resume",
+                    "--processes",
+                    "2",
+                ],
+            )
+
+        assert result.exit_code == 2
+        assert "--resume can only be used with a single process" in result.output
+
+    def test_cant_resume_with_pipeline(
+        self, flickr_snapshot_path: pathlib.Path
+    ) -> None:
+        runner = CliRunner()
+
+        with runner.isolated_filesystem():
+            result = runner.invoke(
+                cli_main,
+                [
+                    "extractr",
+                    "get-photos-from-sdc",
+                    str(flickr_snapshot_path),
+                    "--resume",
+                    "--pipeline",
+                ],
+            )
+
+        assert result.exit_code == 2
+        assert "--resume can't be used with --pipeline" in result.output
+
+
+def test_get_photo_changes_from_sdc(tmp_path: pathlib.Path) -> None:
+    statements = get_existing_claims_fixture("M138765382_P12120.json")
+
+    old_snapshot = tmp_path / "commons-20231201-mediainfo.json.bz2"
+    create_snapshot(
+        old_snapshot,
+        entries=[
+            create_snapshot_entry(pageid=1, statements=statements),
+            create_snapshot_entry(pageid=2),
+        ],
+    )
+
+    new_snapshot = tmp_path / "commons-20231208-mediainfo.json.bz2"
+    create_snapshot(
+        new_snapshot,
+        entries=[
+            create_snapshot_entry(pageid=1, statements=statements),
+            create_snapshot_entry(pageid=3, statements=statements),
+        ],
+    )
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        cmd = ["extractr", "get-photo-changes-from-sdc"]
+
+        result = runner.invoke(cli_main, cmd + [str(old_snapshot)])
+        assert result.exit_code == 0, result.output
+        assert result.output.strip().splitlines()[-2:] == [
+            "flickr_ids_from_sdc.20231201.changes.csv",
+            "flickr_ids_from_sdc.20231201.revisions.sqlite",
+        ]
+
+        result = runner.invoke(
+            cli_main,
+            cmd
+            + [
+                str(new_snapshot),
+                "--previous",
+                "flickr_ids_from_sdc.20231201.revisions.sqlite",
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        with open("flickr_ids_from_sdc.20231208.changes.csv") as in_file:
+            rows = list(csv.DictReader(in_file))
+
+        # Running it again is an error, because we'd overwrite the output
+        result = runner.invoke(cli_main, cmd + [str(new_snapshot)])
+        assert result.exit_code == 2
+        assert "already exists" in result.output
+
+    assert rows == [
+        {
+            "change": "added",
+            "flickr_photo_id": "53253175319",
+            "wikimedia_page_id": "M3",
+            "wikimedia_page_title": "File:Example 3.jpg",
+        }
+    ]
+
+
+def test_create_duplicates_database_from_sdc(
+    snapshot_path: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    duplicate_dir = tmp_path / "duplicates"
+    duplicate_dir.mkdir()
+
+    runner = CliRunner()
+    cmd = [
+        "extractr",
+        "create-duplicates-database-from-sdc",
+        str(snapshot_path),
+        str(duplicate_dir),
+    ]
+
+    # If there's a half-built database left over from a previous run,
+    # we throw it away and start again.
+    (duplicate_dir / "flickr_ids_from_sdc.20231207.sqlite.tmp").write_text("BOOM!")
+
+    # There's an older snapshot and the database of Flickypedia uploads
+    (duplicate_dir / "flickr_ids_from_sdc.20231009.sqlite").write_text("old")
+    (duplicate_dir / "flickypedia_uploads.db").write_text("uploads")
+
+    result = runner.invoke(cli_main, cmd)
+    assert result.exit_code == 0, result.output
+    assert "Wrote 1 photos" in result.output
+    assert "Published generation 2" in result.output
+
+    assert sorted(os.listdir(duplicate_dir)) == [
+        "flickr_ids_from_sdc.20231009.sqlite",
+        "flickr_ids_from_sdc.20231207.sqlite",
+        "flickr_ids_from_sdc.20231207.sqlite.bloom",
+        "flickypedia_uploads.db",
+        "generation.json",
+    ]
+
+    # The new snapshot replaces the old one
+    assert json.loads((duplicate_dir / "generation.json").read_text()) == {
+        "generation": 2,
+        "databases": ["flickr_ids_from_sdc.20231207.sqlite"],
+    }
+
+    con = sqlite3.connect(duplicate_dir / "flickr_ids_from_sdc.20231207.sqlite")
+    assert con.execute("SELECT * FROM flickr_photo_pages").fetchall() == [
+        (53253175319, 138765382),
+    ]
+
+    bloom_filter, _ = BloomFilter.read(
+        duplicate_dir / "flickr_ids_from_sdc.20231207.sqlite.bloom"
+    )
+    assert "53253175319" in bloom_filter
+    bloom_filter.close()
+
+    # Running it again is an error, because we'd overwrite the database
+    result = runner.invoke(cli_main, cmd)
+    assert result.exit_code == 2
+    assert "already exists" in result.output
+
+
+def test_publish_duplicates_databases(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "flickr_ids_from_sdc.20231009.sqlite").write_text("old")
+    (tmp_path / "flickr_ids_from_sdc.20231207.sqlite").write_text("new")
+
+    runner = CliRunner()
+
+    for expected_generation, name in enumerate(
+        ["flickr_ids_from_sdc.20231009.sqlite", "flickr_ids_from_sdc.20231207.sqlite"],
+        start=1,
+    ):
+        result = runner.invoke(
+            cli_main, ["extractr", "publish-duplicates-databases", str(tmp_path), name]
+        )
+        assert result.exit_code == 0, result.output
+        assert f"Published generation {expected_generation}: {name}" in result.output
+
+    assert json.loads((tmp_path / "generation.json").read_text()) == {
+        "generation": 2,
+        "databases": ["flickr_ids_from_sdc.20231207.sqlite"],
+    }
+
+    result = runner.invoke(
+        cli_main,
+        ["extractr", "publish-duplicates-databases", str(tmp_path), "doesnotexist.db"],
+    )
+    assert result.exit_code == 2
+    assert "No database named 'doesnotexist.db'" in result.output
+
+
+def test_create_duplicates_filter(tmp_path: pathlib.Path) -> None:
+    db_path = tmp_path / "flickr_ids_from_sdc_for_testing.sqlite"
+    shutil.copyfile(
+        "tests/fixtures/duplicates/flickr_ids_from_sdc_for_testing.sqlite", db_path
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli_main, ["extractr", "create-duplicates-filter", str(db_path)]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Wrote Bloom filter for 200 photos" in result.output
+
+    bloom_filter, _ = BloomFilter.read(f"{db_path}.bloom")
+    assert "9999819294" in bloom_filter
+    bloom_filter.close()
+
+
+def test_create_sorted_id_index(tmp_path: pathlib.Path) -> None:
+    db_path = tmp_path / "flickr_ids_from_sdc_for_testing.sqlite"
+    shutil.copyfile(
+        "tests/fixtures/duplicates/flickr_ids_from_sdc_for_testing.sqlite", db_path
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli_main, ["extractr", "create-sorted-id-index", str(db_path)]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Wrote 200 photos" in result.output
+
+    index = SortedIdIndex(tmp_path / "flickr_ids_from_sdc_for_testing.ids")
+    assert list(index.find([9999819294])) == [
+        (9999819294, 29907038, "File:Museu da Ciência (9999819294).jpg")
+    ]
+    index.close()
+
+
+def test_get_entry_from_sdc(snapshot_path: pathlib.Path) -> None:
+    runner = CliRunner()
+
+    # If we haven't indexed the snapshot, we can't look up entries
+    result = runner.invoke(
+        cli_main, ["extractr", "get-entry-from-sdc", str(snapshot_path), "M1"]
+    )
+    assert result.exit_code == 2
+    assert "No index" in result.output
+
+    result = runner.invoke(cli_main, ["extractr", "index-snapshot", str(snapshot_path)])
+    assert result.exit_code == 0, result.output
+    assert "Indexed 3 entries" in result.output
+
+    result = runner.invoke(cli_main, ["extractr", "index-snapshot", str(snapshot_path)])
+    assert result.exit_code == 2
+    assert "already exists" in result.output
+
+    for key in ["M138765382", "138765382", "File:Example 138765382.jpg"]:
+        result = runner.invoke(
+            cli_main, ["extractr", "get-entry-from-sdc", str(snapshot_path), key]
+        )
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output)["id"] == "M138765382"
+
+    result = runner.invoke(
+        cli_main, ["extractr", "get-entry-from-sdc", str(snapshot_path), "M3"]
+    )
+    assert result.exit_code == 2
+    assert "No entry M3" in result.output
+
+
+def test_extract_from_sdc(snapshot_path: pathlib.Path) -> None:
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        cmd = [
+            "extractr",
+            "extract-from-sdc",
+            str(snapshot_path),
+            "--extractor",
+            "flickr_photos",
+            "--extractor",
+            "licenses",
+        ]
+
+        result = runner.invoke(cli_main, cmd)
+        assert result.exit_code == 0, result.output
+
+        assert sorted(os.listdir(".")) == [
+            "flickr_ids_from_sdc.20231207.csv",
+            "licenses.20231207.json",
+        ]
+
+        with open("flickr_ids_from_sdc.20231207.csv") as in_file:
+            assert [row["flickr_photo_id"] for row in csv.DictReader(in_file)] == [
+                "53253175319"
+            ]
+
+        # If we run it again, we don't overwrite the existing reports
+        result = runner.invoke(cli_main, cmd)
+        assert result.exit_code == 2
+        assert "already exists" in result.output
+
+        # If we don't choose any extractors, we run all of them
+        result = runner.invoke(
+            cli_main, ["extractr", "extract-from-sdc", str(snapshot_path)]
+        )
+        assert result.exit_code == 2
+        assert "already exists" in result.output
+
+        os.unlink("flickr_ids_from_sdc.20231207.csv")
+        os.unlink("licenses.20231207.json")
+
+        result = runner.invoke(
+            cli_main, ["extractr", "extract-from-sdc", str(snapshot_path)]
+        )
+        assert result.exit_code == 0, result.output
+        assert len(os.listdir(".")) == 4
+
+
+def test_get_photos_from_sharded_snapshot(snapshot_path: pathlib.Path) -> None:
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            cli_main,
+            ["extractr", "shard-snapshot", str(snapshot_path), "--shards", "2"],
+        )
+        assert result.exit_code == 0, result.output
+        assert "Wrote 3 entries to 2 shards" in result.output
+
+        assert os.path.isdir("commons-20231207-mediainfo.shards")
+
+        # We don't overwrite an existing set of shards
+        result = runner.invoke(
+            cli_main, ["extractr", "shard-snapshot", str(snapshot_path)]
+        )
+        assert result.exit_code == 2
+        assert "already exists" in result.output
+
+        # We can't resume from a checkpoint with a sharded snapshot
+        result = runner.invoke(
+            cli_main,
+            [
+                "extractr",
+                "get-photos-from-sdc",
+                "commons-20231207-mediainfo.shards",
+                "--resume",
+            ],
+        )
+        assert result.exit_code == 2
+        assert "sharded snapshot" in result.output
+
+        result = runner.invoke(
+            cli_main,
+            ["extractr", "get-photos-from-sdc", "commons-20231207-mediainfo.shards"],
+        )
+        assert result.exit_code == 0, result.output
+
+        with open("flickr_ids_from_sdc.20231207.csv") as in_file:
+            assert [row["flickr_photo_id"] for row in csv.DictReader(in_file)] == [
+                "53253175319"
+            ]
+
+
+def test_get_photos_from_wikitext(tmp_path: pathlib.Path) -> None:
+    dump_path = tmp_path / "commonswiki-20231201-pages-articles.xml"
+    dump_path.write_text(
+        """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+          <page>
+            <title>File:A cat.jpg</title>
+            <ns>6</ns>
+            <id>2</id>
+            <revision>
+              <text>Source: https://www.flickr.com/photos/stewart/253009/</text>
+            </revision>
+          </page>
+        </mediawiki>"""
+    )
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            cli_main, ["extractr", "get-photos-from-wikitext", str(dump_path)]
+        )
+
+        assert result.exit_code == 0, result.output
+        assert result.stdout.strip().endswith("flickr_ids_from_wikitext.20231201.csv")
+
+        with open("flickr_ids_from_wikitext.20231201.csv") as in_file:
+            assert list(csv.DictReader(in_file)) == [
+                {
+                    "flickr_photo_id": "253009",
+                    "wikimedia_page_id": "M2",
+                    "wikimedia_page_title": "File:A cat.jpg",
+                }
+            ]
@@ -0,0 +1,43 @@
+import json
+
+from nitrate.types import validate_type
+
+from flickypedia.extractr.matcher import find_matched_photos_with_owners
+from flickypedia.structured_data import ExistingClaims
+from utils import create_snapshot_entry, get_existing_claims_fixture
+
+
+def test_find_matched_photos_with_owners() -> None:
+    with open("tests/fixtures/structured_data/existing/M34511_P170.json") as f:
+        creator_statement = json.load(f)
+
+    photo_id_claims = get_existing_claims_fixture("M138765382_P12120.json")
+
+    entries = [
+        # A photo with a Flickr user ID in the creator statement
+        create_snapshot_entry(
+            pageid=1,
+            statements=validate_type(
+                {**photo_id_claims, "P170": [creator_statement]}, model=ExistingClaims
+            ),
+        ),
+        # A photo without a creator statement
+        create_snapshot_entry(pageid=2, statements=photo_id_claims),
+        # A file which isn't from Flickr
+        create_snapshot_entry(pageid=3),
+    ]
+
+    assert list(find_matched_photos_with_owners(entries)) == [
+        {
+            "flickr_photo_id": "53253175319",
+            "wikimedia_page_id": "M1",
+            "wikimedia_page_title": "File:Example 1.jpg",
+            "flickr_user_id": "44124385307@N01",
+        },
+        {
+            "flickr_photo_id": "53253175319",
+            "wikimedia_page_id": "M2",
+            "wikimedia_page_title": "File:Example 2.jpg",
+            "flickr_user_id": None,
+        },
+    ]
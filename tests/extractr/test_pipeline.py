@@ -0,0 +1,127 @@
+from collections.abc import Iterator
+import concurrent.futures
+import itertools
+import json
+import typing
+
+from pydantic import ValidationError
+import pytest
+
+from flickypedia.apis.snapshots import SnapshotEntry
+from flickypedia.extractr.matcher import MatchedPhoto
+from flickypedia.extractr.pipeline import format_pipeline_stats, run_matching_pipeline
+from utils import create_snapshot_entry, get_existing_claims_fixture
+
+
+def create_lines(entries: list[SnapshotEntry]) -> list[bytes]:
+    """
+    Create the raw lines of a snapshot with these entries.
+    """
+    return (
+        [b"[\n"] + [json.dumps(e).encode("utf8") + b",\n" for e in entries] + [b"]\n"]
+    )
+
+
+def create_flickr_entries(count: int) -> list[SnapshotEntry]:
+    """
+    Create entries which all match the same Flickr photo.
+    """
+    statements = get_existing_claims_fixture("M138765382_P12120.json")
+
+    return [
+        create_snapshot_entry(pageid=i, statements=statements) for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("processes", [1, 3])
+def test_run_matching_pipeline(processes: int) -> None:
+    entries = create_flickr_entries(count=25)
+
+    written: list[MatchedPhoto] = []
+
+    stats = run_matching_pipeline(
+        create_lines(entries),
+        write=written.append,
+        processes=processes,
+        batch_size=2,
+    )
+
+    # The photos are written in the same order as the snapshot, even
+    # though the batches are matched in parallel.
+    assert [photo["wikimedia_page_id"] for photo in written] == [
+        e["id"] for e in entries
+    ]
+
+    assert stats["reader"]["items"] == 27
+    assert stats["matchers"]["items"] == 27
+    assert stats["writer"]["items"] == 25
+
+
+def test_error_in_matcher_is_raised() -> None:
+    lines = [b'{"data in": "the wrong format"}\n']
+
+    with pytest.raises(ValidationError):
+        run_matching_pipeline(lines, write=lambda photo: None, processes=2)
+
+
+def test_error_in_writer_is_raised() -> None:
+    def write(photo: MatchedPhoto) -> None:
+        raise OSError("Disk full")
+
+    lines = create_lines(create_flickr_entries(count=100))
+
+    with pytest.raises(OSError, match="Disk full"):
+        run_matching_pipeline(lines, write=write, processes=2, batch_size=1)
+
+
+def test_error_in_reader_is_raised() -> None:
+    def read_lines() -> Iterator[bytes]:
+        yield from create_lines(create_flickr_entries(count=5))
+        raise OSError("Unreadable snapshot")
+
+    with pytest.raises(OSError, match="Unreadable snapshot"):
+        run_matching_pipeline(read_lines(), write=lambda photo: None, processes=2)
+
+
+def test_interrupt_stops_every_stage(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    If the pipeline is interrupted, e.g. by Ctrl-C, it stops the reader
+    and writer and returns, even if the reader is waiting to hand over
+    another batch.
+    """
+
+    def submit(*args: typing.Any, **kwargs: typing.Any) -> None:
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(concurrent.futures.ProcessPoolExecutor, "submit", submit)
+
+    lines = itertools.repeat(b"{}\n")
+
+    with pytest.raises(KeyboardInterrupt):
+        run_matching_pipeline(lines, write=lambda photo: None, processes=1)
+
+
+def test_base_exception_in_writer_is_raised() -> None:
+    def write(photo: MatchedPhoto) -> None:
+        raise SystemExit("Shutting down")
+
+    lines = create_lines(create_flickr_entries(count=100))
+
+    with pytest.raises(SystemExit, match="Shutting down"):
+        run_matching_pipeline(lines, write=write, processes=2, batch_size=1)
+
+
+def test_format_pipeline_stats() -> None:
+    summary = format_pipeline_stats(
+        {
+            "reader": {"items": 1000, "busy_seconds": 2, "waiting_seconds": 8},
+            "matchers": {"items": 1000, "busy_seconds": 10, "waiting_seconds": 0},
+            "writer": {"items": 100, "busy_seconds": 0, "waiting_seconds": 10},
+        }
+    )
+
+    assert summary.splitlines() == [
+        "reader:       1000 lines in    2.0s busy,    8.0s waiting (500/sec)",
+        "matchers:     1000 lines in   10.0s busy,    0.0s waiting (100/sec)",
+        "writer:        100 rows  in    0.0s busy,   10.0s waiting (0/sec)",
+    ]
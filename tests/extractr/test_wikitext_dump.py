@@ -0,0 +1,82 @@
+import bz2
+import pathlib
+
+import pytest
+
+from flickypedia.extractr.wikitext_dump import (
+    find_matched_photos_in_wikitext,
+    parse_wikitext_dump,
+)
+
+
+DUMP = b"""<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="en">
+  <siteinfo>
+    <sitename>Wikimedia Commons</sitename>
+  </siteinfo>
+  <page>
+    <title>Commons:Welcome</title>
+    <ns>4</ns>
+    <id>1</id>
+    <revision>
+      <id>10</id>
+      <text bytes="40" xml:space="preserve">Source: https://www.flickr.com/photos/a/1/</text>
+    </revision>
+  </page>
+  <page>
+    <title>File:A cat.jpg</title>
+    <ns>6</ns>
+    <id>2</id>
+    <revision>
+      <id>20</id>
+      <text bytes="80" xml:space="preserve">{{Information
+|description=A cat
+|source=[https://www.flickr.com/photos/stewart/253009/ Flickr]
+}}</text>
+    </revision>
+  </page>
+  <page>
+    <title>File:A dog.jpg</title>
+    <ns>6</ns>
+    <id>3</id>
+    <revision>
+      <id>30</id>
+      <text bytes="0" xml:space="preserve" />
+    </revision>
+  </page>
+</mediawiki>
+"""
+
+
+@pytest.mark.parametrize("filename", ["dump.xml", "dump.xml.bz2"])
+def test_parse_wikitext_dump(tmp_path: pathlib.Path, filename: str) -> None:
+    dump_path = tmp_path / filename
+
+    if filename.endswith(".bz2"):
+        dump_path.write_bytes(bz2.compress(DUMP))
+    else:
+        dump_path.write_bytes(DUMP)
+
+    # We only get files, not pages in other namespaces
+    assert list(parse_wikitext_dump(dump_path)) == [
+        {
+            "id": 2,
+            "title": "File:A cat.jpg",
+            "wikitext": "{{Information\n|description=A cat\n|source=[https://www.flickr.com/photos/stewart/253009/ Flickr]\n}}",
+        },
+        {"id": 3, "title": "File:A dog.jpg", "wikitext": ""},
+    ]
+
+
+def test_find_matched_photos_in_wikitext(tmp_path: pathlib.Path) -> None:
+    dump_path = tmp_path / "dump.xml"
+    dump_path.write_bytes(DUMP)
+
+    matched_photos = find_matched_photos_in_wikitext(parse_wikitext_dump(dump_path))
+
+    assert list(matched_photos) == [
+        {
+            "flickr_photo_id": "253009",
+            "wikimedia_page_id": "M2",
+            "wikimedia_page_title": "File:A cat.jpg",
+        }
+    ]
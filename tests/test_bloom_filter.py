@@ -0,0 +1,114 @@
+import mmap
+import pathlib
+import struct
+import typing
+
+import pytest
+
+from flickypedia.bloom_filter import BloomFilter
+
+
+def test_contains_every_value_added() -> None:
+    bloom_filter = BloomFilter.for_capacity(1000)
+
+    for i in range(1000):
+        bloom_filter.add(str(i))
+
+    assert all(str(i) in bloom_filter for i in range(1000))
+
+
+def test_false_positive_rate_is_roughly_as_requested() -> None:
+    bloom_filter = BloomFilter.for_capacity(10_000, false_positive_rate=0.01)
+
+    for i in range(10_000):
+        bloom_filter.add(str(i))
+
+    false_positives = sum(str(i) in bloom_filter for i in range(1_000_000, 1_010_000))
+
+    assert false_positives < 200
+
+
+def test_empty_filter_contains_nothing() -> None:
+    bloom_filter = BloomFilter.for_capacity(0)
+
+    assert "1234" not in bloom_filter
+
+
+def test_can_write_and_read_filter(tmp_path: pathlib.Path) -> None:
+    bloom_filter = BloomFilter.for_capacity(100)
+
+    for i in range(100):
+        bloom_filter.add(str(i))
+
+    bloom_filter.write(tmp_path / "filter.bloom", fingerprint=b"abc123")
+
+    read_filter, fingerprint = BloomFilter.read(tmp_path / "filter.bloom")
+
+    assert fingerprint == b"abc123"
+    assert read_filter.bit_count == bloom_filter.bit_count
+    assert read_filter.hash_count == bloom_filter.hash_count
+    assert all(str(i) in read_filter for i in range(100))
+    assert [str(i) in read_filter for i in range(100, 1000)] == [
+        str(i) in bloom_filter for i in range(100, 1000)
+    ]
+
+    read_filter.close()
+
+
+def test_read_filter_is_read_only(tmp_path: pathlib.Path) -> None:
+    BloomFilter.for_capacity(100).write(tmp_path / "filter.bloom", fingerprint=b"")
+
+    read_filter, _ = BloomFilter.read(tmp_path / "filter.bloom")
+
+    with pytest.raises(TypeError):
+        read_filter.add("1234")
+
+    read_filter.close()
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        pytest.param(b"NOTBLOOM" + b"\x00" * 100, id="wrong_magic"),
+        pytest.param(
+            b"FLKBLOOM\x00\x00\x00\x00\xff\xff\xff\xff\x00\x00\x00\x00\x01\x00\x00\x00",
+            id="truncated",
+        ),
+    ],
+)
+def test_invalid_filter_is_error(tmp_path: pathlib.Path, contents: bytes) -> None:
+    (tmp_path / "filter.bloom").write_bytes(contents)
+
+    with pytest.raises(ValueError):
+        BloomFilter.read(tmp_path / "filter.bloom")
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        pytest.param(b"NOTBLOOM" + b"\x00" * 100, id="wrong_magic"),
+        pytest.param(b"FLKBLOOM\x00\x00", id="truncated_header"),
+        pytest.param(
+            b"FLKBLOOM\x00\x00\x00\x00\xff\xff\xff\xff\x00\x00\x00\x00\x01\x00\x00\x00",
+            id="truncated_bits",
+        ),
+    ],
+)
+def test_invalid_filter_is_closed(
+    tmp_path: pathlib.Path, contents: bytes, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "filter.bloom").write_bytes(contents)
+
+    mappings = []
+
+    class TrackingMmap(mmap.mmap):
+        def __init__(self, *args: typing.Any, **kwargs: typing.Any) -> None:
+            mappings.append(self)
+
+    monkeypatch.setattr(mmap, "mmap", TrackingMmap)
+
+    with pytest.raises((ValueError, struct.error)):
+        BloomFilter.read(tmp_path / "filter.bloom")
+
+    assert len(mappings) == 1
+    assert mappings[0].closed
@@ -0,0 +1,93 @@
+from collections.abc import Iterator
+import os
+import pathlib
+import threading
+import time
+
+import pytest
+
+from flickypedia.directory_watcher import DirectoryWatcher
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "polling"])
+def watcher(
+    request: pytest.FixtureRequest, tmp_path: pathlib.Path
+) -> Iterator[DirectoryWatcher]:
+    watcher = DirectoryWatcher(tmp_path, use_inotify=request.param)
+    yield watcher
+    watcher.close()
+
+
+def test_uses_inotify_on_linux(tmp_path: pathlib.Path) -> None:
+    watcher = DirectoryWatcher(tmp_path)
+
+    if os.uname().sysname == "Linux":
+        assert watcher.uses_inotify
+    else:  # pragma: no cover
+        assert not watcher.uses_inotify
+
+    watcher.close()
+
+
+def test_times_out_if_nothing_arrives(watcher: DirectoryWatcher) -> None:
+    start = time.monotonic()
+
+    assert not watcher.wait(timeout=0.2)
+
+    assert time.monotonic() - start >= 0.2
+
+
+def test_wakes_when_file_is_created(
+    watcher: DirectoryWatcher, tmp_path: pathlib.Path
+) -> None:
+    (tmp_path / "task.json").write_text("{}")
+
+    assert watcher.wait(timeout=5)
+
+
+def test_wakes_when_file_is_renamed_in(
+    watcher: DirectoryWatcher, tmp_path: pathlib.Path
+) -> None:
+    (tmp_path.parent / "task.json").write_text("{}")
+
+    def rename_file_in() -> None:
+        time.sleep(0.1)
+        os.rename(tmp_path.parent / "task.json", tmp_path / "task.json")
+
+    thread = threading.Thread(target=rename_file_in)
+    thread.start()
+
+    start = time.monotonic()
+    assert watcher.wait(timeout=5)
+    assert time.monotonic() - start < 1
+
+    thread.join()
+
+
+def test_only_wakes_once_per_change(
+    watcher: DirectoryWatcher, tmp_path: pathlib.Path
+) -> None:
+    (tmp_path / "task.json").write_text("{}")
+
+    assert watcher.wait(timeout=5)
+    assert not watcher.wait(timeout=0.2)
+
+
+def test_falls_back_to_polling_if_inotify_fails(tmp_path: pathlib.Path) -> None:
+    watcher = DirectoryWatcher(tmp_path / "doesnotexist")
+
+    assert not watcher.uses_inotify
+    assert not watcher.wait(timeout=0.1)
+
+    watcher.close()
+
+
+def test_can_wake_a_waiting_watcher(watcher: DirectoryWatcher) -> None:
+    watcher.wake()
+
+    start = time.monotonic()
+    assert watcher.wait(timeout=5)
+    assert time.monotonic() - start < 1
+
+    # The wakeup is only delivered once.
+    assert not watcher.wait(timeout=0.2)
@@ -15,13 +15,41 @@ file we can add to the Git repo for testing.
 
 """
 
+import contextlib
+import os
+import pathlib
+import shutil
+import sqlite3
+
+from flask import current_app
 from flask.testing import FlaskClient
+from pydantic import ValidationError
+import pytest
 
+from flickypedia import duplicates
+from flickypedia.bloom_filter import BloomFilter
 from flickypedia.duplicates import (
+    DuplicateDatabase,
+    GENERATION_MANIFEST,
+    UPLOADS_DATABASE,
+    batch_uploads_ledger_writes,
+    close_pooled_databases,
+    create_bloom_filter,
     create_link_to_commons,
+    create_sorted_id_index,
+    find_all_duplicates,
     find_duplicates,
+    find_duplicates_for_user,
+    get_bloom_filter_path,
+    get_database_fingerprint,
+    get_pooled_database,
+    get_pooled_databases,
+    publish_duplicate_databases,
+    read_generation_manifest,
     record_file_created_by_flickypedia,
 )
+from flickypedia.extractr.duplicates_database import create_duplicates_database
+from flickypedia.sorted_id_index import SortedIdIndex
 
 
 def test_no_flickr_photo_ids_is_no_duplicates(client: FlaskClient) -> None:
@@ -106,3 +134,589 @@ def test_records_files_uploaded_by_flickypedia(client: FlaskClient) -> None:
     assert find_duplicates(flickr_photo_ids=["123"]) == {
         "123": {"id": "M123", "title": "File:Example.jpg"}
     }
+
+
+def test_find_all_duplicates_in_original_layout(client: FlaskClient) -> None:
+    assert find_all_duplicates(flickr_photo_ids=["9999819294"]) == {
+        "9999819294": [
+            {
+                "id": "M29907038",
+                "title": "File:Museu da Ciência (9999819294).jpg",
+            }
+        ]
+    }
+
+
+def test_no_flickr_photo_ids_is_no_duplicates_for_all_duplicates(
+    client: FlaskClient,
+) -> None:
+    assert find_all_duplicates(flickr_photo_ids=[]) == {}
+
+
+def test_find_duplicates_for_user_skips_databases_without_user_ids(
+    client: FlaskClient,
+) -> None:
+    # The test database uses the original layout, which doesn't record
+    # the Flickr user, so we don't find anything -- but we don't throw
+    # an error either.
+    assert find_duplicates_for_user(flickr_user_id="44124385307@N01") == {}
+
+
+def get_sqlite_database(db_path: str) -> DuplicateDatabase:
+    database = get_pooled_database(db_path)
+    assert isinstance(database, DuplicateDatabase)
+    return database
+
+
+class TestPooledDatabases:
+    @pytest.fixture
+    def db_path(self, client: FlaskClient) -> str:
+        return os.path.join(
+            current_app.config["DUPLICATE_DATABASE_DIRECTORY"],
+            "flickr_ids_from_sdc_for_testing.sqlite",
+        )
+
+    def test_reuses_connection(self, db_path: str) -> None:
+        con1 = get_sqlite_database(db_path).con
+        con2 = get_sqlite_database(db_path).con
+
+        assert con1 is con2
+
+    def test_connection_is_read_only(self, db_path: str) -> None:
+        con = get_sqlite_database(db_path).con
+
+        with pytest.raises(sqlite3.OperationalError):
+            con.execute("DELETE FROM flickr_photos_on_wikimedia")
+
+        assert con.execute("PRAGMA query_only").fetchone() == (1,)
+
+    def test_reopens_connection_if_file_is_replaced(self, db_path: str) -> None:
+        con1 = get_sqlite_database(db_path).con
+
+        # Replace the database with a copy which has no photos, the
+        # same way a new snapshot would be deployed.
+        tmp_path = db_path + ".tmp"
+        shutil.copyfile(db_path, tmp_path)
+        with sqlite3.connect(tmp_path) as con:
+            con.execute("DELETE FROM flickr_photos_on_wikimedia")
+        os.replace(tmp_path, db_path)
+
+        con2 = get_sqlite_database(db_path).con
+        assert con1 is not con2
+
+        # The old connection was closed
+        with pytest.raises(sqlite3.ProgrammingError):
+            con1.execute("SELECT 1")
+
+        assert find_duplicates(flickr_photo_ids=["9999819294"]) == {}
+
+    def test_closes_connections_to_removed_databases(self, db_path: str) -> None:
+        (database,) = get_pooled_databases()
+        assert isinstance(database, DuplicateDatabase)
+
+        os.remove(db_path)
+        assert list(get_pooled_databases()) == []
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            database.con.execute("SELECT 1")
+
+    def test_closes_connections_to_removed_databases_in_path_directory(
+        self, db_path: str
+    ) -> None:
+        """
+        In the real app, the directory is a ``pathlib.Path`` rather than
+        a string -- we still close connections to removed databases.
+        """
+        current_app.config["DUPLICATE_DATABASE_DIRECTORY"] = pathlib.Path(
+            current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
+        )
+
+        (database,) = get_pooled_databases()
+        assert isinstance(database, DuplicateDatabase)
+
+        os.remove(db_path)
+        assert list(get_pooled_databases()) == []
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            database.con.execute("SELECT 1")
+
+    def test_missing_database_is_error(self, db_path: str) -> None:
+        with pytest.raises(FileNotFoundError):
+            get_pooled_database(db_path + ".missing")
+
+    def test_close_pooled_databases(self, db_path: str) -> None:
+        create_bloom_filter(db_path)
+
+        database = get_sqlite_database(db_path)
+        close_pooled_databases()
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            database.con.execute("SELECT 1")
+
+        assert get_sqlite_database(db_path).con is not database.con
+
+
+class TestBloomFilter:
+    @pytest.fixture
+    def db_path(self, client: FlaskClient) -> str:
+        return os.path.join(
+            current_app.config["DUPLICATE_DATABASE_DIRECTORY"],
+            "flickr_ids_from_sdc_for_testing.sqlite",
+        )
+
+    def test_no_filter_by_default(self, db_path: str) -> None:
+        assert get_sqlite_database(db_path).bloom_filter is None
+
+    def test_loads_filter_once_created(self, db_path: str) -> None:
+        assert get_sqlite_database(db_path).bloom_filter is None
+
+        assert create_bloom_filter(db_path) == 200
+
+        bloom_filter = get_sqlite_database(db_path).bloom_filter
+        assert bloom_filter is not None
+        assert "9999819294" in bloom_filter
+
+    def test_skips_database_for_photos_not_in_filter(self, db_path: str) -> None:
+        create_bloom_filter(db_path)
+
+        # Remove a photo from the database, but not from the filter --
+        # then break the database, so we can tell if we query it.
+        #
+        # We have to preserve the fingerprint, or the filter is ignored.
+        fingerprint = get_database_fingerprint(db_path)
+
+        with open(db_path, "r+b") as db_file:
+            db_file.seek(100)
+            db_file.write(b"\x00" * 1000)
+
+        assert get_database_fingerprint(db_path) == fingerprint
+
+        # This photo definitely isn't in the filter, so we don't look
+        # at the (now broken) database.
+        assert find_duplicates(flickr_photo_ids=["1234"]) == {}
+
+        # This photo is in the filter, so we do.
+        with pytest.raises(sqlite3.DatabaseError):
+            find_duplicates(flickr_photo_ids=["9999819294"])
+
+    def test_ignores_out_of_date_filter(self, db_path: str) -> None:
+        create_bloom_filter(db_path)
+
+        with sqlite3.connect(db_path) as con:
+            con.execute(
+                "INSERT INTO flickr_photos_on_wikimedia VALUES('1234', 'File:Example.jpg', 'M1234')"
+            )
+
+        assert get_sqlite_database(db_path).bloom_filter is None
+
+        assert find_duplicates(flickr_photo_ids=["1234"]) == {
+            "1234": {"id": "M1234", "title": "File:Example.jpg"}
+        }
+
+    @pytest.mark.parametrize("contents", [b"", b"NOTBLOOM"])
+    def test_ignores_invalid_filter(self, db_path: str, contents: bytes) -> None:
+        with open(get_bloom_filter_path(db_path), "wb") as out_file:
+            out_file.write(contents)
+
+        assert get_sqlite_database(db_path).bloom_filter is None
+
+        assert find_duplicates(flickr_photo_ids=["9999819294"]) != {}
+
+    def test_filter_for_multi_valued_database(self, tmp_path: pathlib.Path) -> None:
+        db_path = str(tmp_path / "duplicates.sqlite")
+
+        create_duplicates_database(
+            db_path,
+            matched_photos=[
+                {
+                    "flickr_photo_id": "53253175319",
+                    "wikimedia_page_id": "M138765382",
+                    "wikimedia_page_title": "File:Example.jpg",
+                    "flickr_user_id": None,
+                }
+            ],
+        )
+
+        assert create_bloom_filter(db_path) == 1
+
+        bloom_filter, _ = BloomFilter.read(get_bloom_filter_path(db_path))
+        assert "53253175319" in bloom_filter
+        bloom_filter.close()
+
+
+class TestSortedIdIndex:
+    @pytest.fixture
+    def db_path(self, client: FlaskClient) -> str:
+        return os.path.join(
+            current_app.config["DUPLICATE_DATABASE_DIRECTORY"],
+            "flickr_ids_from_sdc_for_testing.sqlite",
+        )
+
+    def test_finds_duplicates_in_index(self, db_path: str) -> None:
+        ids = ["9999819294", "9999868886", "9999416633", "9999408183", "1234"]
+        expected = find_duplicates(flickr_photo_ids=ids)
+
+        # Replace the SQLite database with a sorted ID index
+        index_path, count = create_sorted_id_index(db_path)
+        os.remove(db_path)
+
+        assert index_path.endswith("/flickr_ids_from_sdc_for_testing.ids")
+        assert count == 200
+
+        assert isinstance(get_pooled_database(index_path), SortedIdIndex)
+        assert find_duplicates(flickr_photo_ids=ids) == expected
+
+    def test_ignores_ids_which_arent_numbers(self, db_path: str) -> None:
+        create_sorted_id_index(db_path)
+        os.remove(db_path)
+
+        assert find_duplicates(flickr_photo_ids=["abc"]) == {}
+
+    def test_index_from_multi_valued_database(self, tmp_path: pathlib.Path) -> None:
+        db_path = str(tmp_path / "duplicates.sqlite")
+
+        create_duplicates_database(
+            db_path,
+            matched_photos=[
+                {
+                    "flickr_photo_id": "53253175319",
+                    "wikimedia_page_id": f"M{page_id}",
+                    "wikimedia_page_title": f"File:Example{page_id}.jpg",
+                    "flickr_user_id": "12345678@N01",
+                }
+                for page_id in (2, 1)
+            ],
+        )
+
+        index_path, count = create_sorted_id_index(db_path)
+        assert count == 2
+
+        index = SortedIdIndex(index_path)
+        assert list(index.find([53253175319])) == [
+            (53253175319, 1, "File:Example1.jpg"),
+            (53253175319, 2, "File:Example2.jpg"),
+        ]
+        index.close()
+
+    def test_find_duplicates_for_user_skips_index(
+        self, tmp_path: pathlib.Path, client: FlaskClient
+    ) -> None:
+        db_path = os.path.join(
+            current_app.config["DUPLICATE_DATABASE_DIRECTORY"], "duplicates.sqlite"
+        )
+
+        create_duplicates_database(
+            db_path,
+            matched_photos=[
+                {
+                    "flickr_photo_id": "53253175319",
+                    "wikimedia_page_id": "M1",
+                    "wikimedia_page_title": "File:Example.jpg",
+                    "flickr_user_id": "12345678@N01",
+                }
+            ],
+        )
+
+        assert find_duplicates_for_user(flickr_user_id="12345678@N01") != {}
+
+        create_sorted_id_index(db_path)
+        os.remove(db_path)
+
+        assert find_duplicates_for_user(flickr_user_id="12345678@N01") == {}
+        assert find_duplicates(flickr_photo_ids=["53253175319"]) == {
+            "53253175319": {"id": "M1", "title": "File:Example.jpg"}
+        }
+
+
+class TestGenerationManifest:
+    @pytest.fixture
+    def duplicate_dir(self, client: FlaskClient) -> str:
+        duplicate_dir: str = current_app.config["DUPLICATE_DATABASE_DIRECTORY"]
+        return duplicate_dir
+
+    @pytest.fixture
+    def empty_db_name(self, duplicate_dir: str) -> str:
+        """
+        Create a second database which has the same schema as the
+        test database, but no photos.
+        """
+        shutil.copyfile(
+            os.path.join(duplicate_dir, "flickr_ids_from_sdc_for_testing.sqlite"),
+            os.path.join(duplicate_dir, "empty.sqlite"),
+        )
+
+        with sqlite3.connect(os.path.join(duplicate_dir, "empty.sqlite")) as con:
+            con.execute("DELETE FROM flickr_photos_on_wikimedia")
+
+        return "empty.sqlite"
+
+    def test_no_manifest_by_default(self, duplicate_dir: str) -> None:
+        assert read_generation_manifest(duplicate_dir) is None
+
+    @pytest.mark.parametrize(
+        "contents",
+        [
+            pytest.param('{"generation": "1", "databases": []}', id="wrong_type"),
+            pytest.param('{"generation": 1}', id="missing_databases"),
+            pytest.param('["empty.sqlite"]', id="not_an_object"),
+        ],
+    )
+    def test_malformed_manifest_is_error(
+        self, duplicate_dir: str, contents: str
+    ) -> None:
+        with open(os.path.join(duplicate_dir, GENERATION_MANIFEST), "x") as out_file:
+            out_file.write(contents)
+
+        with pytest.raises(ValidationError):
+            read_generation_manifest(duplicate_dir)
+
+    def test_only_uses_databases_in_manifest(
+        self, duplicate_dir: str, empty_db_name: str
+    ) -> None:
+        assert find_duplicates(flickr_photo_ids=["9999819294"]) != {}
+
+        publish_duplicate_databases(duplicate_dir, names=[empty_db_name])
+
+        assert find_duplicates(flickr_photo_ids=["9999819294"]) == {}
+
+    def test_closes_connections_to_old_generation(
+        self, duplicate_dir: str, empty_db_name: str
+    ) -> None:
+        publish_duplicate_databases(
+            duplicate_dir, names=["flickr_ids_from_sdc_for_testing.sqlite"]
+        )
+        (old_database,) = get_pooled_databases()
+        assert isinstance(old_database, DuplicateDatabase)
+
+        publish_duplicate_databases(duplicate_dir, names=[empty_db_name])
+        (new_database,) = get_pooled_databases()
+        assert isinstance(new_database, DuplicateDatabase)
+
+        assert new_database.con is not old_database.con
+
+        with pytest.raises(sqlite3.ProgrammingError):
+            old_database.con.execute("SELECT 1")
+
+    def test_always_uses_uploads_database(
+        self, duplicate_dir: str, empty_db_name: str
+    ) -> None:
+        publish_duplicate_databases(duplicate_dir, names=[empty_db_name])
+
+        record_file_created_by_flickypedia(
+            flickr_photo_id="123",
+            wikimedia_page_title="File:Example.jpg",
+            wikimedia_page_id="M123",
+        )
+
+        assert find_duplicates(flickr_photo_ids=["123"]) == {
+            "123": {"id": "M123", "title": "File:Example.jpg"}
+        }
+
+    def test_increments_generation(
+        self, duplicate_dir: str, empty_db_name: str
+    ) -> None:
+        for expected_generation in (1, 2, 3):
+            manifest = publish_duplicate_databases(duplicate_dir, names=[empty_db_name])
+            assert manifest == {
+                "generation": expected_generation,
+                "databases": [empty_db_name],
+            }
+            assert read_generation_manifest(duplicate_dir) == manifest
+
+    @pytest.mark.parametrize("name", ["doesnotexist.sqlite", "../empty.sqlite"])
+    def test_cant_publish_missing_database(
+        self, duplicate_dir: str, empty_db_name: str, name: str
+    ) -> None:
+        with pytest.raises(ValueError, match="No database named"):
+            publish_duplicate_databases(duplicate_dir, names=[name])
+
+        assert read_generation_manifest(duplicate_dir) is None
+
+
+class TestUploadsLedger:
+    @pytest.fixture
+    def uploads_db_path(self, client: FlaskClient) -> str:
+        return os.path.join(
+            current_app.config["DUPLICATE_DATABASE_DIRECTORY"], UPLOADS_DATABASE
+        )
+
+    def test_uses_wal_mode(self, uploads_db_path: str) -> None:
+        record_file_created_by_flickypedia(
+            flickr_photo_id="123",
+            wikimedia_page_title="File:Example.jpg",
+            wikimedia_page_id="M123",
+        )
+
+        with contextlib.closing(sqlite3.connect(uploads_db_path)) as con:
+            assert con.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+    def test_uploading_a_photo_twice_keeps_the_newest_copy(
+        self, uploads_db_path: str
+    ) -> None:
+        for page_id in ("M123", "M456"):
+            record_file_created_by_flickypedia(
+                flickr_photo_id="123",
+                wikimedia_page_title=f"File:Example {page_id}.jpg",
+                wikimedia_page_id=page_id,
+            )
+
+        assert find_duplicates(flickr_photo_ids=["123"]) == {
+            "123": {"id": "M456", "title": "File:Example M456.jpg"}
+        }
+
+    def test_batches_writes_until_end_of_block(self, uploads_db_path: str) -> None:
+        with batch_uploads_ledger_writes():
+            for photo_id in ("123", "456"):
+                record_file_created_by_flickypedia(
+                    flickr_photo_id=photo_id,
+                    wikimedia_page_title=f"File:Example {photo_id}.jpg",
+                    wikimedia_page_id=f"M{photo_id}",
+                )
+
+                # Nested batches are part of the outer batch
+                with batch_uploads_ledger_writes():
+                    pass
+
+            assert not os.path.exists(uploads_db_path)
+
+        assert find_duplicates(flickr_photo_ids=["123", "456"]) == {
+            "123": {"id": "M123", "title": "File:Example 123.jpg"},
+            "456": {"id": "M456", "title": "File:Example 456.jpg"},
+        }
+
+    def test_writes_batch_once_it_has_max_rows(self, uploads_db_path: str) -> None:
+        with batch_uploads_ledger_writes(max_rows=2):
+            for photo_id in ("123", "456", "789"):
+                record_file_created_by_flickypedia(
+                    flickr_photo_id=photo_id,
+                    wikimedia_page_title=f"File:Example {photo_id}.jpg",
+                    wikimedia_page_id=f"M{photo_id}",
+                )
+
+            assert find_duplicates(flickr_photo_ids=["123", "456", "789"]) == {
+                "123": {"id": "M123", "title": "File:Example 123.jpg"},
+                "456": {"id": "M456", "title": "File:Example 456.jpg"},
+            }
+
+        assert find_duplicates(flickr_photo_ids=["789"]) == {
+            "789": {"id": "M789", "title": "File:Example 789.jpg"},
+        }
+
+    def test_writes_batch_if_there_is_an_exception(self, uploads_db_path: str) -> None:
+        with pytest.raises(ValueError):
+            with batch_uploads_ledger_writes():
+                record_file_created_by_flickypedia(
+                    flickr_photo_id="123",
+                    wikimedia_page_title="File:Example.jpg",
+                    wikimedia_page_id="M123",
+                )
+                raise ValueError("BOOM!")
+
+        assert find_duplicates(flickr_photo_ids=["123"]) == {
+            "123": {"id": "M123", "title": "File:Example.jpg"}
+        }
+
+    def test_empty_batch_doesnt_create_database(self, uploads_db_path: str) -> None:
+        with batch_uploads_ledger_writes():
+            pass
+
+        assert not os.path.exists(uploads_db_path)
+
+    def test_recreates_database_if_deleted(self, uploads_db_path: str) -> None:
+        record_file_created_by_flickypedia(
+            flickr_photo_id="123",
+            wikimedia_page_title="File:Example.jpg",
+            wikimedia_page_id="M123",
+        )
+
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(uploads_db_path + suffix):
+                os.remove(uploads_db_path + suffix)
+
+        record_file_created_by_flickypedia(
+            flickr_photo_id="456",
+            wikimedia_page_title="File:Example.jpg",
+            wikimedia_page_id="M456",
+        )
+
+        assert find_duplicates(flickr_photo_ids=["123", "456"]) == {
+            "456": {"id": "M456", "title": "File:Example.jpg"}
+        }
+
+
+class TestLookupOutsideFlask:
+    @pytest.fixture
+    def duplicate_dir(self, tmp_path: pathlib.Path) -> str:
+        duplicate_dir = tmp_path / "duplicates"
+        duplicate_dir.mkdir()
+
+        shutil.copyfile(
+            "tests/fixtures/duplicates/flickr_ids_from_sdc_for_testing.sqlite",
+            duplicate_dir / "flickr_ids_from_sdc_for_testing.sqlite",
+        )
+
+        return str(duplicate_dir)
+
+    def test_finds_duplicates_without_app_context(self, duplicate_dir: str) -> None:
+        assert find_duplicates(
+            flickr_photo_ids=["9999819294", "1234"], duplicate_dir=duplicate_dir
+        ) == {
+            "9999819294": {
+                "id": "M29907038",
+                "title": "File:Museu da Ciência (9999819294).jpg",
+            }
+        }
+
+        assert (
+            find_duplicates_for_user(
+                flickr_user_id="44124385307@N01", duplicate_dir=duplicate_dir
+            )
+            == {}
+        )
+
+    def test_splits_large_batches(
+        self, duplicate_dir: str, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        flickr_photo_ids = [
+            "9999819294",
+            "9999868886",
+            "9999416633",
+            "9999408183",
+            "1234",
+        ]
+
+        expected = find_duplicates(flickr_photo_ids, duplicate_dir=duplicate_dir)
+        assert len(expected) == 4
+
+        monkeypatch.setattr(duplicates, "IDS_PER_QUERY", 2)
+
+        actual = find_duplicates(flickr_photo_ids, duplicate_dir=duplicate_dir)
+        assert actual == expected
+
+    def test_ids_are_passed_as_parameters(self, duplicate_dir: str) -> None:
+        assert (
+            find_duplicates(
+                flickr_photo_ids=["1) OR (1=1", "'"], duplicate_dir=duplicate_dir
+            )
+            == {}
+        )
+
+    def test_million_id_batch(self, duplicate_dir: str) -> None:
+        flickr_photo_ids = [str(i) for i in range(1_000_000)] + ["9999819294"]
+
+        assert list(find_duplicates(flickr_photo_ids, duplicate_dir=duplicate_dir)) == [
+            "9999819294"
+        ]
+
+    def test_keeps_connections_to_other_directories(
+        self, duplicate_dir: str, tmp_path: pathlib.Path
+    ) -> None:
+        other_dir = tmp_path / "other"
+        other_dir.mkdir()
+
+        (database,) = get_pooled_databases(duplicate_dir)
+        assert isinstance(database, DuplicateDatabase)
+
+        assert list(get_pooled_databases(str(other_dir))) == []
+
+        database.con.execute("SELECT 1")
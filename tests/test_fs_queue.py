@@ -1,8 +1,14 @@
 import collections
 import concurrent.futures
+import datetime
+import json
+import os
 import pathlib
+import threading
+import time
 import traceback
 
+from nitrate.json import DatetimeEncoder
 import pytest
 
 from flickypedia.fs_queue import AbstractFilesystemTaskQueue, Task
@@ -64,6 +70,102 @@ def test_no_available_tasks_is_fine(queue: AddingQueue) -> None:
     queue.process_single_task()
 
 
+def test_tasks_are_processed_in_order(queue: AddingQueue) -> None:
+    task_ids = [
+        queue.start_task(task_input=[i], task_output=-1, task_id=task_id)
+        for i, task_id in enumerate(["c", "a", "d", "b"])
+    ]
+
+    assert [queue.process_single_task() for _ in task_ids] == task_ids
+
+
+def test_waiting_tasks_are_named_with_a_sequence_number(queue: AddingQueue) -> None:
+    queue.start_task(task_input=[1, 2, 3], task_output=-1, task_id="123")
+    queue.start_task(task_input=[4, 5, 6], task_output=-1, task_id="456")
+
+    filenames = sorted(os.listdir(queue.waiting_dir))
+
+    assert [f.split("-", 1)[1] for f in filenames] == ["123", "456"]
+    assert all(len(f.split("-", 1)[0]) == 20 for f in filenames)
+
+    assert queue.read_task("123")["state"] == "waiting"
+    assert queue.read_task("456")["task_input"] == [4, 5, 6]
+
+
+def test_can_process_task_without_sequence_number(queue: AddingQueue) -> None:
+    """
+    Tasks created by older versions of the queue are named with
+    just the task ID -- we can still read them, and process them
+    before any newer tasks.
+    """
+    queue.start_task(task_input=[1, 2, 3], task_output=-1, task_id="new")
+    queue.start_task(task_input=[4, 5, 6], task_output=-1, task_id="old")
+
+    (old_filename,) = [f for f in os.listdir(queue.waiting_dir) if f.endswith("old")]
+    os.rename(queue.waiting_dir / old_filename, queue.waiting_dir / "old")
+    os.unlink(queue.waiting_index_dir / "old")
+
+    assert queue.read_task("old")["state"] == "waiting"
+
+    assert queue.process_single_task() == "old"
+    assert queue.read_task("old")["task_output"] == 15
+
+    assert queue.process_single_task() == "new"
+
+
+def test_can_read_waiting_task_without_listing_folder(
+    queue: AddingQueue, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for i in range(10):
+        queue.start_task(task_input=[i], task_output=-1, task_id=str(i))
+
+    def listdir(path: str) -> None:  # pragma: no cover
+        raise AssertionError(f"Should not list {path}")
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "listdir", listdir)
+        task = queue.read_task("5")
+
+    assert task["state"] == "waiting"
+    assert task["task_input"] == [5]
+
+
+def test_task_is_removed_from_waiting_index_when_started(queue: AddingQueue) -> None:
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    assert os.listdir(queue.waiting_index_dir) == [task_id]
+
+    queue.process_single_task()
+
+    assert os.listdir(queue.waiting_index_dir) == []
+    assert queue.read_task(task_id)["state"] == "completed"
+
+
+def test_reading_missing_task_is_error(queue: AddingQueue) -> None:
+    with pytest.raises(ValueError, match="Could not find task"):
+        queue.read_task("doesnotexist")
+
+
+def test_worker_wakes_when_task_arrives(queue: AddingQueue) -> None:
+    """
+    If a worker is waiting on an empty queue, it picks up a new task
+    as soon as it arrives, rather than at the end of the timeout.
+    """
+
+    def start_task_after_delay() -> None:
+        time.sleep(0.1)
+        queue.start_task(task_input=[1, 2, 3], task_output=-1, task_id="123")
+
+    thread = threading.Thread(target=start_task_after_delay)
+    thread.start()
+
+    start = time.monotonic()
+    assert queue.process_single_task(timeout=10) == "123"
+    assert time.monotonic() - start < 1
+
+    thread.join()
+
+
 def test_multiple_workers_on_same_queue_is_fine(queue: AddingQueue) -> None:
     """
     If multiple workers are processing the same queue, and a message
@@ -124,3 +226,231 @@ def test_handles_failure_in_the_process_method(tmp_path: pathlib.Path) -> None:
         "Task started",
         "Task failed with an exception: BOOM!",
     ]
+
+
+def test_can_count_tasks(queue: AddingQueue) -> None:
+    for i in range(3):
+        queue.start_task(task_input=[i], task_output=-1)
+
+    queue.process_single_task()
+
+    assert queue.count_tasks("waiting") == 2
+    assert queue.count_tasks("completed") == 1
+    assert queue.count_tasks("failed") == 0
+
+
+def test_stop_interrupts_waiting_worker(queue: AddingQueue) -> None:
+    """
+    If a worker is waiting for a task and we ask it to stop, it stops
+    waiting immediately, and doesn't pick up any more tasks.
+    """
+    # Create the watcher, as if the worker was already waiting.
+    queue.process_single_task(timeout=0)
+
+    queue.request_stop()
+    queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    start = time.monotonic()
+    assert queue.process_single_task(timeout=10) is None
+    assert time.monotonic() - start < 1
+
+    assert queue.count_tasks("waiting") == 1
+
+
+def test_task_is_saved_as_input_state_and_event_log(queue: AddingQueue) -> None:
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    (waiting_dir,) = queue.waiting_dir.iterdir()
+    assert sorted(os.listdir(waiting_dir)) == [
+        "events.jsonl",
+        "input.json",
+        "state.json",
+    ]
+
+    input_stat = os.stat(waiting_dir / "input.json")
+
+    queue.process_single_task()
+
+    task_dir = queue.completed_dir / task_id
+
+    # The input is written once, and never rewritten
+    assert json.loads((task_dir / "input.json").read_text()) == [1, 2, 3]
+    assert os.stat(task_dir / "input.json").st_ino == input_stat.st_ino
+    assert os.stat(task_dir / "input.json").st_mtime_ns == input_stat.st_mtime_ns
+
+    # There's one line in the log for each event
+    assert len((task_dir / "events.jsonl").read_text().splitlines()) == 4
+
+    assert json.loads((task_dir / "state.json").read_text()) == {
+        "id": task_id,
+        "state": "completed",
+        "task_output": 6,
+        "event_count": 4,
+        "events_size": os.path.getsize(task_dir / "events.jsonl"),
+    }
+
+
+def test_ignores_events_from_unfinished_update(queue: AddingQueue) -> None:
+    """
+    If we crash after appending to the event log, but before we update
+    the state record, those events are ignored -- and overwritten by
+    the next update.
+    """
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    (task_dir,) = queue.waiting_dir.iterdir()
+
+    with open(task_dir / "events.jsonl", "a") as events_file:
+        events_file.write('{"time": "2001-01-01T01:01:01", "description": "Half-')
+
+    task = queue.read_task(task_id)
+    assert [ev["description"] for ev in task["events"]] == ["Task created"]
+
+    queue.record_task_event(task, event="Something happened")
+
+    task = queue.read_task(task_id)
+    assert [ev["description"] for ev in task["events"]] == [
+        "Task created",
+        "Something happened",
+    ]
+
+    assert len((task_dir / "events.jsonl").read_text().splitlines()) == 2
+
+
+def test_can_process_task_saved_as_single_file(queue: AddingQueue) -> None:
+    """
+    Tasks created by older versions of the queue are saved as a single
+    JSON file -- we can still process them, and they stay in that format.
+    """
+    (queue.waiting_dir / "old").write_text(
+        json.dumps(
+            {
+                "id": "old",
+                "events": [
+                    {
+                        "time": datetime.datetime(2001, 1, 1, 1, 1, 1),
+                        "description": "Task created",
+                    }
+                ],
+                "state": "waiting",
+                "task_input": [1, 2, 3],
+                "task_output": -1,
+            },
+            cls=DatetimeEncoder,
+        )
+    )
+
+    task = queue.read_task("old")
+    assert task["state"] == "waiting"
+
+    queue.record_task_event(task, event="Something happened")
+    assert len(queue.read_task("old")["events"]) == 2
+
+    assert queue.process_single_task() == "old"
+
+    assert (queue.completed_dir / "old").is_file()
+
+    task = queue.read_task("old")
+    assert task["state"] == "completed"
+    assert task["task_output"] == 6
+    assert len(task["events"]) == 5
+
+    assert queue.read_task_state("old") == {"state": "completed", "task_output": 6}
+
+
+def test_worker_doesnt_read_task_before_each_write(
+    queue: AddingQueue, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Once a worker has claimed a task, it knows where the task is, so
+    it can write updates without looking for the task on disk.
+    """
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    def locate_task(task_id: str) -> None:  # pragma: no cover
+        raise AssertionError("Should not look for the task")
+
+    with monkeypatch.context() as m:
+        m.setattr(queue, "_find_task", locate_task)
+        m.setattr(queue, "_locate_task", locate_task)
+        assert queue.process_single_task() == task_id
+
+    task = queue.read_task(task_id)
+    assert task["state"] == "completed"
+    assert task["task_output"] == 6
+    assert len(task["events"]) == 4
+
+
+def test_can_read_task_without_validation(queue: AddingQueue) -> None:
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    assert queue.read_task(task_id, validate=False) == queue.read_task(task_id)
+
+
+def test_can_read_task_state(queue: AddingQueue) -> None:
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+    assert queue.read_task_state(task_id) == {"state": "waiting", "task_output": -1}
+
+    queue.process_single_task()
+    assert queue.read_task_state(task_id) == {"state": "completed", "task_output": 6}
+
+
+def test_reading_task_state_only_reads_state_record(queue: AddingQueue) -> None:
+    task_id = queue.start_task(task_input=[1, 2, 3], task_output=-1)
+
+    (task_dir,) = queue.waiting_dir.iterdir()
+    (task_dir / "input.json").unlink()
+    (task_dir / "events.jsonl").unlink()
+
+    assert queue.read_task_state(task_id) == {"state": "waiting", "task_output": -1}
+
+
+def test_reading_state_of_missing_task_is_error(queue: AddingQueue) -> None:
+    with pytest.raises(ValueError, match="Could not find task"):
+        queue.read_task_state("doesnotexist")
+
+
+class TimestampQueue(AbstractFilesystemTaskQueue[str, datetime.datetime]):
+    """
+    A queue that records when each task was processed.
+    """
+
+    def process_individual_task(self, task: Task[str, datetime.datetime]) -> None:
+        task["task_output"] = datetime.datetime(2001, 2, 3, 4, 5, 6)
+        task["state"] = "completed"
+
+        self.write_task(task)
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_task_output_can_contain_datetimes(
+    tmp_path: pathlib.Path, validate: bool
+) -> None:
+    timestamp_queue = TimestampQueue(base_dir=tmp_path)
+
+    task_id = timestamp_queue.start_task(
+        task_input="hello", task_output=datetime.datetime(2000, 1, 1)
+    )
+    assert timestamp_queue.read_task(task_id, validate=validate)[
+        "task_output"
+    ] == datetime.datetime(2000, 1, 1)
+
+    timestamp_queue.process_single_task()
+
+    task = timestamp_queue.read_task(task_id, validate=validate)
+    assert task["task_output"] == datetime.datetime(2001, 2, 3, 4, 5, 6)
+
+
+def test_writing_new_task_creates_it(queue: AddingQueue) -> None:
+    queue.write_task(
+        {
+            "id": "123",
+            "events": [],
+            "state": "completed",
+            "task_input": [1, 2, 3],
+            "task_output": 6,
+        }
+    )
+
+    assert (queue.completed_dir / "123").is_dir()
+    assert queue.read_task("123")["task_output"] == 6
@@ -0,0 +1,93 @@
+import pathlib
+
+import pytest
+
+from flickypedia.sorted_id_index import SortedIdIndex, write_sorted_id_index
+
+
+@pytest.fixture
+def index_path(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "photos.ids"
+
+    count = write_sorted_id_index(
+        path,
+        entries=[
+            (123, 1, "File:One.jpg"),
+            (456, 2, "File:Two.jpg"),
+            (456, 3, "File:Tŵo (again).jpg"),
+            (789, 4, "File:Three.jpg"),
+        ],
+    )
+    assert count == 4
+
+    return path
+
+
+def test_finds_ids(index_path: pathlib.Path) -> None:
+    index = SortedIdIndex(index_path)
+
+    assert list(index.find([789, 123, 999])) == [
+        (123, 1, "File:One.jpg"),
+        (789, 4, "File:Three.jpg"),
+    ]
+
+    index.close()
+
+
+def test_finds_every_copy_of_a_photo(index_path: pathlib.Path) -> None:
+    index = SortedIdIndex(index_path)
+
+    assert list(index.find([456])) == [
+        (456, 2, "File:Two.jpg"),
+        (456, 3, "File:Tŵo (again).jpg"),
+    ]
+
+    index.close()
+
+
+@pytest.mark.parametrize("photo_ids", [[], [1], [1000], [124, 455, 790]])
+def test_ids_which_arent_in_index(
+    index_path: pathlib.Path, photo_ids: list[int]
+) -> None:
+    index = SortedIdIndex(index_path)
+
+    assert list(index.find(photo_ids)) == []
+
+    index.close()
+
+
+def test_empty_index(tmp_path: pathlib.Path) -> None:
+    assert write_sorted_id_index(tmp_path / "empty.ids", entries=[]) == 0
+
+    index = SortedIdIndex(tmp_path / "empty.ids")
+
+    assert index.count == 0
+    assert list(index.find([123])) == []
+
+    index.close()
+
+
+def test_entries_must_be_sorted(tmp_path: pathlib.Path) -> None:
+    with pytest.raises(ValueError, match="not sorted"):
+        write_sorted_id_index(
+            tmp_path / "unsorted.ids",
+            entries=[(456, 1, "File:One.jpg"), (123, 2, "File:Two.jpg")],
+        )
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        pytest.param(b"FLK", id="too_short"),
+        pytest.param(b"NOTANIDX" + b"\x00" * 100, id="wrong_magic"),
+        pytest.param(b"FLKIDIDX" + b"\x10" + b"\x00" * 7, id="truncated_arrays"),
+        pytest.param(
+            b"FLKIDIDX" + b"\x00" * 8 + b"\x10" + b"\x00" * 7, id="truncated_titles"
+        ),
+    ],
+)
+def test_invalid_index_is_error(tmp_path: pathlib.Path, contents: bytes) -> None:
+    (tmp_path / "invalid.ids").write_bytes(contents)
+
+    with pytest.raises(ValueError):
+        SortedIdIndex(tmp_path / "invalid.ids")
@@ -0,0 +1,198 @@
+from collections.abc import Iterator
+import functools
+import logging
+import os
+import pathlib
+import signal
+import sys
+import time
+
+import pytest
+
+from flickypedia.worker_pool import WorkerPool
+
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def send_sigterm_after() -> Iterator[None]:
+    """
+    Send this process a SIGTERM after a short delay.
+
+    We use a timer signal rather than a thread, because forking
+    a process with multiple threads isn't safe.
+    """
+    previous_handler = signal.signal(
+        signal.SIGALRM, lambda signum, frame: os.kill(os.getpid(), signal.SIGTERM)
+    )
+    signal.setitimer(signal.ITIMER_REAL, 0.5)
+
+    yield
+
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, previous_handler)
+
+
+def record_start_and_wait(log_path: pathlib.Path) -> None:  # pragma: no cover
+    """
+    A worker which records that it started, then waits to be stopped.
+
+    Note: the worker functions run in forked processes, so they're
+    invisible to coverage.
+    """
+    with open(log_path, "a") as out_file:
+        out_file.write(f"{os.getpid()}\n")
+
+    time.sleep(10)
+
+
+def record_start_and_crash(log_path: pathlib.Path) -> None:  # pragma: no cover
+    """
+    A worker which records that it started, then exits immediately.
+    """
+    with open(log_path, "a") as out_file:
+        out_file.write(f"{os.getpid()}\n")
+
+    sys.exit(1)
+
+
+def finish_task_on_sigterm(log_path: pathlib.Path) -> None:  # pragma: no cover
+    """
+    A worker which keeps going for a bit after it's asked to stop.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: log_path.write_text("stopping"))
+
+    while not log_path.exists():
+        time.sleep(0.01)
+
+    time.sleep(0.2)
+    log_path.write_text("finished")
+
+
+def read_pids(log_path: pathlib.Path) -> list[str]:
+    return log_path.read_text().splitlines()
+
+
+@pytest.mark.usefixtures("send_sigterm_after")
+def test_starts_workers_and_stops_on_sigterm(tmp_path: pathlib.Path) -> None:
+    log_path = tmp_path / "workers.log"
+
+    pool = WorkerPool(
+        functools.partial(record_start_and_wait, log_path),
+        min_workers=3,
+        logger=logger,
+        check_interval=0.01,
+    )
+
+    start = time.monotonic()
+    pool.run()
+
+    # The workers are stopped long before they finish sleeping.
+    assert time.monotonic() - start < 5
+
+    pids = read_pids(log_path)
+    assert len(pids) == 3
+    assert len(set(pids)) == 3
+    assert str(os.getpid()) not in pids
+
+    assert pool.workers == {}
+
+
+@pytest.mark.usefixtures("send_sigterm_after")
+def test_restarts_crashed_workers(tmp_path: pathlib.Path) -> None:
+    log_path = tmp_path / "workers.log"
+
+    pool = WorkerPool(
+        functools.partial(record_start_and_crash, log_path),
+        min_workers=1,
+        logger=logger,
+        check_interval=0.01,
+        restart_delay=0.05,
+    )
+
+    pool.run()
+
+    # The worker should be started, crash, and be restarted every
+    # 0.05 seconds or so, for 0.5 seconds.
+    assert 3 <= len(read_pids(log_path)) <= 20
+
+
+@pytest.mark.usefixtures("send_sigterm_after")
+def test_waits_for_workers_to_finish(tmp_path: pathlib.Path) -> None:
+    log_path = tmp_path / "worker.log"
+
+    pool = WorkerPool(
+        functools.partial(finish_task_on_sigterm, log_path),
+        min_workers=1,
+        logger=logger,
+        check_interval=0.01,
+    )
+
+    pool.run()
+
+    assert log_path.read_text() == "finished"
+
+
+@pytest.mark.usefixtures("send_sigterm_after")
+def test_scales_with_the_queue(tmp_path: pathlib.Path) -> None:
+    log_path = tmp_path / "workers.log"
+
+    queue_depths = iter([5, 5, 5, 1])
+
+    pool = WorkerPool(
+        functools.partial(record_start_and_wait, log_path),
+        min_workers=1,
+        max_workers=3,
+        get_queue_depth=lambda: next(queue_depths, 1),
+        logger=logger,
+        check_interval=0.01,
+    )
+
+    pool.run()
+
+    # We start three workers for the deep queue, then retire two of
+    # them when the queue gets shorter.
+    assert len(read_pids(log_path)) == 3
+
+
+@pytest.mark.parametrize(
+    ["queue_depth", "expected"], [(0, 2), (2, 2), (3, 3), (5, 5), (100, 5)]
+)
+def test_desired_worker_count(queue_depth: int, expected: int) -> None:
+    pool = WorkerPool(
+        lambda: None,
+        min_workers=2,
+        max_workers=5,
+        get_queue_depth=lambda: queue_depth,
+        logger=logger,
+    )
+
+    assert pool.desired_worker_count() == expected
+
+
+def test_fixed_size_pool_doesnt_check_queue() -> None:
+    def get_queue_depth() -> int:  # pragma: no cover
+        raise AssertionError("should not be called")
+
+    pool = WorkerPool(
+        lambda: None, min_workers=2, get_queue_depth=get_queue_depth, logger=logger
+    )
+
+    assert pool.desired_worker_count() == 2
+
+
+@pytest.mark.parametrize(
+    ["min_workers", "max_workers"],
+    [(0, None), (-1, None), (3, 2)],
+)
+def test_invalid_worker_counts_are_error(
+    min_workers: int, max_workers: int | None
+) -> None:
+    with pytest.raises(ValueError):
+        WorkerPool(
+            lambda: None,
+            min_workers=min_workers,
+            max_workers=max_workers,
+            logger=logger,
+        )
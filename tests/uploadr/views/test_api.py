@@ -1,6 +1,10 @@
 import json
+import typing
 
 from flask.testing import FlaskClient
+import pytest
+
+from flickypedia.duplicates import record_file_created_by_flickypedia
 
 
 class TestValidateTitleApi:
@@ -152,3 +156,122 @@ class TestFindMatchingLanguagesApi:
                 "match_text": "german — palatine german",
             },
         ]
+
+
+class TestFindDuplicatesApi:
+    def test_finds_duplicates_with_get(self, client: FlaskClient) -> None:
+        resp = client.get("/api/find_duplicates?flickr_photo_ids=9999819294,1234")
+
+        assert resp.status_code == 200
+        assert resp.json == {
+            "duplicates": {
+                "9999819294": [
+                    {
+                        "id": "M29907038",
+                        "title": "File:Museu da Ciência (9999819294).jpg",
+                    }
+                ]
+            }
+        }
+
+    def test_finds_duplicates_with_post(self, client: FlaskClient) -> None:
+        resp = client.post(
+            "/api/find_duplicates",
+            json={"flickr_photo_ids": ["9999819294", "9999868886", "1234"]},
+        )
+
+        assert resp.status_code == 200
+        assert resp.json is not None
+        assert set(resp.json["duplicates"]) == {"9999819294", "9999868886"}
+
+    def test_looks_up_large_batches(self, client: FlaskClient) -> None:
+        flickr_photo_ids = [str(i) for i in range(1, 2000)] + ["9999819294"]
+
+        resp = client.post(
+            "/api/find_duplicates", json={"flickr_photo_ids": flickr_photo_ids}
+        )
+
+        assert resp.status_code == 200
+        assert resp.json is not None
+        assert list(resp.json["duplicates"]) == ["9999819294"]
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            None,
+            ["9999819294"],
+            {},
+            {"flickr_photo_ids": "9999819294"},
+            {"flickr_photo_ids": [9999819294]},
+            {"flickr_photo_ids": ["9999819294) OR (1=1"]},
+            {"flickr_photo_ids": ["09999819294"]},
+            {"flickr_photo_ids": ["0"]},
+            {"flickr_photo_ids": ["\u0661\u0662\u0663"]},
+            {"flickr_photo_ids": ["1"] * 10001},
+        ],
+    )
+    def test_invalid_post_is_error(self, client: FlaskClient, body: typing.Any) -> None:
+        resp = client.post("/api/find_duplicates", json=body)
+
+        assert resp.status_code == 400
+
+    @pytest.mark.parametrize(
+        "query_string",
+        [
+            "",
+            "?flickr_photo_ids=",
+            "?flickr_photo_ids=1,abc",
+            "?flickr_photo_ids=0123",
+            "?flickr_photo_ids=%D9%A1%D9%A2%D9%A3",
+        ],
+    )
+    def test_invalid_get_is_error(self, client: FlaskClient, query_string: str) -> None:
+        resp = client.get(f"/api/find_duplicates{query_string}")
+
+        assert resp.status_code == 400
+
+    def test_etag_is_independent_of_order(self, client: FlaskClient) -> None:
+        resp1 = client.get("/api/find_duplicates?flickr_photo_ids=9999819294,1234")
+        resp2 = client.get("/api/find_duplicates?flickr_photo_ids=1234,9999819294")
+        resp3 = client.post(
+            "/api/find_duplicates", json={"flickr_photo_ids": ["1234", "9999819294"]}
+        )
+
+        assert resp1.headers["ETag"] == resp2.headers["ETag"] == resp3.headers["ETag"]
+        assert resp1.headers["Cache-Control"] == "no-cache"
+
+    def test_not_modified_if_etag_matches(self, client: FlaskClient) -> None:
+        resp = client.get("/api/find_duplicates?flickr_photo_ids=9999819294")
+        etag = resp.headers["ETag"]
+
+        resp = client.get(
+            "/api/find_duplicates?flickr_photo_ids=9999819294",
+            headers={"If-None-Match": etag},
+        )
+
+        assert resp.status_code == 304
+        assert resp.data == b""
+        assert resp.headers["ETag"] == etag
+
+    def test_etag_changes_when_databases_change(self, client: FlaskClient) -> None:
+        resp = client.get("/api/find_duplicates?flickr_photo_ids=123")
+        etag = resp.headers["ETag"]
+        assert resp.json == {"duplicates": {}}
+
+        with client.application.app_context():
+            record_file_created_by_flickypedia(
+                flickr_photo_id="123",
+                wikimedia_page_title="File:Example.jpg",
+                wikimedia_page_id="M123",
+            )
+
+        resp = client.get(
+            "/api/find_duplicates?flickr_photo_ids=123",
+            headers={"If-None-Match": etag},
+        )
+
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != etag
+        assert resp.json == {
+            "duplicates": {"123": [{"id": "M123", "title": "File:Example.jpg"}]}
+        }
@@ -2,6 +2,8 @@ import json
 
 from flask.testing import FlaskClient
 
+from flickypedia.uploadr.uploads import uploads_queue
+
 
 def test_wait_for_upload_redirects_if_complete(
     logged_in_client: FlaskClient, queue_dir: None
@@ -33,3 +35,32 @@ def test_wait_for_upload_api(logged_in_client: FlaskClient, queue_dir: None) ->
         "state": "in_progress",
         "photos": [{"photo_id": "53340605524", "state": "in_progress"}],
     }
+
+
+def test_wait_for_upload_api_only_reads_task_state(
+    logged_in_client: FlaskClient,
+) -> None:
+    """
+    The status API is polled while the upload is running, so it should
+    only read the task's state, not its input or event log.
+    """
+    q = uploads_queue()
+
+    task_id = q.start_task(
+        task_input={
+            "keyring_id": {"service_name": "flickypedia", "username": "example"},
+            "requests": [],
+        },
+        task_output={"53340605524": {"state": "waiting"}},
+    )
+
+    task_dir = (q.waiting_index_dir / task_id).resolve()
+    (task_dir / "input.json").unlink()
+    (task_dir / "events.jsonl").unlink()
+
+    resp = logged_in_client.get(f"/wait_for_upload/{task_id}/status")
+
+    assert json.loads(resp.data) == {
+        "state": "waiting",
+        "photos": [{"photo_id": "53340605524", "state": "waiting"}],
+    }
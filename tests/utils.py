@@ -1,3 +1,4 @@
+import bz2
 import datetime
 import json
 import pathlib
@@ -11,6 +12,7 @@ from flask_login import login_user
 from nitrate.json import DatetimeDecoder
 from nitrate.types import read_typed_json
 
+from flickypedia.apis.snapshots import SnapshotEntry
 from flickypedia.structured_data import ExistingClaims, NewClaims, NewStatement
 from flickypedia.uploadr.auth import (
     user_db,
@@ -130,3 +132,43 @@ def get_statement_fixture(filename: str) -> NewStatement:
     return get_typed_fixture(
         path=pathlib.Path("structured_data") / filename, model=NewStatement
     )
+
+
+def create_snapshot_entry(
+    pageid: int, statements: ExistingClaims | None = None
+) -> SnapshotEntry:
+    """
+    Create an entry for a snapshot of SDC, with some made-up values.
+    """
+    return {
+        "type": "mediainfo",
+        "id": f"M{pageid}",
+        "pageid": pageid,
+        "ns": 6,
+        "title": f"File:Example {pageid}.jpg",
+        "lastrevid": pageid * 10,
+        "modified": "2023-12-07T00:00:00Z",
+        "statements": statements or {},
+        "labels": {},
+        "descriptions": {},
+    }
+
+
+def create_snapshot(
+    path: pathlib.Path, entries: list[SnapshotEntry], *, streams: int = 1
+) -> None:
+    """
+    Write a snapshot of SDC in the same format as Wikimedia Commons.
+
+    If ``streams`` is more than 1, the file is written as that many
+    concatenated bz2 streams.  The streams are split at arbitrary
+    points, so lines may span two streams.
+    """
+    lines = ",\n".join(json.dumps(e) for e in entries)
+    data = f"[\n{lines}\n]\n".encode("utf8")
+
+    size = -(-len(data) // streams)
+
+    with open(path, "xb") as out_file:
+        for i in range(streams):
+            out_file.write(bz2.compress(data[i * size : (i + 1) * size]))